@@ -0,0 +1,288 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# © 2015-2018, ETH Zurich, Institut für Theoretische Physik
+# Author: Dominik Gresch <greschd@gmx.ch>
+"""
+Benchmarks for the hot paths of the ``pytest-score`` plugin itself. The
+benchmarks run on synthetic score sheets, and the results are written as
+JSON such that regressions can be tracked across releases.
+"""
+
+import io
+import os
+import sys
+import json
+import random
+import tempfile
+import platform
+import argparse
+import subprocess
+from time import perf_counter
+
+import py
+import _pytest.config
+
+import pytest_score
+from pytest_score._score import ScoreSheet, ScoreResult, Evaluator
+from pytest_score._compact import CompactScoreSheet
+from pytest_score._formats import FORMATS, loads_score_sheet
+from pytest_score._report import ScoreReport
+from pytest_score._plugin import HTMLScoreReporter, TerminalScoreReporter
+
+
+def make_score_sheet(num_entries, history_length, tags_per_test=10):
+    """
+    Create a synthetic score sheet with the given number of test / tag
+    entries, each with a full history.
+    """
+    rand = random.Random(0)
+    evaluators = [
+        Evaluator(less_is_better=False),
+        Evaluator(less_is_better=True),
+        Evaluator(less_is_better=False, cutoff=0.)
+    ]
+    scores = {}
+    for idx in range(num_entries):
+        test_name = 'module_{}/test_{}'.format(
+            idx // (100 * tags_per_test), idx // tags_per_test
+        )
+        score_result = ScoreResult(
+            evaluator=evaluators[idx % len(evaluators)],
+            history_length=history_length
+        )
+        score_result._history.extend(  # pylint: disable=protected-access
+            rand.random() for _ in range(history_length)
+        )
+        score_result.best = score_result.evaluator.evaluate_best(
+            score_result._history  # pylint: disable=protected-access
+        )
+        score_result.current = rand.random()
+        tag = 'tag_{}'.format(idx % tags_per_test)
+        scores.setdefault(test_name, {})[tag] = score_result
+    return ScoreSheet(scores=scores, history_length=history_length)
+
+
+def time_function(func, *, setup=lambda: None, repeat=3):
+    """
+    Return the shortest time of ``repeat`` calls of ``func``, which is
+    called with the result of ``setup``.
+    """
+    timings = []
+    for _ in range(repeat):
+        arg = setup()
+        start = perf_counter()
+        func(arg)
+        timings.append(perf_counter() - start)
+    return min(timings)
+
+
+def _get_entries(score_sheet):
+    """
+    Get the test name, tag and evaluator of all entries in the score sheet.
+    """
+    return [
+        (test_name, tag, score_result.evaluator)
+        for test_name, tag_results in score_sheet.to_dict()['scores'].items()
+        for tag, score_result in tag_results.items()
+    ]
+
+
+def _get_config(rootdir):
+    """
+    Create a pytest configuration for the reporters.
+    """
+    return _pytest.config._prepareconfig(  # pylint: disable=protected-access
+        ['-p', 'no:cacheprovider', '--rootdir', rootdir, rootdir]
+    )
+
+
+def run_benchmarks(
+    num_entries, history_length, *, compact, repeat, file_format
+):
+    """
+    Run the benchmarks for a score sheet of the given size, and return the
+    timings in seconds.
+    """
+    score_sheet = make_score_sheet(num_entries, history_length)
+    if compact:
+        score_sheet = CompactScoreSheet.from_sheet(score_sheet)
+    serializer = FORMATS[file_format]
+    serialized = serializer.dumps(score_sheet)
+
+    def _load(_):
+        res = loads_score_sheet(serialized)
+        if compact:
+            res = CompactScoreSheet.from_sheet(res)
+        return res
+
+    timings = {}
+    timings['load'] = time_function(_load, repeat=repeat)
+    timings['rotate'] = time_function(
+        lambda sheet: sheet.rotate(), setup=lambda: _load(None), repeat=repeat
+    )
+    entries = _get_entries(score_sheet)
+
+    def _add_all_scores(sheet):
+        sheet.rotate()
+        for test_name, tag, evaluator in entries:
+            sheet.add_score(
+                0.5, test_name=test_name, tag=tag, evaluator=evaluator
+            )
+
+    timings['add_score'] = time_function(
+        _add_all_scores, setup=lambda: _load(None), repeat=repeat
+    )
+    batches = {}
+    for test_name, tag, evaluator in entries:
+        batches.setdefault((test_name, evaluator), []).append(tag)
+
+    def _add_all_batches(sheet):
+        sheet.rotate()
+        for (test_name, evaluator), tags in batches.items():
+            values = [0.5] * len(tags)
+            sheet.add_many(
+                values, test_name=test_name, tags=tags, evaluator=evaluator
+            )
+
+    timings['add_many'] = time_function(
+        _add_all_batches, setup=lambda: _load(None), repeat=repeat
+    )
+    timings['create_table'] = time_function(
+        lambda sheet: sheet.create_table(),
+        setup=lambda: _load(None),
+        repeat=repeat
+    )
+    timings['dump'] = time_function(
+        serializer.dumps, setup=lambda: score_sheet, repeat=repeat
+    )
+
+    with tempfile.TemporaryDirectory() as rootdir:
+        config = _get_config(rootdir)
+        html_reporter = HTMLScoreReporter(config)
+        terminal_reporter = TerminalScoreReporter(config, file=io.StringIO())
+        report = ScoreReport.from_score_sheet(score_sheet)
+
+        def _html_setup():
+            # remove the digests, such that all pages are re-written
+            digests = py.path.local(rootdir).join('htmlscore', 'digests.json')
+            if digests.check():
+                digests.remove()
+            return report
+
+        timings['html_report'] = time_function(
+            html_reporter._save_html,  # pylint: disable=protected-access
+            setup=_html_setup,
+            repeat=repeat
+        )
+        timings['terminal_report'] = time_function(
+            terminal_reporter._write_report,  # pylint: disable=protected-access
+            setup=lambda: report,
+            repeat=repeat
+        )
+        config._ensure_unconfigure()  # pylint: disable=protected-access
+    return timings
+
+
+def time_import(repeat):
+    """
+    Return the shortest time needed to import the plugin in a new process.
+    """
+    command = [
+        sys.executable, '-c',
+        'import time; start = time.perf_counter(); import pytest_score; '
+        'print(time.perf_counter() - start)'
+    ]
+    timings = []
+    for _ in range(repeat):
+        result = subprocess.run(
+            command,
+            stdout=subprocess.PIPE,
+            universal_newlines=True,
+            check=True
+        )
+        timings.append(float(result.stdout))
+    return min(timings)
+
+
+def main():  # pylint: disable=missing-docstring
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '--entries',
+        type=int,
+        nargs='+',
+        default=[1000, 10000, 100000],
+        help='Numbers of test / tag entries in the score sheets.'
+    )
+    parser.add_argument(
+        '--history-lengths',
+        type=int,
+        nargs='+',
+        default=[5],
+        help='History lengths of the score sheets.'
+    )
+    parser.add_argument(
+        '--compact',
+        action='store_true',
+        help='Use the CompactScoreSheet instead of the ScoreSheet.'
+    )
+    parser.add_argument(
+        '--format',
+        choices=sorted(FORMATS),
+        default='columnar',
+        help='File format used for the load and dump benchmarks.'
+    )
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        default=3,
+        help='Number of repetitions, of which the fastest is reported.'
+    )
+    parser.add_argument(
+        '--output',
+        default=None,
+        help='File to which the results are written, instead of stdout.'
+    )
+    args = parser.parse_args()
+
+    results = []
+    for num_entries in args.entries:
+        for history_length in args.history_lengths:
+            timings = run_benchmarks(
+                num_entries,
+                history_length,
+                compact=args.compact,
+                repeat=args.repeat,
+                file_format=args.format
+            )
+            for name, seconds in timings.items():
+                results.append({
+                    'benchmark': name,
+                    'entries': num_entries,
+                    'history_length': history_length,
+                    'seconds': seconds
+                })
+    results.append({
+        'benchmark': 'import',
+        'seconds': time_import(args.repeat)
+    })
+
+    output = {
+        'version': pytest_score.__version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'compact': args.compact,
+        'format': args.format,
+        'repeat': args.repeat,
+        'results': results
+    }
+    if args.output is None:
+        json.dump(output, sys.stdout, indent=2)
+        sys.stdout.write(os.linesep)
+    else:
+        with open(args.output, 'w') as out_file:
+            json.dump(output, out_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
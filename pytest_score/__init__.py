@@ -9,4 +9,7 @@ Defines a pytest plugin for tests which have a 'score' in addition to a binary p
 __version__ = '0.0.0a1'
 
 from ._fixtures import *
+from ._scorer import *
 from ._plugin import *
+from ._report import *
+from ._mmap import *
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+
+# © 2015-2018, ETH Zurich, Institut für Theoretische Physik
+# Author: Dominik Gresch <greschd@gmx.ch>
+"""
+Defines functions which evaluate the best values and states of many scores
+at once, using NumPy arrays where missing values are represented by NaN.
+"""
+
+import numbers
+
+import numpy as np
+
+from ._score import ScoreStates
+from ._stats import normal_quantile
+
+_STATES = np.array(list(ScoreStates), dtype=object)
+_CODES = {state: code for code, state in enumerate(_STATES)}
+
+# minimum number of history values from which the noise is estimated
+MIN_HISTORY = 3
+# scales the median absolute deviation to the standard deviation of a normal
+# distribution
+_MAD_SCALE = 1.4826
+
+
+def to_float_array(values):
+    """
+    Convert a sequence of score values to a float array. Values which are
+    not real numbers are converted to NaN.
+    """
+    floats = [
+        val if isinstance(val, (numbers.Real, np.bool_)) else np.nan
+        for val in values
+    ]
+    return np.array(floats, dtype=float)
+
+
+def from_float_array(values):
+    """
+    Convert a float array to a list of score values, using None for NaN.
+    """
+    return [None if val != val else val for val in values.tolist()]  # pylint: disable=comparison-with-itself
+
+
+def evaluate_best(values, less_is_better):
+    """
+    Evaluate the best value of each row of a 2D array, ignoring NaN values.
+    The result is NaN for rows which contain only NaN values.
+    """
+    values = np.asarray(values, dtype=float)
+    less_is_better = np.asarray(less_is_better, dtype=bool)
+    res = np.full(len(values), np.nan)
+    if values.shape[1] > 0:
+        res[less_is_better] = np.fmin.reduce(values[less_is_better], axis=1)
+        res[~less_is_better] = np.fmax.reduce(values[~less_is_better], axis=1)
+    return res
+
+
+def find_insufficient(
+    values, *, less_is_better, cutoff=None, relative_cutoffs=None
+):
+    """
+    Get the indices of the values which do not meet the absolute ``cutoff``
+    or their relative cutoff, where the stricter of the two is used. Missing
+    relative cutoffs are None or NaN. Values which are not real numbers do
+    not meet any cutoff.
+    """
+    values = to_float_array(values)
+    cutoffs = np.full(len(values), np.nan if cutoff is None else cutoff)
+    if relative_cutoffs is not None:
+        stricter = np.fmin if less_is_better else np.fmax
+        cutoffs = stricter(cutoffs, to_float_array(relative_cutoffs))
+    if less_is_better:
+        sufficient = values <= cutoffs
+    else:
+        sufficient = values >= cutoffs
+    return np.flatnonzero(~np.isnan(cutoffs) & ~sufficient).tolist()
+
+
+def evaluate_states(
+    current,
+    best,
+    less_is_better,
+    *,
+    significance=None,
+    history=None,
+    sample_error=None
+):
+    """
+    Evaluate the states of the current versus the best values. Returns a
+    list of ScoreStates. For the rows with a ``significance`` which is not
+    NaN, the states are evaluated by ``evaluate_noise``, from the 2D
+    ``history`` array and the ``sample_error`` of the current values.
+    """
+    current = np.asarray(current, dtype=float)
+    best = np.asarray(best, dtype=float)
+    less_is_better = np.asarray(less_is_better, dtype=bool)
+    valid = ~(np.isnan(current) | np.isnan(best))
+    better = np.where(less_is_better, current < best, current > best)
+    worse = np.where(less_is_better, current > best, current < best)
+    codes = np.full(len(current), _CODES[ScoreStates.UNKNOWN])
+    codes[valid] = _CODES[ScoreStates.UNCHANGED]
+    codes[valid & better] = _CODES[ScoreStates.BETTER]
+    codes[valid & worse] = _CODES[ScoreStates.WORSE]
+    if significance is not None:
+        significance = np.asarray(significance, dtype=float)
+        noisy = valid & ~np.isnan(significance)
+        if np.any(noisy):
+            if sample_error is None:
+                sample_error = np.zeros(len(current))
+            if history is None:
+                history = np.empty((len(current), 0))
+            codes[noisy] = evaluate_noise(
+                current=current[noisy],
+                best=best[noisy],
+                less_is_better=less_is_better[noisy],
+                significance=significance[noisy],
+                history=np.asarray(history, dtype=float)[noisy],
+                sample_error=np.asarray(sample_error, dtype=float)[noisy],
+                codes=codes[noisy]
+            )
+    return list(_STATES[codes])
+
+
+def evaluate_noise(  # pylint: disable=too-many-arguments
+    current, best, less_is_better, significance, history, sample_error, codes
+):
+    """
+    Evaluate the state codes of the current values against the noise of the
+    history. The current value is compared to the median of the history,
+    and its deviation is tested against the median absolute deviation of
+    the history and the standard error of the current samples, at the given
+    two-sided significance level. Deviations which are not significant
+    result in the NOISE state. With less than ``MIN_HISTORY`` history values
+    the current value is compared to the best value, and without any noise
+    estimate the given ``codes`` of the raw comparison are kept.
+    """
+    num_history = np.sum(~np.isnan(history), axis=1)
+    enough = num_history >= MIN_HISTORY
+    reference = best.copy()
+    history_scale = np.zeros(len(current))
+    if np.any(enough):
+        median = np.nanmedian(history[enough], axis=1)
+        deviation = np.abs(history[enough] - median[:, np.newaxis])
+        reference[enough] = median
+        history_scale[enough] = _MAD_SCALE * np.nanmedian(deviation, axis=1)
+    scale = np.hypot(history_scale, np.nan_to_num(sample_error))
+
+    unique_significance, inverse = np.unique(significance, return_inverse=True)
+    critical_value = np.array([
+        normal_quantile(1 - val / 2) for val in unique_significance
+    ])[inverse.ravel()]
+    threshold = critical_value * scale
+    improvement = np.where(
+        less_is_better, reference - current, current - reference
+    )
+
+    res = np.full(len(current), _CODES[ScoreStates.NOISE])
+    res[improvement > threshold] = _CODES[ScoreStates.BETTER]
+    res[improvement < -threshold] = _CODES[ScoreStates.WORSE]
+    res[current == best] = _CODES[ScoreStates.UNCHANGED]
+    no_scale = ~(scale > 0)
+    res[no_scale] = codes[no_scale]
+    return res
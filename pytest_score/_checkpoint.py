@@ -0,0 +1,348 @@
+# -*- coding: utf-8 -*-
+
+# © 2015-2018, ETH Zurich, Institut für Theoretische Physik
+# Author: Dominik Gresch <greschd@gmx.ch>
+"""
+Defines the checkpoints, which keep the scores of a running session on disk
+such that they can be recovered if the session does not finish.
+"""
+
+import os
+import json
+import glob
+import queue
+import tempfile
+import warnings
+import threading
+from time import monotonic
+from contextlib import suppress
+
+from ._serialize import encode, decode
+from ._locking import file_lock, lock_file, unlock_file
+
+_STOP = object()
+
+
+class CheckpointWriter:
+    """
+    Appends the scores of the session to a checkpoint file in a background
+    thread. The pending scores are written when ``max_pending`` scores were
+    added, or ``interval`` seconds after the last write. The file is locked
+    while the writer runs, and is left on disk when the writer is closed. Its
+    path is set in ``path`` when it is created.
+    """
+
+    def __init__(self, prefix, *, interval=10., max_pending=100):
+        self.prefix = prefix
+        self.interval = interval
+        self.max_pending = max_pending
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(
+            target=self._run, name='pytest-score-checkpoint', daemon=True
+        )
+        self._handle = None
+        self._error = None
+        self.path = None
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add_score(self, value, *, test_name, tag, evaluator):
+        """
+        Add a score to the checkpoint, without waiting for it to be written.
+        """
+        self._queue.put({
+            'type': 'score',
+            'test_name': test_name,
+            'tag': tag,
+            'value': value,
+            'evaluator': evaluator
+        })
+
+    def close(self):
+        """
+        Write the pending scores, and stop the background thread.
+        """
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+        if self._handle is not None:
+            unlock_file(self._handle)
+            self._handle.close()
+            self._handle = None
+        if self._error is not None:
+            warnings.warn(
+                'Could not write the score checkpoint: {}'.format(self._error)
+            )
+
+    def _run(self):
+        """
+        Collect the scores from the queue, and write them in batches.
+        """
+        pending = []
+        deadline = monotonic() + self.interval
+        while True:
+            try:
+                record = self._queue.get(
+                    timeout=max(deadline - monotonic(), 0)
+                )
+            except queue.Empty:
+                record = None
+            if record is _STOP:
+                self._write(pending)
+                return
+            if record is not None:
+                pending.append(record)
+            if len(pending) >= self.max_pending or monotonic() >= deadline:
+                self._write(pending)
+                pending = []
+                deadline = monotonic() + self.interval
+
+    def _write(self, records):
+        """
+        Append the given records to the checkpoint file, creating it on the
+        first write.
+        """
+        if not records or self._error is not None:
+            return
+        try:
+            if self._handle is None:
+                self._handle, self.path = _create_locked_file(self.prefix)
+            data = ''.join(
+                json.dumps(record, default=encode) + '\n' for record in records
+            )
+            self._handle.write(data)
+            self._handle.flush()
+            os.fsync(self._handle.fileno())
+        except (OSError, TypeError, ValueError) as exc:
+            self._error = exc
+
+
+class CheckpointSession:
+    """
+    Holds the lock of a running session on the file ``<save_file>.session.<id>``.
+    The checkpoints written with the prefix of the session are not recovered
+    while it is locked, such that they are kept until the session has stored
+    their scores. The checkpoints which are added to the session are removed
+    by ``discard``.
+    """
+
+    def __init__(self, save_file):
+        prefix = get_session_prefix(save_file)
+        self._handle, self._path = _create_locked_file(prefix)
+        self.session_id = self._path[len(os.path.abspath(prefix)):]
+        self.checkpoint_prefix = get_checkpoint_prefix(
+            save_file, self.session_id
+        )
+        self._checkpoints = []
+
+    def add_checkpoint(self, checkpoint_file):
+        """
+        Add a checkpoint file whose scores are stored by the session.
+        """
+        if checkpoint_file is not None:
+            self._checkpoints.append(checkpoint_file)
+
+    def discard(self):
+        """
+        Remove the checkpoints which were added, once their scores are stored.
+        """
+        for checkpoint_file in self._checkpoints:
+            with suppress(OSError):
+                os.remove(checkpoint_file)
+        self._checkpoints = []
+
+    def close(self):
+        """
+        Remove the session file, and release its lock.
+        """
+        if self._handle is None:
+            return
+        with suppress(OSError):
+            os.remove(self._path)
+        unlock_file(self._handle)
+        self._handle.close()
+        self._handle = None
+
+
+def get_session_prefix(save_file):
+    """
+    Get the prefix of the session files for the given save file.
+    """
+    return save_file + '.session.'
+
+
+def get_checkpoint_prefix(save_file, session_id):
+    """
+    Get the prefix of the checkpoint files of the given session.
+    """
+    return save_file + '.checkpoint.' + session_id + '.'
+
+
+def recover_checkpoints(save_file, create_store):
+    """
+    Merge the scores of the checkpoints left by sessions which did not
+    finish into the store, as a new run. The store is only created if there
+    are scores to recover. If the scores cannot be stored, the checkpoints
+    are kept and a warning is shown, such that the session still runs. The
+    recovery lock is only taken if there are checkpoint or session files.
+    """
+    if not _has_checkpoint_files(save_file):
+        return
+    with file_lock(save_file + '.recovery'):
+        checkpoint_files = _get_unlocked_checkpoints(save_file)
+        records = []
+        for checkpoint_file in checkpoint_files:
+            records.extend(_read_records(checkpoint_file))
+        if records:
+            try:
+                _store_records(records, create_store)
+            except Exception as exc:  # pylint: disable=broad-except
+                warnings.warn(
+                    'Could not recover the scores from the checkpoint of an '
+                    'unfinished session: {!r}'.format(exc)
+                )
+                return
+            warnings.warn(
+                'Recovered {} scores from the checkpoint of an unfinished '
+                'session.'.format(len(records))
+            )
+        _remove_files(checkpoint_files)
+        _remove_stale_sessions(save_file)
+
+
+def _store_records(records, create_store):
+    """
+    Replay the given checkpoint records onto the stored score sheet as a new
+    run, and store it.
+    """
+    from ._store import replay_record
+    store = create_store()
+    score_sheet = store.load()
+    score_sheet.rotate()
+    for record in records:
+        replay_record(score_sheet, record)
+    store.save(score_sheet)
+
+
+def discard_checkpoints(save_file):
+    """
+    Remove the checkpoints of the sessions which did not finish, without
+    recovering them.
+    """
+    if not _has_checkpoint_files(save_file):
+        return
+    with file_lock(save_file + '.recovery'):
+        _remove_files(_get_unlocked_checkpoints(save_file))
+        _remove_stale_sessions(save_file)
+
+
+def _has_checkpoint_files(save_file):
+    """
+    Check if there are any checkpoint or session files for the save file.
+    """
+    prefixes = [save_file + '.checkpoint.', get_session_prefix(save_file)]
+    return any(glob.glob(glob.escape(prefix) + '*') for prefix in prefixes)
+
+
+def _remove_files(paths):
+    """
+    Remove the given files, ignoring files which do not exist anymore.
+    """
+    for path in paths:
+        with suppress(OSError):
+            os.remove(path)
+
+
+def _remove_stale_sessions(save_file):
+    """
+    Remove the files of the sessions which did not finish. A session file
+    is locked while it is removed, such that a session which is just being
+    created notices that its file was removed.
+    """
+    pattern = glob.escape(get_session_prefix(save_file)) + '*'
+    for session_file in glob.glob(pattern):
+        try:
+            with open(session_file, 'r') as handle:
+                if not lock_file(handle, blocking=False):
+                    continue
+                try:
+                    os.remove(session_file)
+                finally:
+                    unlock_file(handle)
+        except OSError:
+            continue
+
+
+def _create_locked_file(prefix):
+    """
+    Create a new file with a unique name starting with the given prefix, and
+    lock it. Returns the open file and its path. If the file was removed as
+    a stale file before it was locked, a new file is created.
+    """
+    dirname, basename = os.path.split(os.path.abspath(prefix))
+    while True:
+        handle, path = tempfile.mkstemp(dir=dirname, prefix=basename)
+        res = os.fdopen(handle, 'w')
+        lock_file(res)
+        with suppress(OSError):
+            if os.path.samestat(os.fstat(res.fileno()), os.stat(path)):
+                return res, path
+        unlock_file(res)
+        res.close()
+
+
+def _get_unlocked_checkpoints(save_file):
+    """
+    Get the checkpoint files which are neither locked by their writer, nor
+    belong to a running session.
+    """
+    res = []
+    pattern = glob.escape(save_file + '.checkpoint.') + '*'
+    for checkpoint_file in sorted(glob.glob(pattern)):
+        session_file = get_session_prefix(save_file) + _get_session_id(
+            save_file, checkpoint_file
+        )
+        if _is_locked(checkpoint_file) or _is_locked(session_file):
+            continue
+        res.append(checkpoint_file)
+    return res
+
+
+def _get_session_id(save_file, checkpoint_file):
+    """
+    Get the ID of the session which wrote the given checkpoint file.
+    """
+    return checkpoint_file[len(save_file + '.checkpoint.'):].split('.', 1)[0]
+
+
+def _is_locked(path):
+    """
+    Check if the given file exists and is locked by another process.
+    """
+    try:
+        with open(path, 'r') as handle:
+            if not lock_file(handle, blocking=False):
+                return True
+            unlock_file(handle)
+    except OSError:
+        pass
+    return False
+
+
+def _read_records(checkpoint_file):
+    """
+    Read the records of a checkpoint file, skipping a partially written
+    last record.
+    """
+    res = []
+    with suppress(OSError):
+        with open(checkpoint_file, 'r') as in_file:
+            for line in in_file:
+                with suppress(json.decoder.JSONDecodeError):
+                    res.append(json.loads(line, object_hook=decode))
+    return res
@@ -0,0 +1,473 @@
+# -*- coding: utf-8 -*-
+
+# © 2015-2018, ETH Zurich, Institut für Theoretische Physik
+# Author: Dominik Gresch <greschd@gmx.ch>
+"""
+Defines a compact score sheet, which stores the scores in preallocated NumPy
+arrays instead of one ScoreResult object per test and tag.
+"""
+
+import numbers
+
+import numpy as np
+
+from ._score import ScoreSheet, ScoreResult
+from ._batch import (
+    evaluate_best, evaluate_states, from_float_array, to_float_array
+)
+
+
+class CompactScoreSheet(ScoreSheet):
+    """
+    Score sheet which stores the current, best and history values of all
+    scores in NumPy arrays. The history of each score is kept in a ring
+    buffer, and the evaluators are stored in a de-duplicated table. Missing
+    values are stored as NaN, and numeric scores are converted to floats.
+    Scores which are not numbers are stored as NaN, and kept in a separate
+    dict. The samples of the current run are kept only for the scores which
+    have them.
+    """
+
+    def __init__(self, *, history_length=5, run=0, capacity=64):
+        super().__init__(history_length=history_length, run=run)
+        self._index = {}
+        self._keys = []
+        self._evaluators = []
+        self._evaluator_index = {}
+        self._current = np.full(capacity, np.nan)
+        self._best = np.full(capacity, np.nan)
+        self._history = np.full((capacity, history_length), np.nan)
+        self._head = np.zeros(capacity, dtype=np.int64)
+        self._runs = np.zeros(capacity, dtype=np.int64)
+        self._evaluator_ids = np.zeros(capacity, dtype=np.int64)
+        self._samples = {}
+        # values which are not numbers, by (row, field), where the field is
+        # 'current', 'best', or the column in the history array
+        self._objects = {}
+
+    @classmethod
+    def from_sheet(cls, score_sheet):
+        """
+        Create a compact score sheet with the same content as the given
+        score sheet.
+        """
+        scores = score_sheet._scores  # pylint: disable=protected-access
+        res = cls(
+            history_length=score_sheet._history_lenght,  # pylint: disable=protected-access
+            run=score_sheet._run,  # pylint: disable=protected-access
+            capacity=max(sum(len(val) for val in scores.values()), 1)
+        )
+        for test_name, test_name_result in scores.items():
+            for tag, tag_result in test_name_result.items():
+                row = res._add_row(test_name, tag, tag_result.evaluator)
+                res._set_values(
+                    row,
+                    current=tag_result.current,
+                    best=tag_result.best,
+                    run=tag_result.run,
+                    history=tag_result.to_dict()['history']
+                )
+                if tag_result.samples is not None:
+                    res._samples[row] = tag_result.samples
+        return res
+
+    @classmethod
+    def from_arrays(
+        cls,
+        *,
+        history_length,
+        run,
+        keys,
+        evaluators,
+        current,
+        best,
+        history,
+        runs,
+        evaluator_ids,
+        objects=()
+    ):
+        """
+        Create a compact score sheet which uses the given arrays without
+        copying them. The history of each score starts with the most recent
+        value. The ``objects`` are the values which are not numbers, as
+        ``(row, field, value)`` tuples.
+        """
+        res = cls(history_length=history_length, run=run, capacity=0)
+        res._keys = list(keys)
+        res._index = {key: row for row, key in enumerate(res._keys)}
+        res._evaluators = list(evaluators)
+        res._evaluator_index = {
+            evaluator: idx
+            for idx, evaluator in enumerate(res._evaluators)
+        }
+        res._current = current
+        res._best = best
+        res._history = history
+        res._head = np.zeros(len(res._keys), dtype=np.int64)
+        res._runs = runs
+        res._evaluator_ids = evaluator_ids
+        res._objects = {(row, field): value for row, field, value in objects}
+        return res
+
+    def to_arrays(self):
+        """
+        Get the keys, evaluators and arrays of the score sheet, in the form
+        accepted by ``from_arrays``.
+        """
+        size = len(self)
+        history_length = self._history.shape[1]
+        columns = (self._head[:size, np.newaxis] +
+                   np.arange(history_length)) % max(history_length, 1)
+        objects = []
+        for (row, field), value in self._objects.items():
+            if not isinstance(field, str):
+                field = int((field - self._head[row]) % history_length)
+            objects.append((row, field, value))
+        return dict(
+            history_length=self._history_lenght,
+            run=self._run,
+            keys=list(self._keys),
+            evaluators=list(self._evaluators),
+            current=self._current[:size],
+            best=self._best[:size],
+            history=np.take_along_axis(self._history[:size], columns, axis=1),
+            runs=self._runs[:size],
+            evaluator_ids=self._evaluator_ids[:size],
+            objects=objects
+        )
+
+    @classmethod
+    def from_dict(cls, input_dict):
+        return cls.from_sheet(ScoreSheet.from_dict(input_dict))
+
+    def to_dict(self):
+        scores = {}
+        for test_name, tag in self._keys:
+            scores.setdefault(test_name, {})[tag] = self._view(test_name, tag)
+        return {
+            'scores': scores,
+            'history_length': self._history_lenght,
+            'run': self._run
+        }
+
+    def __len__(self):
+        return len(self._keys)
+
+    def scores(self):
+        for row, (test_name, tag) in enumerate(self._keys):
+            yield test_name, tag, _CompactScoreResult(self, row)
+
+    def new_scores(self):
+        size = len(self)
+        has_current = ~np.isnan(self._current[:size])
+        has_current[self._get_object_rows('current')] = True
+        rows = np.flatnonzero((self._runs[:size] == self._run) & has_current)
+        for row in rows:
+            test_name, tag = self._keys[row]
+            yield test_name, tag, _CompactScoreResult(self, row)
+
+    def create_table(self):
+        size = len(self)
+        evaluator_ids = self._evaluator_ids[:size]
+        evaluator_less_is_better = np.fromiter(
+            (evaluator.less_is_better for evaluator in self._evaluators),
+            dtype=bool,
+            count=len(self._evaluators)
+        )
+        less_is_better = evaluator_less_is_better[evaluator_ids]
+        current = self._current[:size]
+        best = self._best[:size]
+        history = self._history[:size]
+        if history.shape[1] > 0:
+            last = history[np.arange(size), self._head[:size]]
+        else:
+            last = np.full(size, np.nan)
+
+        # the rows which were not scored in the current run are shown as if
+        # they were rotated
+        stale = self._runs[:size] != self._run
+        stale_with_current = stale & ~np.isnan(current)
+        best_view = best.copy()
+        best_view[stale_with_current] = evaluate_best(
+            np.column_stack([
+                current[stale_with_current], best[stale_with_current],
+                history[stale_with_current]
+            ]), less_is_better[stale_with_current]
+        )
+        last_view = np.where(stale_with_current, current, last)
+        current_view = np.where(stale, np.nan, current)
+
+        header = ('Test name', 'Current', 'Last', 'Best')
+        names = [test_name + ':' + tag for test_name, tag in self._keys]
+        res = list(
+            zip(
+                names, from_float_array(current_view),
+                from_float_array(last_view), from_float_array(best_view)
+            )
+        )
+        # the rows with values which are not numbers are evaluated by the
+        # score results, and have NaN values in the arrays for the states
+        for row in sorted(set(self._get_object_rows())):
+            res[row] = (
+                names[row],
+                *_CompactScoreResult(self, row).get_values(self._run)
+            )
+        states = evaluate_states(
+            current=current_view,
+            best=best_view,
+            less_is_better=less_is_better,
+            **self._get_noise_columns(evaluator_ids)
+        )
+        return header, res, states
+
+    def _get_noise_columns(self, evaluator_ids):
+        """
+        Get the arguments of ``evaluate_states`` which are needed to evaluate
+        the states of the noise-aware scores. The order of the history
+        values does not matter for the noise estimate.
+        """
+        evaluator_significance = to_float_array([
+            evaluator.significance for evaluator in self._evaluators
+        ])
+        if np.all(np.isnan(evaluator_significance)):
+            return {}
+        sample_error = np.zeros(len(evaluator_ids))
+        for row, samples in self._samples.items():
+            sample_error[row] = samples.std_error
+        return dict(
+            significance=evaluator_significance[evaluator_ids],
+            history=self._history[:len(evaluator_ids)],
+            sample_error=sample_error
+        )
+
+    def _get_object_rows(self, field=None):
+        """
+        Get the rows which have a value that is not a number, in the given
+        field or in any field.
+        """
+        return [
+            row for row, row_field in self._objects
+            if field is None or row_field == field
+        ]
+
+    def _to_stored(self, row, field, value):
+        """
+        Convert a score value to the float which is stored in the arrays. A
+        value which is not a number is kept in the dict of objects, and
+        stored as NaN.
+        """
+        if value is None or isinstance(value, numbers.Real):
+            self._objects.pop((row, field), None)
+            return _to_float(value)
+        self._objects[(row, field)] = value
+        return np.nan
+
+    def _from_stored(self, row, field, value):
+        """
+        Convert a float which is stored in the arrays to a score value.
+        """
+        if np.isnan(value):
+            return self._objects.get((row, field), None)
+        return float(value)
+
+    def _get_score_results(self, *, test_name, tags, evaluator):
+        return [
+            self._get_score_result(
+                test_name=test_name, tag=tag, evaluator=evaluator
+            ) for tag in tags
+        ]
+
+    def _setdefault_score_result(self, *, test_name, tag, evaluator):
+        row = self._index.get((test_name, tag), None)
+        if row is None:
+            row = self._add_row(test_name, tag, evaluator)
+        return _CompactScoreResult(self, row)
+
+    def _view(self, test_name, tag):
+        """
+        Get the score result view for an existing test and tag.
+        """
+        return _CompactScoreResult(self, self._index[(test_name, tag)])
+
+    def _add_row(self, test_name, tag, evaluator):
+        """
+        Add a new row for the given test and tag, and return its index.
+        """
+        row = len(self._keys)
+        if row == len(self._current):
+            self._grow()
+        self._index[(test_name, tag)] = row
+        self._keys.append((test_name, tag))
+        self._evaluator_ids[row] = self._get_evaluator_id(evaluator)
+        return row
+
+    def _set_values(self, row, *, current, best, run, history):
+        """
+        Set the values of a given row.
+        """
+        self._current[row] = self._to_stored(row, 'current', current)
+        self._best[row] = self._to_stored(row, 'best', best)
+        self._runs[row] = run
+        self._head[row] = 0
+        self._history[row] = np.nan
+        for col in range(self._history.shape[1]):
+            self._objects.pop((row, col), None)
+        history = history[:self._history_lenght]
+        self._history[row, :len(history)] = [
+            self._to_stored(row, col, val) for col, val in enumerate(history)
+        ]
+
+    def _grow(self):
+        """
+        Double the capacity of the arrays.
+        """
+        capacity = max(2 * len(self._current), 1)
+
+        def _resize(arr, fill_value):
+            res = np.full((capacity, ) + arr.shape[1:],
+                          fill_value,
+                          dtype=arr.dtype)
+            res[:len(arr)] = arr
+            return res
+
+        self._current = _resize(self._current, np.nan)
+        self._best = _resize(self._best, np.nan)
+        self._history = _resize(self._history, np.nan)
+        self._head = _resize(self._head, 0)
+        self._runs = _resize(self._runs, 0)
+        self._evaluator_ids = _resize(self._evaluator_ids, 0)
+
+    def _get_evaluator_id(self, evaluator):
+        """
+        Get the index of the given evaluator in the de-duplicated evaluator
+        table, adding it if needed.
+        """
+        try:
+            return self._evaluator_index[evaluator]
+        except KeyError:
+            idx = len(self._evaluators)
+            self._evaluators.append(evaluator)
+            self._evaluator_index[evaluator] = idx
+            return idx
+
+
+class _CompactScoreResult(ScoreResult):  # pylint: disable=protected-access
+    """
+    Light-weight view of a single row in a CompactScoreSheet, which has the
+    same interface as a ScoreResult.
+    """
+
+    def __init__(self, sheet, row):  # pylint: disable=super-init-not-called
+        self._sheet = sheet
+        self._row = row
+
+    @property
+    def current(self):
+        sheet = self._sheet
+        return sheet._from_stored(
+            self._row, 'current', sheet._current[self._row]
+        )
+
+    @current.setter
+    def current(self, value):
+        row = self._row
+        self._sheet._current[row] = self._sheet._to_stored(
+            row, 'current', value
+        )
+
+    @property
+    def best(self):
+        sheet = self._sheet
+        return sheet._from_stored(self._row, 'best', sheet._best[self._row])
+
+    @best.setter
+    def best(self, value):
+        sheet = self._sheet
+        sheet._best[self._row] = sheet._to_stored(self._row, 'best', value)
+
+    @property
+    def run(self):
+        return int(self._sheet._runs[self._row])
+
+    @run.setter
+    def run(self, value):
+        self._sheet._runs[self._row] = value
+
+    @property
+    def samples(self):
+        return self._sheet._samples.get(self._row, None)
+
+    @samples.setter
+    def samples(self, value):
+        if value is None:
+            self._sheet._samples.pop(self._row, None)
+        else:
+            self._sheet._samples[self._row] = value
+
+    @property
+    def evaluator(self):
+        sheet = self._sheet
+        return sheet._evaluators[sheet._evaluator_ids[self._row]]
+
+    @evaluator.setter
+    def evaluator(self, value):
+        sheet = self._sheet
+        sheet._evaluator_ids[self._row] = sheet._get_evaluator_id(value)
+
+    @property
+    def _history(self):
+        """
+        The history values, starting with the most recent one.
+        """
+        sheet = self._sheet
+        history_length = sheet._history.shape[1]
+        columns = (sheet._head[self._row] +
+                   np.arange(history_length)) % max(history_length, 1)
+        return [
+            sheet._from_stored(self._row, col, sheet._history[self._row, col])
+            for col in columns.tolist()
+        ]
+
+    @property
+    def last(self):
+        sheet = self._sheet
+        history_length = sheet._history.shape[1]
+        if history_length == 0:
+            return None
+        head = int(sheet._head[self._row])
+        return sheet._from_stored(
+            self._row, head, sheet._history[self._row, head]
+        )
+
+    def to_dict(self):
+        res = dict(
+            best=self.best,
+            current=self.current,
+            run=self.run,
+            history=self._history,
+            history_length=self._sheet._history.shape[1],
+            evaluator=self.evaluator
+        )
+        # a single sample is the current value itself
+        if self.samples is not None and self.samples.count > 1:
+            res['samples'] = self.samples
+        return res
+
+    def flush_current(self):
+        sheet = self._sheet
+        history_length = sheet._history.shape[1]
+        if history_length > 0:
+            head = int((sheet._head[self._row] - 1) % history_length)
+            sheet._head[self._row] = head
+            sheet._history[self._row, head] = sheet._to_stored(
+                self._row, head, self.current
+            )
+        self.current = None
+        self.samples = None
+
+
+def _to_float(value):
+    """
+    Convert a score value to a float, using NaN for missing values.
+    """
+    return np.nan if value is None else float(value)
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+# © 2015-2018, ETH Zurich, Institut für Theoretische Physik
+# Author: Dominik Gresch <greschd@gmx.ch>
+"""
+Defines the confirmation of regressions, which re-runs the tests whose scores
+became worse to check that the regression is not caused by noise.
+"""
+
+import numbers
+
+import pytest
+
+from ._score import ScoreStates
+
+
+class RegressionConfirmer:
+    """
+    Re-runs the call of a passing test ``reruns`` times if one of its scores
+    became worse. The scores of the re-runs are added as samples of the same
+    run, such that the state of the scores is evaluated from all samples.
+    Scores which are not real numbers cannot be sampled, and are replaced
+    by the value of the last re-run. If one of the re-runs fails, the test
+    fails with its exception.
+    """
+
+    def __init__(self, reruns):
+        self.reruns = reruns
+        self._results = {}
+        self._confirming = False
+
+    def add_result(self, item, tag, score_result):
+        """
+        Add a score result which was recorded by the given test item.
+        """
+        self._results.setdefault(item.nodeid, {})[tag] = score_result
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_call(self, item):
+        """
+        Re-runs the call of a test whose scores became worse.
+        """
+        outcome = yield
+        if self._confirming:
+            return
+        results = self._results.pop(item.nodeid, {})
+        if outcome.excinfo is not None or not any(
+            score_result.get_state() == ScoreStates.WORSE
+            for score_result in results.values()
+        ):
+            return
+        self._confirming = True
+        try:
+            for _ in range(self.reruns):
+                results.update(self._results.pop(item.nodeid, {}))
+                _reset_non_numeric(results)
+                item.ihook.pytest_runtest_call(item=item)
+        finally:
+            self._confirming = False
+            self._results.pop(item.nodeid, None)
+
+
+def _reset_non_numeric(results):
+    """
+    Reset the score results whose values are not real numbers, such that the
+    re-run of the test can record them again.
+    """
+    for score_result in results.values():
+        if not isinstance(score_result.current, numbers.Real):
+            score_result.current = None
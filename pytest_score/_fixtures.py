@@ -6,15 +6,21 @@
 Defines the fixtures for running a scored evaluation.
 """
 
-import os
-import json
-from contextlib import contextmanager, suppress
+from contextlib import contextmanager
 
 import pytest
 from fsc.export import export
 
-from ._score import ScoreSheet, Evaluator
-from ._serialize import encode, decode
+from ._score import ScoreSheet
+from ._scorer import Scorer
+from ._store import STORES, store_score
+from ._xdist import (
+    is_xdist_worker, send_worker_scores, send_worker_checkpoint,
+    get_worker_session_id
+)
+from ._checkpoint import (
+    CheckpointSession, CheckpointWriter, get_checkpoint_prefix
+)
 
 
 @export
@@ -23,64 +29,132 @@ def score_sheet(request):
     """
     Creates the score sheets and saves it after the test session.
     """
-    with _store_score(
-        save_file=_get_save_file(request),
-        wipe_scores=request.config.option.wipe_scores
+    if is_xdist_worker(request.config):
+        score_sheet_instance = _load_worker_score_sheet(request)
+        with _open_checkpoint(request):
+            yield score_sheet_instance
+        send_worker_scores(request.config, score_sheet_instance)
+        return
+    with _open_score_sheet(
+        request.config, module_names=_get_module_names(request.session.items)
     ) as score_sheet_instance:
-        request.session._score_sheet_instance = score_sheet_instance  # pylint: disable=protected-access
-        score_sheet_instance.rotate()
-        yield score_sheet_instance
+        with _open_checkpoint(request):
+            request.session._score_sheet_instance = score_sheet_instance  # pylint: disable=protected-access
+            score_sheet_instance.rotate()
+            yield score_sheet_instance
+
+
+def _load_worker_score_sheet(request):
+    """
+    Loads the stored score sheet on a pytest-xdist worker, such that the
+    scores are checked against the previous runs. The worker does not store
+    the score sheet, but sends its new scores to the controller.
+    """
+    config = request.config
+    if config.option.wipe_scores:
+        return ScoreSheet()
+    score_sheet_instance = _get_store(config).load(
+        module_names=_get_module_names(request.session.items)
+    )
+    score_sheet_instance.rotate()
+    return score_sheet_instance
 
 
 @contextmanager
-def _store_score(save_file, wipe_scores):
+def _open_score_sheet(config, module_names=None):
     """
-    Initializes the ScoreSheet instance on entering and saves it on exiting.
+    Loads the score sheet for the given pytest configuration, and stores it
+    on exiting. The checkpoints of the session are removed once the scores
+    are stored.
     """
-    if wipe_scores:
-        with suppress(IOError):
-            os.remove(save_file)
-    try:
-        with open(save_file, 'r') as in_file:
-            score_sheet_instance = json.load(in_file, object_hook=decode)
-    except (IOError, json.decoder.JSONDecodeError):
-        score_sheet_instance = ScoreSheet()
-    if not isinstance(score_sheet_instance, ScoreSheet):
-        score_sheet_instance = ScoreSheet()
+    with store_score(
+        store=_get_store(config),
+        wipe_scores=config.option.wipe_scores,
+        compact=config.option.score_compact,
+        module_names=module_names
+    ) as score_sheet_instance:
+        yield score_sheet_instance
+    checkpoint_session = getattr(config, '_score_checkpoint_session', None)
+    if checkpoint_session is not None:
+        checkpoint_session.discard()
 
-    yield score_sheet_instance
 
-    with open(save_file, 'w') as out_file:
-        json.dump(score_sheet_instance, out_file, default=encode)
+@contextmanager
+def _open_checkpoint(request):
+    """
+    Starts the writer for the checkpoint of the session, unless it is
+    disabled. The checkpoint is added to the session which stores its scores,
+    which is the session of the controller for pytest-xdist workers.
+    """
+    config = request.config
+    if config.option.score_checkpoint_interval <= 0:
+        yield
+        return
+    if is_xdist_worker(config):
+        session_id = get_worker_session_id(config)
+        if session_id is None:
+            yield
+            return
+        prefix = get_checkpoint_prefix(_get_save_file(config), session_id)
+    else:
+        prefix = get_checkpoint_session(config).checkpoint_prefix
+    with CheckpointWriter(
+        prefix,
+        interval=config.option.score_checkpoint_interval,
+        max_pending=config.option.score_checkpoint_size
+    ) as checkpoint:
+        request.session._score_checkpoint = checkpoint  # pylint: disable=protected-access
+        yield
+        del request.session._score_checkpoint  # pylint: disable=protected-access
+    if is_xdist_worker(config):
+        send_worker_checkpoint(config, checkpoint.path)
+    else:
+        get_checkpoint_session(config).add_checkpoint(checkpoint.path)
+
+
+def get_checkpoint_session(config):
+    """
+    Returns the checkpoint session of the given pytest configuration, which
+    is created when it is first used.
+    """
+    if not hasattr(config, '_score_checkpoint_session'):
+        config._score_checkpoint_session = CheckpointSession(  # pylint: disable=protected-access
+            _get_save_file(config)
+        )
+    return config._score_checkpoint_session  # pylint: disable=protected-access
 
 
-def _get_save_file(request):
+def _get_store(config):
     """
-    Returns the path where the score file is stored.
+    Returns the store selected in the given pytest configuration.
     """
-    return str(request.config.rootdir.join('.pytest-score'))
+    return STORES[config.option.score_store](
+        _get_save_file(config), file_format=config.option.score_format
+    )
 
 
-@export
-@pytest.fixture
-def score(request, score_sheet):  # pylint: disable=redefined-outer-name
+def _get_module_names(items):
     """
-    Fixture to store a scored test.
+    Returns the names of the modules containing the given test items.
     """
+    return {
+        item.module.__name__
+        for item in items if getattr(item, 'module', None) is not None
+    }
 
-    def inner(value, less_is_better=False, cutoff=None, tag=''):
-        score_sheet.add_score(
-            value,
-            test_name=_get_test_name(request),
-            tag=tag,
-            evaluator=Evaluator(less_is_better=less_is_better, cutoff=cutoff)
-        )
 
-    return inner
+def _get_save_file(config):
+    """
+    Returns the path where the score file is stored.
+    """
+    return str(config.rootdir.join('.pytest-score'))
 
 
-def _get_test_name(request):
+@export
+@pytest.fixture
+def score(request, score_sheet):  # pylint: disable=redefined-outer-name
     """
-    Returns a unique identifier for a given test.
+    Fixture to store a scored test. Returns a Scorer, which records a value
+    when it is called.
     """
-    return request.module.__name__ + '/' + request._parent_request._pyfuncitem.name  # pylint: disable=protected-access
+    return Scorer(request, score_sheet)
@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+
+# © 2015-2018, ETH Zurich, Institut für Theoretische Physik
+# Author: Dominik Gresch <greschd@gmx.ch>
+"""
+Defines the file formats in which the score sheets are stored. The format of
+a stored file is detected when it is loaded, such that files written in an
+older format are migrated when they are saved again.
+"""
+
+import io
+import json
+import numbers
+from itertools import islice, repeat
+
+from ._score import ScoreSheet, ScoreResult, Evaluator
+from ._serialize import encode, decode
+from ._stats import SampleStats
+
+COLUMNAR_FORMAT = 'columnar'
+COLUMNAR_VERSION = 1
+NPZ_MAGIC = b'PK'
+
+
+class TaggedJsonFormat:
+    """
+    The original JSON format, where each object is stored as a nested
+    dictionary tagged with its type.
+    """
+    extension = '.json'
+
+    def dumps(self, score_sheet):  # pylint: disable=no-self-use
+        """
+        Serialize the score sheet to bytes.
+        """
+        return json.dumps(score_sheet, default=encode).encode('utf-8')
+
+    def loads(self, data):  # pylint: disable=no-self-use
+        """
+        Deserialize the score sheet from bytes.
+        """
+        return json.loads(data.decode('utf-8'), object_hook=decode)
+
+
+class ColumnarJsonFormat:
+    """
+    JSON format which stores the score sheet as flat columns, with one entry
+    per test and tag, and a de-duplicated table of evaluators. The samples
+    of the current run are stored in an additional column, if there are any.
+    """
+    extension = '.json'
+
+    def dumps(self, score_sheet):  # pylint: disable=no-self-use
+        """
+        Serialize the score sheet to bytes.
+        """
+        return json.dumps(
+            to_columns(score_sheet), default=encode
+        ).encode('utf-8')
+
+    def loads(self, data):  # pylint: disable=no-self-use
+        """
+        Deserialize the score sheet from bytes.
+        """
+        return from_columns(json.loads(data.decode('utf-8')))
+
+
+class NpzFormat:
+    """
+    Binary format which stores the columns as NumPy arrays in an ``.npz``
+    file. Like the CompactScoreSheet, it converts numeric scores to floats.
+    Other scores are stored in a JSON column of the metadata. The samples of
+    the current run are not stored.
+    """
+    extension = '.npz'
+
+    def dumps(self, score_sheet):  # pylint: disable=no-self-use
+        """
+        Serialize the score sheet to bytes.
+        """
+        import numpy as np
+        columns = to_columns(score_sheet)
+        objects = {}
+        current, objects['current'] = _split_floats(columns['current'])
+        best, objects['best'] = _split_floats(columns['best'])
+        objects['history'] = {}
+        history_width = max(columns['history_lengths'], default=0)
+        history = np.full((len(columns['tags']), history_width), np.nan)
+        for row, values in enumerate(columns['history']):
+            history[row, :len(values)], row_objects = _split_floats(values)
+            if row_objects:
+                objects['history'][str(row)] = row_objects
+        meta = {
+            key: columns[key]
+            for key in ['format', 'version', 'history_length', 'run']
+        }
+        meta['evaluators'] = columns['evaluators']
+        meta['objects'] = {key: val for key, val in objects.items() if val}
+        history_sizes = [len(values) for values in columns['history']]
+        out_file = io.BytesIO()
+        np.savez(
+            out_file,
+            meta=np.array(json.dumps(meta, default=encode)),
+            test_names=np.array(columns['test_names'], dtype=str),
+            num_tags=np.array(columns['num_tags'], dtype=np.int64),
+            tags=np.array(columns['tags'], dtype=str),
+            evaluator_ids=np.array(columns['evaluator_ids'], dtype=np.int64),
+            current=np.array(current, dtype=float),
+            best=np.array(best, dtype=float),
+            runs=np.array(columns['runs'], dtype=np.int64),
+            history=history,
+            history_sizes=np.array(history_sizes, dtype=np.int64),
+            history_lengths=np.array(
+                columns['history_lengths'], dtype=np.int64
+            )
+        )
+        return out_file.getvalue()
+
+    def loads(self, data):  # pylint: disable=no-self-use
+        """
+        Deserialize the score sheet from bytes.
+        """
+        import zipfile
+        import numpy as np
+        try:
+            arrays = np.load(io.BytesIO(data), allow_pickle=False)
+            columns = json.loads(str(arrays['meta']), object_hook=decode)
+            objects = columns.pop('objects', {})
+            for key in [
+                'test_names', 'num_tags', 'tags', 'evaluator_ids', 'runs',
+                'history_lengths'
+            ]:
+                columns[key] = arrays[key].tolist()
+            for key in ['current', 'best']:
+                columns[key] = _from_floats(
+                    arrays[key].tolist(), objects.get(key, {})
+                )
+            history = arrays['history'].tolist()
+            history_sizes = arrays['history_sizes'].tolist()
+            history_objects = objects.get('history', {})
+            columns['history'] = []
+            for row, values in enumerate(history):
+                columns['history'].append(
+                    _from_floats(
+                        values[:history_sizes[row]],
+                        history_objects.get(str(row), {})
+                    )
+                )
+        except (zipfile.BadZipFile, KeyError) as exc:
+            raise ValueError('Invalid npz score file.') from exc
+        return from_columns(columns)
+
+
+FORMATS = {
+    'json': TaggedJsonFormat(),
+    COLUMNAR_FORMAT: ColumnarJsonFormat(),
+    'npz': NpzFormat(),
+}
+
+
+def loads_score_sheet(data):
+    """
+    Deserialize a score sheet from bytes, detecting the format in which it
+    was written. Raises a ValueError if the data cannot be read.
+    """
+    if data.startswith(NPZ_MAGIC):
+        return FORMATS['npz'].loads(data)
+    res = json.loads(data.decode('utf-8'), object_hook=decode)
+    if isinstance(res, dict) and res.get('format') == COLUMNAR_FORMAT:
+        return from_columns(res)
+    return res
+
+
+def to_columns(score_sheet):
+    """
+    Convert the score sheet to a dictionary of flat columns. The test names
+    are stored once, together with the number of tags of each test.
+    """
+    sheet_dict = score_sheet.to_dict()
+    evaluators = []
+    evaluator_index = {}
+    columns = {
+        key: []
+        for key in [
+            'test_names', 'num_tags', 'tags', 'evaluator_ids', 'current',
+            'best', 'runs', 'history', 'history_lengths', 'samples'
+        ]
+    }
+    for test_name, test_name_result in sheet_dict['scores'].items():
+        columns['test_names'].append(test_name)
+        columns['num_tags'].append(len(test_name_result))
+        for tag, score_result in test_name_result.items():
+            result_dict = score_result.to_dict()
+            evaluator = result_dict['evaluator']
+            if evaluator not in evaluator_index:
+                evaluator_index[evaluator] = len(evaluators)
+                evaluators.append(evaluator.to_dict())
+            columns['tags'].append(tag)
+            columns['evaluator_ids'].append(evaluator_index[evaluator])
+            columns['current'].append(result_dict['current'])
+            columns['best'].append(result_dict['best'])
+            columns['runs'].append(result_dict['run'])
+            columns['history'].append(result_dict['history'])
+            columns['history_lengths'].append(result_dict['history_length'])
+            samples = result_dict.get('samples', None)
+            columns['samples'].append(
+                None if samples is None else samples.to_dict()
+            )
+    if not any(columns['samples']):
+        del columns['samples']
+    columns.update(
+        format=COLUMNAR_FORMAT,
+        version=COLUMNAR_VERSION,
+        history_length=sheet_dict['history_length'],
+        run=sheet_dict['run'],
+        evaluators=evaluators
+    )
+    return columns
+
+
+def from_columns(columns):
+    """
+    Create a score sheet from a dictionary of flat columns.
+    """
+    if columns['version'] > COLUMNAR_VERSION:
+        raise ValueError(
+            'Unsupported score file version {}.'.format(columns['version'])
+        )
+    evaluators = [
+        Evaluator.from_dict(evaluator) for evaluator in columns['evaluators']
+    ]
+    score_results = map(
+        _create_score_result,
+        (evaluators[idx] for idx in columns['evaluator_ids']),
+        columns['current'], columns['best'], columns['runs'],
+        columns['history'], columns['history_lengths'],
+        columns.get('samples', repeat(None))
+    )
+    rows = zip(columns['tags'], score_results)
+    scores = {
+        test_name: dict(islice(rows, num_tags))
+        for test_name, num_tags in
+        zip(columns['test_names'], columns['num_tags'])
+    }
+    return ScoreSheet(
+        scores=scores,
+        history_length=columns['history_length'],
+        run=columns['run']
+    )
+
+
+def _create_score_result(  # pylint: disable=too-many-arguments
+    evaluator, current, best, run, history, history_length, samples
+):
+    """
+    Create a score result from the values of a single row.
+    """
+    score_result = ScoreResult(
+        evaluator=evaluator, history_length=history_length
+    )
+    score_result._history.extend(history)  # pylint: disable=protected-access
+    score_result.current = current
+    score_result.best = best
+    score_result.run = run
+    if samples is not None:
+        score_result.samples = SampleStats.from_dict(samples)
+    return score_result
+
+
+def _split_floats(values):
+    """
+    Split score values into floats, using NaN for missing values and values
+    which are not numbers, and a dict of the values which are not numbers by
+    their index.
+    """
+    floats = []
+    objects = {}
+    for idx, val in enumerate(values):
+        if isinstance(val, numbers.Real):
+            floats.append(float(val))
+        else:
+            floats.append(float('nan'))
+            if val is not None:
+                objects[str(idx)] = val
+    return floats, objects
+
+
+def _from_floats(values, objects):
+    """
+    Convert floats to score values, using None for NaN unless there is a
+    value which is not a number at that index.
+    """
+    return [
+        objects.get(str(idx), None) if val != val else val  # pylint: disable=comparison-with-itself
+        for idx, val in enumerate(values)
+    ]
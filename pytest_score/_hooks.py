@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+
+# © 2015-2018, ETH Zurich, Institut für Theoretische Physik
+# Author: Dominik Gresch <greschd@gmx.ch>
+"""
+Defines the hooks which are added to pytest by the ``pytest-score`` plugin.
+"""
+
+
+def pytest_score_report(session, report):
+    """
+    Called at the end of a session in which scores were recorded, with the
+    :class:`ScoreReport` of the session. The report is created only once,
+    and should not be modified by the reporters.
+    """
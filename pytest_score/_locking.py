@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+# © 2015-2018, ETH Zurich, Institut für Theoretische Physik
+# Author: Dominik Gresch <greschd@gmx.ch>
+"""
+Defines helpers to write the score files safely when several pytest sessions
+use the same files concurrently.
+"""
+
+import os
+import stat
+import tempfile
+from functools import lru_cache
+from contextlib import contextmanager, suppress
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None  # pylint: disable=invalid-name
+    import msvcrt
+
+
+@contextmanager
+def file_lock(path):
+    """
+    Holds an exclusive lock for the given path, using a separate lock file.
+    The lock file is kept next to the path, because removing it could let
+    two sessions lock different files for the same path.
+    """
+    with open(path + '.lock', 'a') as handle:
+        lock_file(handle)
+        try:
+            yield
+        finally:
+            unlock_file(handle)
+
+
+def lock_file(handle, *, blocking=True):
+    """
+    Acquire an exclusive lock on an open file. If ``blocking`` is not set,
+    returns False instead of waiting if the file is locked by another
+    process.
+    """
+    try:
+        if fcntl is not None:
+            flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+            fcntl.flock(handle.fileno(), flags)
+        else:  # pragma: no cover
+            mode = msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK
+            msvcrt.locking(handle.fileno(), mode, 1)
+    except (BlockingIOError, PermissionError):
+        if blocking:
+            raise
+        return False
+    return True
+
+
+def unlock_file(handle):
+    """
+    Release the lock on an open file.
+    """
+    if fcntl is not None:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+    else:  # pragma: no cover
+        msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def atomic_write(path, mode='w'):
+    """
+    Opens a temporary file for writing, which replaces the file at the given
+    path only if it was written completely. The file keeps the permissions of
+    the file it replaces, or gets the default permissions of a new file.
+    """
+    dirname, basename = os.path.split(os.path.abspath(path))
+    handle, tmp_path = tempfile.mkstemp(
+        dir=dirname, prefix=basename + '.', suffix='.tmp'
+    )
+    try:
+        os.chmod(tmp_path, get_file_mode(path))
+        with os.fdopen(handle, mode) as out_file:
+            yield out_file
+            out_file.flush()
+            os.fsync(out_file.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        with suppress(OSError):
+            os.remove(tmp_path)
+        raise
+
+
+def get_file_mode(path):
+    """
+    Get the permissions of the file at the given path, or the permissions
+    which ``open`` gives a new file if it does not exist.
+    """
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except OSError:
+        return 0o666 & ~get_umask()
+
+
+@lru_cache(maxsize=None)
+def get_umask():
+    """
+    Get the umask of the process, which is read once and cached. It is read
+    from ``/proc/self/status`` where this is available, because setting the
+    umask to read it changes the mode of files which other threads create at
+    the same time.
+    """
+    with suppress(OSError, ValueError):
+        with open('/proc/self/status') as status_file:
+            for line in status_file:
+                if line.startswith('Umask:'):
+                    return int(line.split()[1], 8)
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+def get_fingerprint(path):
+    """
+    Returns the modification time and size of the file, which are used to
+    detect whether it was changed by another session. Returns None if the
+    file does not exist.
+    """
+    try:
+        file_stat = os.stat(path)
+    except OSError:
+        return None
+    return (file_stat.st_mtime_ns, file_stat.st_size)
@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+
+# © 2015-2018, ETH Zurich, Institut für Theoretische Physik
+# Author: Dominik Gresch <greschd@gmx.ch>
+"""
+Defines a store which keeps the scores in NumPy arrays on disk, such that they
+can be memory-mapped instead of parsed. NumPy is imported only when the store
+is used.
+"""
+
+import os
+import json
+import shutil
+import tempfile
+from contextlib import suppress
+
+from fsc.export import export
+
+from ._score import Evaluator
+from ._serialize import encode, decode
+from ._store import merge_session
+from ._locking import file_lock, atomic_write, get_fingerprint, get_umask
+
+MMAP_VERSION = 1
+_ARRAY_NAMES = ['current', 'best', 'history', 'runs', 'evaluator_ids']
+
+
+@export
+class MmapScores:
+    """
+    Read-only view of a memory-mapped score store, which does not parse or
+    copy the stored scores. The ``current``, ``best``, ``history``, ``runs``
+    and ``evaluator_ids`` attributes are NumPy arrays with one row per test
+    and tag, where missing values are NaN. The history of each score starts
+    with the most recent value. As in a CompactScoreSheet, the current value
+    belongs to the run given in ``runs``. Scores which are not numbers are NaN
+    in the arrays, and are listed in ``objects`` as ``(row, field, value)``
+    tuples, where the field is 'current', 'best' or the index in the history.
+    """
+
+    def __init__(self, data_dir, meta, *, mmap_mode='r'):
+        self.run = meta['run']
+        self.history_length = meta['history_length']
+        self.evaluators = [
+            Evaluator.from_dict(evaluator) for evaluator in meta['evaluators']
+        ]
+        for name in _ARRAY_NAMES:
+            array = _load_array(os.path.join(data_dir, name), mmap_mode)
+            setattr(self, name, array)
+        self.objects = [tuple(obj) for obj in meta.get('objects', [])]
+        self._test_names = _StringTable(data_dir, 'test_names')
+        self._tags = _StringTable(data_dir, 'tags')
+        self._index = None
+
+    def __len__(self):
+        return len(self.current)
+
+    def keys(self):
+        """
+        Get the ``(test_name, tag)`` pairs of all rows.
+        """
+        return list(zip(self._test_names.to_list(), self._tags.to_list()))
+
+    def get_key(self, row):
+        """
+        Get the ``(test_name, tag)`` pair of a single row.
+        """
+        return self._test_names[row], self._tags[row]
+
+    def find(self, test_name, tag=''):
+        """
+        Get the row of the given test and tag, or None if it is not stored.
+        """
+        if self._index is None:
+            self._index = {key: row for row, key in enumerate(self.keys())}
+        return self._index.get((test_name, tag), None)
+
+    def to_score_sheet(self):
+        """
+        Create a CompactScoreSheet from the stored scores. The arrays are
+        used without copying them.
+        """
+        from ._compact import CompactScoreSheet
+        arrays = {name: getattr(self, name) for name in _ARRAY_NAMES}
+        return CompactScoreSheet.from_arrays(
+            history_length=self.history_length,
+            run=self.run,
+            keys=self.keys(),
+            evaluators=self.evaluators,
+            objects=self.objects,
+            **arrays
+        )
+
+
+@export
+def open_mmap_scores(save_file):
+    """
+    Open the memory-mapped score store for the given save file read-only.
+    Returns None if the store does not exist.
+    """
+    return MmapStore(save_file).open()
+
+
+class MmapStore:
+    """
+    Stores the scores as NumPy arrays and string tables in a directory next
+    to the save file. The arrays are memory-mapped when they are loaded, and
+    are copied only when they are changed. Like the CompactScoreSheet, the
+    store converts numeric scores to floats, and keeps the other scores in
+    the metadata.
+    """
+
+    def __init__(self, save_file, *, file_format=None):  # pylint: disable=unused-argument
+        self.save_dir = save_file + '.mmap'
+        self.meta_file = os.path.join(self.save_dir, 'meta.json')
+        self._fingerprint = None
+
+    def wipe(self):
+        """
+        Delete the stored scores.
+        """
+        shutil.rmtree(self.save_dir, ignore_errors=True)
+
+    def read_meta(self):
+        """
+        Read the metadata, which contains the current run, the evaluators
+        and the directory of the current arrays. Returns None if the store
+        does not exist.
+        """
+        try:
+            with open(self.meta_file, 'r') as in_file:
+                return json.load(in_file, object_hook=decode)
+        except (IOError, json.decoder.JSONDecodeError):
+            return None
+
+    def open(self, *, mmap_mode='r', retries=3):
+        """
+        Open the stored scores as MmapScores, or return None if the store
+        does not exist. If the data directory was removed by a concurrent
+        write after the metadata was read, the metadata is read again.
+        """
+        for attempt in range(retries + 1):
+            meta = self.read_meta()
+            if meta is None:
+                return None
+            if meta['version'] > MMAP_VERSION:
+                raise ValueError(
+                    'Unsupported score store version {}.'.format(
+                        meta['version']
+                    )
+                )
+            try:
+                return MmapScores(
+                    os.path.join(self.save_dir, meta['data_dir']),
+                    meta,
+                    mmap_mode=mmap_mode
+                )
+            except FileNotFoundError:
+                if attempt == retries:
+                    raise
+        return None
+
+    def load(self, module_names=None):  # pylint: disable=unused-argument
+        """
+        Load the score sheet. The arrays are mapped copy-on-write, such that
+        changing them does not change the stored files.
+        """
+        self._fingerprint = get_fingerprint(self.meta_file)
+        return self._read()
+
+    def save(self, score_sheet):
+        """
+        Write the score sheet to a new data directory, and switch the
+        metadata to it. If the store was changed by another session since it
+        was loaded, the new scores are merged into it.
+        """
+        os.makedirs(self.save_dir, exist_ok=True)
+        with file_lock(self.meta_file):
+            if get_fingerprint(self.meta_file) != self._fingerprint:
+                score_sheet = merge_session(self._read(), score_sheet)
+            self._write(score_sheet)
+
+    def _read(self):
+        """
+        Read the stored score sheet, or create an empty one.
+        """
+        from ._compact import CompactScoreSheet
+        scores = self.open(mmap_mode='c')
+        if scores is None:
+            return CompactScoreSheet()
+        return scores.to_score_sheet()
+
+    def _write(self, score_sheet):
+        """
+        Write the arrays of the score sheet, while holding the lock.
+        """
+        import numpy as np
+        from ._compact import CompactScoreSheet
+        if not isinstance(score_sheet, CompactScoreSheet):
+            score_sheet = CompactScoreSheet.from_sheet(score_sheet)
+        arrays = score_sheet.to_arrays()
+        data_dir = tempfile.mkdtemp(dir=self.save_dir, prefix='data-')
+        os.chmod(data_dir, 0o777 & ~get_umask())
+        for name in _ARRAY_NAMES:
+            np.save(os.path.join(data_dir, name), arrays[name])
+        _StringTable.save(
+            data_dir, 'test_names', [key[0] for key in arrays['keys']]
+        )
+        _StringTable.save(data_dir, 'tags', [key[1] for key in arrays['keys']])
+
+        old_meta = self.read_meta()
+        evaluators = [
+            evaluator.to_dict() for evaluator in arrays['evaluators']
+        ]
+        meta = {
+            'version': MMAP_VERSION,
+            'data_dir': os.path.basename(data_dir),
+            'run': arrays['run'],
+            'history_length': arrays['history_length'],
+            'evaluators': evaluators,
+            'objects': arrays['objects']
+        }
+        with atomic_write(self.meta_file) as out_file:
+            json.dump(meta, out_file, default=encode)
+        # the previous directory is kept for readers which read the old
+        # metadata, and mapped files stay valid after removing a directory
+        keep = {meta['data_dir']}
+        if old_meta is not None:
+            keep.add(old_meta['data_dir'])
+        for name in os.listdir(self.save_dir):
+            if name.startswith('data-') and name not in keep:
+                shutil.rmtree(
+                    os.path.join(self.save_dir, name), ignore_errors=True
+                )
+
+
+class _StringTable:
+    """
+    Table of strings, stored as one UTF-8 encoded byte array and the offsets
+    of the strings in it.
+    """
+
+    def __init__(self, data_dir, name):
+        self._data = _load_array(os.path.join(data_dir, name), 'r')
+        self._offsets = _load_array(
+            os.path.join(data_dir, name + '_offsets'), 'r'
+        )
+
+    @staticmethod
+    def save(data_dir, name, strings):
+        """
+        Write a string table to the given directory.
+        """
+        import numpy as np
+        encoded = [val.encode('utf-8') for val in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(val) for val in encoded], out=offsets[1:])
+        np.save(
+            os.path.join(data_dir, name),
+            np.frombuffer(b''.join(encoded), dtype=np.uint8)
+        )
+        np.save(os.path.join(data_dir, name + '_offsets'), offsets)
+
+    def __getitem__(self, idx):
+        start, stop = self._offsets[idx:idx + 2]
+        return self._data[start:stop].tobytes().decode('utf-8')
+
+    def to_list(self):
+        """
+        Decode all strings in the table.
+        """
+        data = self._data.tobytes()
+        offsets = self._offsets.tolist()
+        return [
+            data[start:stop].decode('utf-8')
+            for start, stop in zip(offsets[:-1], offsets[1:])
+        ]
+
+
+def _load_array(path, mmap_mode):
+    """
+    Load an array from a ``.npy`` file, memory-mapping it if it is not empty.
+    """
+    import numpy as np
+    path += '.npy'
+    with suppress(ValueError):
+        return np.load(path, mmap_mode=mmap_mode)
+    # empty arrays cannot be memory-mapped
+    return np.load(path)
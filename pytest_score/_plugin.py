@@ -7,12 +7,31 @@ Defines the reporters to write the score report to the terminal and HTML output,
 """
 
 import os
+import re
+import json
 import shutil
+import hashlib
+from collections import Counter
+from contextlib import suppress
 
-import jinja2
+import pytest
 from fsc.export import export
 
 from ._score import ScoreStates
+from ._report import get_score_report
+from ._store import STORES
+from ._formats import FORMATS
+from ._fixtures import (
+    _open_score_sheet, _get_store, _get_save_file, _get_module_names,
+    get_checkpoint_session
+)
+from ._checkpoint import recover_checkpoints, discard_checkpoints
+from ._resources import ResourceScorer
+from ._profile import ProfileRunner
+from ._confirm import RegressionConfirmer
+from ._schedule import ORDERS, get_test_stats, order_items, assign_groups
+from ._xdist import is_xdist_worker, XdistScoreController
+from ._locking import get_umask
 
 
 @export
@@ -22,64 +41,376 @@ def pytest_addoption(parser):
         action='store_true',
         help='Delete previous score results.'
     )
+    parser.addoption(
+        '--score-store',
+        choices=sorted(STORES),
+        default='json',
+        help='Format used to store the scores between sessions. The "json" '
+        'store re-writes a single JSON file, while the "journal" store only '
+        'appends the changes of each session to a journal file. The '
+        '"sqlite" store keeps the full history in an SQLite database. The '
+        '"sharded" store uses one file per test module, and loads only the '
+        'files of the collected modules. The "mmap" store keeps the scores '
+        'in memory-mapped NumPy arrays, and converts numeric scores to floats.'
+    )
+    parser.addoption(
+        '--score-format',
+        choices=sorted(FORMATS),
+        default='columnar',
+        help='File format in which the scores are written. The "columnar" '
+        'format stores flat JSON columns, while the "json" format is the '
+        'format of earlier versions. The "npz" format is a binary NumPy '
+        'format, which converts numeric scores to floats. Files in any '
+        'format are read, and converted when they are written.'
+    )
+    parser.addoption(
+        '--score-compact',
+        action='store_true',
+        help='Keep the scores in compact NumPy arrays during the session. '
+        'This reduces the memory use for large score sheets, and converts '
+        'numeric scores to floats.'
+    )
+    parser.addoption(
+        '--score-checkpoint-interval',
+        type=float,
+        default=10.,
+        metavar='SECONDS',
+        help='Interval in seconds after which new scores are written to a '
+        'checkpoint, from which they are recovered if the session does not '
+        'finish. A value of 0 disables the checkpoints.'
+    )
+    parser.addoption(
+        '--score-checkpoint-size',
+        type=int,
+        default=100,
+        metavar='N',
+        help='Number of new scores after which they are written to the '
+        'checkpoint, even if the interval has not passed.'
+    )
+    parser.addoption(
+        '--score-durations',
+        action='store_true',
+        help='Record the wall time and CPU time of the call of every passing '
+        'test as scores, with the tags "@duration" and "@cpu_time".'
+    )
+    parser.addoption(
+        '--score-memory',
+        action='store_true',
+        help='Record the peak memory allocated by the call of every passing '
+        'test as a score with the tag "@memory", using tracemalloc. This '
+        'cannot be used together with --score-durations.'
+    )
+    parser.addoption(
+        '--score-profile-runs',
+        type=int,
+        default=5,
+        metavar='N',
+        help='Number of runs for which the profiles captured by '
+        '"score.profile" are kept.'
+    )
+    parser.addoption(
+        '--score-confirm-regressions',
+        type=int,
+        default=0,
+        metavar='N',
+        help='Re-run the tests whose scores became worse N more times, and '
+        'evaluate the scores from the samples of all runs. This confirms '
+        'that a regression is not caused by noise.'
+    )
+    parser.addoption(
+        '--score-order',
+        choices=ORDERS,
+        default='none',
+        help='Order the tests using the scores of previous runs. The '
+        '"duration" order runs the longest tests first, using the durations '
+        'recorded with --score-durations. With pytest-xdist and '
+        '"--dist loadgroup", the tests are also distributed over groups with '
+        'balanced durations. The "regressed" order runs the tests whose '
+        'scores became worse in the last run first.'
+    )
+    parser.addoption(
+        '--score-report',
+        choices=['all', 'changed', 'worse'],
+        default='all',
+        help='Select which scores are shown in the terminal report.'
+    )
+    parser.addoption(
+        '--score-report-top',
+        type=int,
+        default=None,
+        metavar='N',
+        help='Show only the N scores with the largest changes in the '
+        'terminal report, starting with the worst.'
+    )
+
+
+@export
+def pytest_addhooks(pluginmanager):  # pylint: disable=missing-docstring
+    from . import _hooks
+    pluginmanager.add_hookspecs(_hooks)
 
 
 @export
 def pytest_configure(config):  # pylint: disable=missing-docstring
+    if config.option.score_compact and config.option.score_store == 'sqlite':
+        raise pytest.UsageError(
+            "The '--score-compact' option cannot be used with the SQLite store."
+        )
+    if config.option.score_durations and config.option.score_memory:
+        raise pytest.UsageError(
+            "The '--score-durations' and '--score-memory' options cannot be "
+            "used together, because tracing the memory slows down the tests."
+        )
+    # the umask is cached before the checkpoints are written in a thread
+    get_umask()
+    config._score_profile_runner = ProfileRunner(  # pylint: disable=protected-access
+        _get_save_file(config),
+        max_runs=config.option.score_profile_runs
+    )
+    if config.option.wipe_scores and not is_xdist_worker(config):
+        config._score_profile_runner.profiles.wipe()  # pylint: disable=protected-access
+    config.pluginmanager.register(config._score_profile_runner)  # pylint: disable=protected-access
     config._score_html = HTMLScoreReporter(config)  # pylint: disable=protected-access
     config._score_terminal = TerminalScoreReporter(config)  # pylint: disable=protected-access
     config.pluginmanager.register(config._score_html)  # pylint: disable=protected-access
     config.pluginmanager.register(config._score_terminal)  # pylint: disable=protected-access
+    if config.option.score_durations or config.option.score_memory:
+        config._score_resources = ResourceScorer(  # pylint: disable=protected-access
+            durations=config.option.score_durations,
+            memory=config.option.score_memory
+        )
+        config.pluginmanager.register(config._score_resources)  # pylint: disable=protected-access
+    if config.option.score_confirm_regressions > 0:
+        config._score_confirmer = RegressionConfirmer(  # pylint: disable=protected-access
+            config.option.score_confirm_regressions
+        )
+        config.pluginmanager.register(config._score_confirmer)  # pylint: disable=protected-access
+    if not is_xdist_worker(config):
+        config._score_xdist = XdistScoreController(  # pylint: disable=protected-access
+            _open_score_sheet, get_checkpoint_session
+        )
+        config.pluginmanager.register(config._score_xdist)  # pylint: disable=protected-access
+
+
+@export
+@pytest.hookimpl(tryfirst=True)
+def pytest_collection_modifyitems(config, items):
+    """
+    Orders the collected tests using the scores of previous runs.
+    """
+    order = config.option.score_order
+    if order == 'none' or not items:
+        return
+    score_sheet = _get_store(config).load(
+        module_names=_get_module_names(items)
+    )
+    durations, regressions = get_test_stats(score_sheet)
+    order_items(
+        items, order=order, durations=durations, regressions=regressions
+    )
+    if order == 'duration' and is_xdist_worker(config) and getattr(
+        config.option, 'loadgroup', False
+    ):
+        assign_groups(
+            items,
+            durations=durations,
+            num_groups=config.workerinput['workercount']
+        )
+
+
+@export
+def pytest_sessionstart(session):
+    """
+    Recovers the scores of previous sessions which did not finish, or
+    removes them if the scores are wiped.
+    """
+    config = session.config
+    if is_xdist_worker(config):
+        return
+    if config.option.wipe_scores:
+        discard_checkpoints(_get_save_file(config))
+    else:
+        recover_checkpoints(
+            _get_save_file(config), create_store=lambda: _get_store(config)
+        )
+
+
+@export
+def pytest_sessionfinish(session):
+    """
+    Creates the score report and passes it to the reporters.
+    """
+    if hasattr(session, '_score_sheet_instance'):
+        session.config.hook.pytest_score_report(
+            session=session, report=get_score_report(session)
+        )
 
 
 @export
 def pytest_unconfigure(config):
-    config.pluginmanager.unregister(config._score_html)  # pylint: disable=protected-access
-    config.pluginmanager.unregister(config._score_terminal)  # pylint: disable=protected-access
+    # the plugins are not registered if the configuration was rejected
+    for name in [
+        '_score_html', '_score_terminal', '_score_resources',
+        '_score_confirmer', '_score_xdist', '_score_profile_runner'
+    ]:
+        if hasattr(config, name):
+            config.pluginmanager.unregister(getattr(config, name))
+    if hasattr(config, '_score_checkpoint_session'):
+        config._score_checkpoint_session.close()  # pylint: disable=protected-access
 
 
 class HTMLScoreReporter:
     """
-    Saves the score report to an HTML file.
+    Saves the score report to HTML files, with one page per test module and
+    an index page summarizing the states of the scores. Pages are only
+    re-written if their content changed.
     """
 
     def __init__(self, config):
         self.save_dirname = str(config.rootdir.join('htmlscore'))
-
-        templates_dirpath = os.path.join(
+        self.templates_dirpath = os.path.join(
             os.path.dirname(__file__), 'templates'
         )
-        env = jinja2.Environment(
-            loader=jinja2.FileSystemLoader(templates_dirpath)
-        )
-        env.globals.update(zip=zip)
+        self.css_path = os.path.join(self.templates_dirpath, 'theme.css')
+        self._env = None
 
-        self.template = env.get_template('html_template.html')
-        self.css_path = os.path.join(templates_dirpath, 'theme.css')
+    def _get_template(self, name):
+        """
+        Get the template with the given name. The jinja2 environment is only
+        created when the first report is written.
+        """
+        if self._env is None:
+            import jinja2
+            self._env = jinja2.Environment(
+                loader=jinja2.FileSystemLoader(self.templates_dirpath)
+            )
+        return self._env.get_template(name)
 
-    def pytest_sessionfinish(self, session):
+    def pytest_score_report(self, session, report):
         """
-        Method which is called pytest at the end of the session.
+        Method which is called with the score report at the end of the
+        session.
         """
-        if hasattr(session, '_score_sheet_instance'):
-            self._save_html(session._score_sheet_instance)  # pylint: disable=protected-access
+        runner = getattr(session.config, '_score_profile_runner', None)
+        profiles = None
+        if runner is not None and runner.has_profiles():
+            profiles = runner.profiles
+        self._save_html(report, profiles=profiles)
 
-    def _save_html(self, score_sheet):
+    def _save_html(self, report, profiles=None):
         """
-        Saves the HTML and CSS files for the given score sheet.
+        Saves the HTML and CSS files for the given score report. The rows
+        which became worse are linked to the comparison of their profiles,
+        if they were profiled. The pages of modules and profiles which are
+        not in the report are removed.
         """
         os.makedirs(self.save_dirname, exist_ok=True)
-        with open(
-            os.path.join(self.save_dirname, 'index.html'), 'w'
-        ) as html_file:
-            html_file.write(self._render_template(score_sheet))
+        digests_path = os.path.join(self.save_dirname, 'digests.json')
+        try:
+            with open(digests_path, 'r') as in_file:
+                old_digests = json.load(in_file)
+        except (IOError, json.decoder.JSONDecodeError):
+            old_digests = {}
+        digests = {}
+
+        modules = []
+        for module, rows in report.group_by_module().items():
+            profile_links = {}
+            for row in rows:
+                if row.state != ScoreStates.WORSE or profiles is None:
+                    continue
+                diff = profiles.get_diff(row.name)
+                if diff is None:
+                    continue
+                profile_filename = _get_page_filename(row.name, 'profile_')
+                digests[profile_filename] = self._write_page(
+                    profile_filename,
+                    self._get_template('profile_template.html'),
+                    old_digest=old_digests.get(profile_filename, None),
+                    module_filename=_get_page_filename(module),
+                    name=row.name,
+                    diff=diff
+                )
+                profile_links[row.name] = profile_filename
+
+            filename = _get_page_filename(module)
+            digests[filename] = self._write_page(
+                filename,
+                self._get_template('html_template.html'),
+                old_digest=old_digests.get(filename, None),
+                module=module,
+                header=report.header,
+                rows=rows,
+                profile_links=profile_links
+            )
+            modules.append(
+                (module, filename, Counter(row.state for row in rows))
+            )
+        digests['index.html'] = self._write_page(
+            'index.html',
+            self._get_template('index_template.html'),
+            old_digest=old_digests.get('index.html', None),
+            modules=modules,
+            total=Counter(row.state for row in report.rows),
+            states=list(ScoreStates)
+        )
+
+        with open(digests_path, 'w') as out_file:
+            json.dump(digests, out_file)
+        self._remove_stale_pages(digests)
         shutil.copyfile(
             self.css_path, os.path.join(self.save_dirname, 'theme.css')
         )
 
-    def _render_template(self, score_sheet):
-        header, table, states = score_sheet.create_table()
-        return self.template.render(header=header, table=table, states=states)
+    def _remove_stale_pages(self, digests):
+        """
+        Remove the pages of modules and profiles which were written for a
+        previous report, and are not in the given digests.
+        """
+        for filename in os.listdir(self.save_dirname):
+            if filename in digests or not filename.endswith('.html'):
+                continue
+            if filename.startswith(('module_', 'profile_')):
+                with suppress(OSError):
+                    os.remove(os.path.join(self.save_dirname, filename))
+
+    def _write_page(self, filename, template, *, old_digest, **context):
+        """
+        Render the template to the given file by streaming it, unless the
+        content of the page did not change. Returns the digest of the page.
+        """
+        digest = _get_digest(template, context)
+        path = os.path.join(self.save_dirname, filename)
+        if digest != old_digest or not os.path.isfile(path):
+            with open(path, 'w') as html_file:
+                template.stream(**context).dump(html_file)
+        return digest
+
+
+def _get_page_filename(name, prefix='module_'):
+    """
+    Get the filename of the HTML page for a given test module, or another
+    page with the given prefix.
+    """
+    return prefix + re.sub(r'[^\w.-]', '_', name) + '.html'
+
+
+def _get_digest(template, context):
+    """
+    Get a digest of the content of a page, computed from its template and
+    context.
+    """
+    hasher = hashlib.sha1()
+    with open(template.filename, 'rb') as in_file:
+        hasher.update(in_file.read())
+    for key, value in sorted(context.items()):
+        hasher.update(key.encode())
+        if isinstance(value, list):
+            for item in value:
+                hasher.update(repr(item).encode())
+        else:
+            hasher.update(repr(value).encode())
+    return hasher.hexdigest()
 
 
 class TerminalScoreReporter:
@@ -92,15 +423,18 @@ class TerminalScoreReporter:
         self.config = config
         self._tw = _pytest.config.create_terminal_writer(config, file)
 
-    def _write_report(self, score_sheet):
+    def _write_report(self, report):
         """
         Write the score report to the terminal.
         """
-        header, table, states = score_sheet.create_table()
-        table_str = [[str(val) for val in line] for line in table]
-
-        lengths = ((len(val) for val in line) for line in [header] + table_str)
-        lengths_max = [max(vals) for vals in zip(*lengths)]
+        rows = report.filter_rows(
+            mode=self.config.option.score_report,
+            top=self.config.option.score_report_top
+        )
+        if len(rows) == len(report.rows):
+            lengths_max = report.widths
+        else:
+            lengths_max = report.column_widths(rows)
         widths = [l + 4 for l in lengths_max]
         width_total = sum(widths)
 
@@ -110,7 +444,7 @@ class TerminalScoreReporter:
         self._tw.line()
         self._tw.sep(sepchar='=', title='Score Sheet')
         self._tw.line()
-        self._tw.line(format_str.format(*header))
+        self._tw.line(format_str.format(*report.header))
         self._tw.line('-' * width_total)
 
         markup_lookup = {
@@ -122,15 +456,21 @@ class TerminalScoreReporter:
                 'bold': True
             }
         }
-        for line, state in zip(table_str, states):
+        for row in rows:
+            self._tw.line(
+                format_str.format(*row.strings),
+                **markup_lookup.get(row.state, {})
+            )
+        if len(rows) < len(report.rows):
+            self._tw.line('-' * width_total)
             self._tw.line(
-                format_str.format(*line), **markup_lookup.get(state, {})
+                '{} of {} scores shown.'.format(len(rows), len(report.rows))
             )
         self._tw.line('=' * width_total)
 
-    def pytest_sessionfinish(self, session):
+    def pytest_score_report(self, session, report):  # pylint: disable=unused-argument
         """
-        Method which is called pytest at the end of the session.
+        Method which is called with the score report at the end of the
+        session.
         """
-        if hasattr(session, '_score_sheet_instance'):
-            self._write_report(session._score_sheet_instance)  # pylint: disable=protected-access
+        self._write_report(report)
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+
+# © 2015-2018, ETH Zurich, Institut für Theoretische Physik
+# Author: Dominik Gresch <greschd@gmx.ch>
+"""
+Defines the store for the profiles which are captured by ``score.profile``,
+the pass in which they are captured, and the comparison of the functions
+which take the most time.
+"""
+
+import os
+import gzip
+import json
+import shutil
+import hashlib
+from contextlib import contextmanager
+
+import pytest
+
+from ._locking import file_lock, atomic_write
+
+PROFILE_VERSION = 2
+# number of functions with the largest own time which are kept per profile
+MAX_FUNCTIONS = 100
+
+
+class ProfileStore:
+    """
+    Stores the profiles of each test and tag in a compressed JSON file in a
+    directory next to the save file. Only the profiles of the last
+    ``max_runs`` runs are kept, together with the recorded values.
+    """
+
+    def __init__(self, save_file, *, max_runs=5):
+        self.save_dir = get_profile_dir(save_file)
+        self.max_runs = max_runs
+
+    def wipe(self):
+        """
+        Delete the stored profiles.
+        """
+        shutil.rmtree(self.save_dir, ignore_errors=True)
+
+    def add(self, name, *, run, value, profiler):
+        """
+        Add the profile of the given ``cProfile.Profile`` for the score with
+        the given name, which is of the form ``test_name:tag``, in the given
+        run. The profile replaces a previous profile of the same run.
+        """
+        entry = {
+            'run': run,
+            'value': value,
+            'functions': get_function_stats(profiler)
+        }
+        os.makedirs(self.save_dir, exist_ok=True)
+        with file_lock(os.path.join(self.save_dir, 'profiles')):
+            entries = [entry] + [
+                old_entry for old_entry in self.load(name)
+                if run - self.max_runs < old_entry['run'] < run
+            ]
+            with atomic_write(self._get_path(name), mode='wb') as out_file:
+                out_file.write(
+                    gzip.compress(
+                        json.dumps({
+                            'version': PROFILE_VERSION,
+                            'entries': entries
+                        }).encode('utf-8')
+                    )
+                )
+
+    def load(self, name):
+        """
+        Load the profiles of the score with the given name, starting with the
+        most recent run.
+        """
+        try:
+            with open(self._get_path(name), 'rb') as in_file:
+                data = json.loads(gzip.decompress(in_file.read()).decode())
+        except (IOError, EOFError, ValueError):
+            return []
+        if data.get('version', None) != PROFILE_VERSION:
+            return []
+        return data['entries']
+
+    def get_diff(self, name, *, top=20):
+        """
+        Compare the most recent profile of the given score to the profile of
+        its best previous value. Returns None if there are not two profiles.
+        """
+        entries = self.load(name)
+        if len(entries) < 2:
+            return None
+        best = min(entries[1:], key=lambda entry: entry['value'])
+        return diff_profiles(
+            best['functions'], entries[0]['functions'], top=top
+        )
+
+    def _get_path(self, name):
+        """
+        Get the path of the profile file for the given score.
+        """
+        digest = hashlib.sha1(name.encode('utf-8')).hexdigest()
+        return os.path.join(self.save_dir, digest + '.json.gz')
+
+
+class ProfileRunner:
+    """
+    Captures the profiles of the blocks of ``score.profile`` in a separate
+    pass, such that the recorded times do not include the overhead of the
+    profiler. The call of a passing test which timed such a block is run
+    once more with the profiler enabled, and no scores are recorded in this
+    pass.
+    """
+
+    def __init__(self, save_file, *, max_runs=5):
+        self._save_file = save_file
+        self._max_runs = max_runs
+        self._profiles = None
+        self._values = {}
+        self._profilers = None
+        self._depth = 0
+
+    @property
+    def profiles(self):
+        """
+        The store of the profiles, which is created when it is first used.
+        """
+        if self._profiles is None:
+            self._profiles = ProfileStore(
+                self._save_file, max_runs=self._max_runs
+            )
+        return self._profiles
+
+    def has_profiles(self):
+        """
+        Whether profiles were stored in this or a previous session.
+        """
+        return os.path.isdir(get_profile_dir(self._save_file))
+
+    @property
+    def profiling(self):
+        """
+        Whether the profiling pass of a test is running.
+        """
+        return self._profilers is not None
+
+    def add_value(self, item, name, *, run, value):
+        """
+        Add the value of a profiled score which the given test item recorded
+        in the given run, such that its block is profiled after the call of
+        the test.
+        """
+        self._values.setdefault(item.nodeid, {})[name] = (run, value)
+
+    @contextmanager
+    def profile(self, name):
+        """
+        Profile the block of the score with the given name in the profiling
+        pass.
+        """
+        profiler = self._profilers.get(name, None)
+        if profiler is None:
+            import cProfile
+            profiler = self._profilers[name] = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+
+    @pytest.hookimpl(hookwrapper=True, tryfirst=True)
+    def pytest_runtest_call(self, item):
+        """
+        Runs the profiling pass of a passing test which timed a profiled
+        block. Calls which are nested, for example to confirm a regression,
+        are profiled together with the outermost call.
+        """
+        self._depth += 1
+        outcome = yield
+        self._depth -= 1
+        if self._depth:
+            return
+        values = self._values.pop(item.nodeid, {})
+        if outcome.excinfo is not None or not values:
+            return
+        self._profilers = {}
+        try:
+            item.ihook.pytest_runtest_call(item=item)
+        finally:
+            profilers, self._profilers = self._profilers, None
+        for name, profiler in profilers.items():
+            run, value = values[name]
+            self.profiles.add(name, run=run, value=value, profiler=profiler)
+
+
+def get_profile_dir(save_file):
+    """
+    Get the directory of the profiles which belong to the given save file.
+    """
+    return save_file + '.profiles'
+
+
+def get_function_stats(profiler):
+    """
+    Get the number of calls, own time and cumulative time of the functions
+    with the largest own time in the given ``cProfile.Profile``.
+    """
+    profiler.create_stats()
+    functions = {
+        '{}:{}({})'.format(*key): [ncalls, tottime, cumtime]
+        for key, (_, ncalls, tottime, cumtime, _) in profiler.stats.items()
+    }
+    top_functions = sorted(
+        functions, key=lambda func: functions[func][1], reverse=True
+    )
+    return {func: functions[func] for func in top_functions[:MAX_FUNCTIONS]}
+
+
+def diff_profiles(best, current, *, top=20):
+    """
+    Compare the function statistics of two profiles. Returns the ``top``
+    functions with the largest increase of their own time, as tuples
+    ``(function, best_time, current_time, change)``.
+    """
+    res = []
+    for func in set(best) | set(current):
+        best_time = best.get(func, [0, 0., 0.])[1]
+        current_time = current.get(func, [0, 0., 0.])[1]
+        res.append((func, best_time, current_time, current_time - best_time))
+    res.sort(key=lambda row: row[3], reverse=True)
+    return res[:top]
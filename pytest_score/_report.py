@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+
+# © 2015-2018, ETH Zurich, Institut für Theoretische Physik
+# Author: Dominik Gresch <greschd@gmx.ch>
+"""
+Defines the report model which is shared between the score reporters.
+"""
+
+from collections import namedtuple, OrderedDict
+
+from fsc.export import export
+
+from ._score import ScoreStates
+
+
+@export
+class ScoreRow(
+    namedtuple(
+        'ScoreRow',
+        ['name', 'current', 'last', 'best', 'state', 'change', 'strings']
+    )
+):
+    """
+    A single row of the score report. The ``change`` is the relative change
+    of the current versus the best value, which is positive if the score
+    became better and ``None`` if it is unknown. The ``strings`` contain the
+    string forms of the name and values.
+    """
+    __slots__ = ()
+
+
+@export
+class ScoreReport:
+    """
+    Contains the rows of the score report, with the string forms and column
+    widths precomputed.
+    """
+
+    def __init__(self, header, rows):
+        self.header = tuple(header)
+        self.rows = list(rows)
+        self.widths = self.column_widths(self.rows)
+
+    @classmethod
+    def from_score_sheet(cls, score_sheet):
+        """
+        Create the report for a given score sheet.
+        """
+        header, table, states = score_sheet.create_table()
+        return cls(
+            header=header,
+            rows=(
+                ScoreRow(
+                    *line,
+                    state=state,
+                    change=_get_change(line[1], line[3], state),
+                    strings=tuple(str(val) for val in line)
+                ) for line, state in zip(table, states)
+            )
+        )
+
+    def column_widths(self, rows):
+        """
+        Get the width of each column needed to show the header and the given
+        rows.
+        """
+        columns = zip(self.header, *(row.strings for row in rows))
+        return [max(len(val) for val in column) for column in columns]
+
+    def group_by_module(self):
+        """
+        Group the rows by the module of their test, and return a dictionary
+        mapping the module names to the rows.
+        """
+        res = OrderedDict()
+        for row in self.rows:
+            res.setdefault(row.name.split('/', 1)[0], []).append(row)
+        return res
+
+    def filter_rows(self, *, mode='all', top=None):
+        """
+        Select the rows of the report. The ``mode`` can be 'all', 'changed'
+        to show only rows which became better or worse, or 'worse'. If
+        ``top`` is given, only the rows with the ``top`` largest changes are
+        selected, starting with the worst.
+        """
+        if mode == 'all':
+            rows = self.rows
+        elif mode == 'changed':
+            rows = [
+                row for row in self.rows
+                if row.state in (ScoreStates.BETTER, ScoreStates.WORSE)
+            ]
+        elif mode == 'worse':
+            rows = [row for row in self.rows if row.state == ScoreStates.WORSE]
+        else:
+            raise ValueError("Invalid filter mode '{}'.".format(mode))
+        if top is not None:
+            rows = sorted((row for row in rows if row.change is not None),
+                          key=_change_key) + [
+                              row for row in rows if row.change is None
+                          ]
+            rows = rows[:top]
+        return rows
+
+
+def get_score_report(session):
+    """
+    Get the score report for the given session. The report is created only
+    once, and shared between all reporters.
+    """
+    try:
+        return session._score_report  # pylint: disable=protected-access
+    except AttributeError:
+        session._score_report = ScoreReport.from_score_sheet(  # pylint: disable=protected-access
+            session._score_sheet_instance  # pylint: disable=protected-access
+        )
+        return session._score_report  # pylint: disable=protected-access
+
+
+def _change_key(row):
+    """
+    Sort key which orders the rows with the worst changes first, followed by
+    the best changes.
+    """
+    if row.change < 0:
+        return (0, row.change)
+    return (1, -row.change)
+
+
+def _get_change(current, best, state):
+    """
+    Get the relative change of the current versus the best value. Changes
+    within the noise are reported as zero.
+    """
+    if state == ScoreStates.UNKNOWN:
+        return None
+    if best == current or state == ScoreStates.NOISE:
+        return 0.
+    if best == 0:
+        change = float('inf')
+    else:
+        change = abs((current - best) / best)
+    return -change if state == ScoreStates.WORSE else change
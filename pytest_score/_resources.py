@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+# © 2015-2018, ETH Zurich, Institut für Theoretische Physik
+# Author: Dominik Gresch <greschd@gmx.ch>
+"""
+Defines the automatic scoring of the wall time, CPU time and peak memory of
+every test, which does not need any changes in the tests.
+"""
+
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import pytest
+
+from ._score import Evaluator, MEASURED_SIGNIFICANCE
+from ._scorer import Scorer
+
+DURATION_TAG = '@duration'
+CPU_TIME_TAG = '@cpu_time'
+MEMORY_TAG = '@memory'
+RESERVED_TAGS = (DURATION_TAG, CPU_TIME_TAG, MEMORY_TAG)
+
+
+class ResourceScorer:
+    """
+    Records the wall and CPU time in seconds of the call of each test if
+    ``durations`` is set, and the peak memory in bytes allocated by it if
+    ``memory`` is set. The scores are recorded under the reserved tags only
+    for tests which pass, and are evaluated such that less is better. Changes
+    of the times are only reported if they are significant at the level
+    ``MEASURED_SIGNIFICANCE``, while the memory is not noise-aware. Tests
+    which are not in a module, such as doctests, are not scored. Tracing the
+    memory slows down the call, so the plugin does not record the durations
+    and the memory in the same session.
+    """
+
+    def __init__(self, *, durations=False, memory=False):
+        self.durations = durations
+        self.memory = memory
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_call(self, item):
+        """
+        Measures the resources used by the call of a test.
+        """
+        request = getattr(item, '_request', None)
+        if request is None or getattr(item, 'module', None) is None:
+            yield
+            return
+        score_sheet = request.getfixturevalue('score_sheet')
+        with _trace_memory(self.memory) as memory:
+            start_time = time.perf_counter()
+            start_cpu_time = time.process_time()
+            outcome = yield
+            cpu_time = time.process_time() - start_cpu_time
+            duration = time.perf_counter() - start_time
+        if outcome.excinfo is not None:
+            return
+
+        scorer = Scorer(request, score_sheet)
+        if self.durations:
+            time_evaluator = Evaluator(
+                less_is_better=True, significance=MEASURED_SIGNIFICANCE
+            )
+            scorer._add_samples(  # pylint: disable=protected-access
+                values=[duration], tag=DURATION_TAG, evaluator=time_evaluator
+            )
+            scorer._add_samples(  # pylint: disable=protected-access
+                values=[cpu_time], tag=CPU_TIME_TAG, evaluator=time_evaluator
+            )
+        if self.memory:
+            scorer._add_samples(  # pylint: disable=protected-access
+                values=[memory['peak']],
+                tag=MEMORY_TAG,
+                evaluator=Evaluator(less_is_better=True)
+            )
+
+
+@contextmanager
+def _trace_memory(enabled):
+    """
+    Trace the memory allocations if ``enabled`` is set. The peak of the
+    allocated memory, relative to the start, is set in the yielded dict on
+    exiting.
+    """
+    res = {}
+    if not enabled:
+        yield res
+        return
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start()
+    elif hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.reset_peak()
+    start, _ = tracemalloc.get_traced_memory()
+    try:
+        yield res
+    finally:
+        _, peak = tracemalloc.get_traced_memory()
+        res['peak'] = max(peak - start, 0)
+        if not was_tracing:
+            tracemalloc.stop()
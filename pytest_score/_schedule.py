@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+# © 2015-2018, ETH Zurich, Institut für Theoretische Physik
+# Author: Dominik Gresch <greschd@gmx.ch>
+"""
+Defines the scheduling of the tests from the scores of previous runs, which
+orders the longest tests first or the tests which regressed first.
+"""
+
+import heapq
+from collections import Counter
+
+import pytest
+
+from ._score import ScoreStates
+from ._scorer import get_item_name
+from ._resources import DURATION_TAG
+
+ORDERS = ('none', 'duration', 'regressed')
+
+
+def get_test_stats(score_sheet):
+    """
+    Get the most recent duration of each test, and the number of scores of
+    each test which became worse in the last run.
+    """
+    durations = {}
+    regressions = Counter()
+    for test_name, tag, score_result in score_sheet.scores():
+        if tag == DURATION_TAG:
+            duration = score_result.current
+            if duration is None:
+                duration = score_result.last
+            if duration is not None:
+                durations[test_name] = duration
+        if score_result.run != score_sheet.run:
+            continue
+        if score_result.get_state() == ScoreStates.WORSE:
+            regressions[test_name] += 1
+    return durations, regressions
+
+
+def order_items(items, *, order, durations, regressions):
+    """
+    Re-order the test items in place. The 'duration' order runs the longest
+    tests first, starting with the tests whose duration is unknown. The
+    'regressed' order runs the tests with the most scores which became
+    worse first. Otherwise, the order of the items is kept.
+    """
+    names = [_get_name(item) for item in items]
+    if order == 'duration':
+        keys = [-durations.get(name, float('inf')) for name in names]
+    elif order == 'regressed':
+        keys = [-regressions[name] for name in names]
+    else:
+        return
+    indices = sorted(range(len(items)), key=keys.__getitem__)
+    items[:] = [items[idx] for idx in indices]
+
+
+def assign_groups(items, *, durations, num_groups):
+    """
+    Distribute the test items over ``num_groups`` pytest-xdist groups with
+    balanced total durations, by adding the longest remaining test to the
+    group with the smallest total duration. The duration of tests which
+    were not timed is estimated as the mean duration. Items which already
+    have a group are not changed.
+    """
+    item_durations = [durations.get(_get_name(item)) for item in items]
+    known = [val for val in item_durations if val is not None]
+    default_duration = sum(known) / len(known) if known else 1.
+    item_durations = [
+        default_duration if val is None else val for val in item_durations
+    ]
+    groups = [(0., idx) for idx in range(num_groups)]
+    for idx in sorted(range(len(items)), key=lambda row: -item_durations[row]):
+        item = items[idx]
+        if item.get_closest_marker('xdist_group') is not None:
+            continue
+        total, group = heapq.heappop(groups)
+        item.add_marker(
+            pytest.mark.xdist_group(name='pytest_score_{}'.format(group))
+        )
+        heapq.heappush(groups, (total + item_durations[idx], group))
+
+
+def _get_name(item):
+    """
+    Get the test name of a test item, or None if it is not in a module.
+    """
+    if getattr(item, 'module', None) is None:
+        return None
+    return get_item_name(item)
@@ -6,74 +6,249 @@
 Defines the container classes for storing the state of the scores.
 """
 
+import numbers
 import warnings
 import operator
+import statistics
 from enum import Enum
 from types import MappingProxyType
 from collections import deque
 
+from ._stats import SampleStats, check_statistic
+
+# default significance level of the scores which are measured by the plugin,
+# such as times, since their values are noisy
+MEASURED_SIGNIFICANCE = 0.05
+
 
 class ScoreSheet:
     """
     Container for the state of all scores.
     """
 
-    def __init__(self, *, history_length=5, scores=MappingProxyType({})):
+    def __init__(
+        self, *, history_length=5, scores=MappingProxyType({}), run=0
+    ):
         self._scores = dict(scores)
         self._history_lenght = history_length
+        self._run = run
 
     def to_dict(self):
-        return {'scores': self._scores, 'history_length': self._history_lenght}
+        return {
+            'scores': self._scores,
+            'history_length': self._history_lenght,
+            'run': self._run
+        }
 
     @classmethod
     def from_dict(cls, input_dict):
         return cls(
             scores=input_dict['scores'],
-            history_length=input_dict['history_length']
+            history_length=input_dict['history_length'],
+            run=input_dict.get('run', 0)
         )
 
+    @property
+    def run(self):
+        """
+        The number of the current scoring run.
+        """
+        return self._run
+
     def rotate(self):
         """
-        Prepare the score sheet for a new scoring run.
+        Prepare the score sheet for a new scoring run. The score results are
+        rotated lazily, when they are first accessed in the new run.
         """
-        for test_name_result in self._scores.values():
-            for tag_result in test_name_result.values():
-                tag_result.rotate()
+        self._run += 1
 
     def add_score(self, value, *, test_name, tag, evaluator):
         """
-        Add a value for a given test.
+        Add a value for a given test, and return the score result.
+        """
+        return self.add_samples(
+            values=[value], test_name=test_name, tag=tag, evaluator=evaluator
+        )
+
+    def add_samples(self, values, *, test_name, tag, evaluator):
+        """
+        Add several values for a given test, and return the score result.
+        The cutoff is checked once all values are added.
+        """
+        score_result = self._get_score_result(
+            test_name=test_name, tag=tag, evaluator=evaluator
+        )
+        score_result.add_samples(values)
+        return score_result
+
+    def add_many(self, values, *, test_name, tags, evaluator):
+        """
+        Add one value for each of the given tags of a test, which all use
+        the same evaluator, and return the score results. The cutoffs are
+        not checked.
+        """
+        score_results = self._get_score_results(
+            test_name=test_name, tags=tags, evaluator=evaluator
+        )
+        for score_result, value in zip(score_results, values):
+            score_result._add_sample(value)  # pylint: disable=protected-access
+        return score_results
+
+    def merge_score(self, value, *, test_name, tag, evaluator):
+        """
+        Set the current value for a given test, without checking the cutoff.
+        This is used to merge scores which were already checked elsewhere,
+        for example by a pytest-xdist worker.
+        """
+        self._get_score_result(
+            test_name=test_name, tag=tag, evaluator=evaluator
+        ).current = value
+
+    def merge_new_scores(self, other):
+        """
+        Merge the scores which were added in the current run of another score
+        sheet into the current run of this score sheet.
+        """
+        for test_name, tag, score_result in other.new_scores():
+            merged_result = self._get_score_result(
+                test_name=test_name, tag=tag, evaluator=score_result.evaluator
+            )
+            merged_result.current = score_result.current
+            merged_result.samples = score_result.samples
+
+    def scores(self):
+        """
+        Iterate over all scores, as ``(test_name, tag, score_result)``
+        tuples.
+        """
+        for test_name, test_name_result in self._scores.items():
+            for tag, tag_result in test_name_result.items():
+                yield test_name, tag, tag_result
+
+    def new_scores(self):
+        """
+        Iterate over the scores which were added in the current run, as
+        ``(test_name, tag, score_result)`` tuples.
+        """
+        for test_name, test_name_result in self._scores.items():
+            for tag, tag_result in test_name_result.items():
+                if tag_result.run == self._run and tag_result.current is not None:
+                    yield test_name, tag, tag_result
+
+    def _get_score_result(self, *, test_name, tag, evaluator):
+        """
+        Get the result for a given test and tag, creating it if needed, and
+        rotate it to the current run.
+        """
+        score_result = self._setdefault_score_result(
+            test_name=test_name, tag=tag, evaluator=evaluator
+        )
+        _update_evaluator(
+            score_result, evaluator, test_name=test_name, tag=tag
+        )
+        score_result.rotate_to(self._run)
+        return score_result
+
+    def _get_score_results(self, *, test_name, tags, evaluator):
+        """
+        Get the results for several tags of a given test, creating them if
+        needed, and rotate them to the current run.
+        """
+        test_name_result = self._scores.setdefault(test_name, {})
+        res = []
+        for tag in tags:
+            score_result = test_name_result.get(tag, None)
+            if score_result is None:
+                score_result = ScoreResult(
+                    evaluator=evaluator, history_length=self._history_lenght
+                )
+                test_name_result[tag] = score_result
+            else:
+                _update_evaluator(
+                    score_result, evaluator, test_name=test_name, tag=tag
+                )
+            score_result.rotate_to(self._run)
+            res.append(score_result)
+        return res
+
+    def _setdefault_score_result(self, *, test_name, tag, evaluator):
+        """
+        Get the result for a given test and tag, creating it with the given
+        evaluator if it does not exist.
         """
         self._scores.setdefault(test_name, {})
         self._scores[test_name].setdefault(
-            tag, ScoreResult(evaluator=evaluator)
-        )
-        score_result = self._scores[test_name][tag]
-        if score_result.evaluator != evaluator:
-            warnings.warn(
-                "Evaluator for score {}:{} changed.".format(test_name, tag)
+            tag,
+            ScoreResult(
+                evaluator=evaluator, history_length=self._history_lenght
             )
-            score_result.evaluator = evaluator
-        score_result.add_score(value)
+        )
+        return self._scores[test_name][tag]
 
     def create_table(self):
         """
         Create the table and states of the score sheet.
         """
+        from ._batch import evaluate_states, to_float_array
         header = ('Test name', 'Current', 'Last', 'Best')
-        states = []
         res = []
+        tag_results = []
         for test_name, test_name_result in self._scores.items():
             for tag, tag_result in test_name_result.items():
-                res.append((
-                    test_name + ':' + tag,
-                    tag_result.current,
-                    tag_result.last,
-                    tag_result.best,
-                ))
-                states.append(tag_result.get_state())
+                current, last, best = tag_result.get_values(self._run)
+                res.append((test_name + ':' + tag, current, last, best))
+                tag_results.append(tag_result)
+        states = evaluate_states(
+            current=to_float_array([line[1] for line in res]),
+            best=to_float_array([line[3] for line in res]),
+            less_is_better=[
+                tag_result.evaluator.less_is_better
+                for tag_result in tag_results
+            ],
+            **self._get_noise_arrays(tag_results)
+        )
         return header, res, states
 
+    def _get_noise_arrays(self, tag_results):
+        """
+        Get the arguments of ``evaluate_states`` which are needed to evaluate
+        the states of the noise-aware scores. The history is only used for
+        the scores of the current run.
+        """
+        import numpy as np
+        from ._batch import to_float_array
+        significance = [
+            tag_result.evaluator.significance for tag_result in tag_results
+        ]
+        if all(val is None for val in significance):
+            return {}
+        history = np.full((len(tag_results), self._history_lenght), np.nan)
+        sample_error = np.zeros(len(tag_results))
+        for row, tag_result in enumerate(tag_results):
+            if tag_result.run != self._run:
+                continue
+            row_history = to_float_array(tag_result.to_dict()['history'])
+            row_history = row_history[:self._history_lenght]
+            history[row, :len(row_history)] = row_history
+            if tag_result.samples is not None:
+                sample_error[row] = tag_result.samples.std_error
+        return dict(
+            significance=to_float_array(significance),
+            history=history,
+            sample_error=sample_error
+        )
+
+
+def _update_evaluator(score_result, evaluator, *, test_name, tag):
+    """
+    Set the evaluator of a score result, and warn if it changed.
+    """
+    if score_result.evaluator != evaluator:
+        warnings.warn(
+            "Evaluator for score {}:{} changed.".format(test_name, tag)
+        )
+        score_result.evaluator = evaluator
+
 
 class ScoreResult:
     """
@@ -83,6 +258,8 @@ class ScoreResult:
     def __init__(self, *, evaluator, history_length=5):
         self.best = None
         self.current = None
+        self.samples = None
+        self.run = 0
         self.evaluator = evaluator
         self._history = deque([], maxlen=history_length)
 
@@ -90,13 +267,18 @@ class ScoreResult:
         """
         Deconstruct the object into a dictionary.
         """
-        return dict(
+        res = dict(
             best=self.best,
             current=self.current,
+            run=self.run,
             history=list(self._history),
             history_length=self._history.maxlen,
             evaluator=self.evaluator
         )
+        # a single sample is the current value itself
+        if self.samples is not None and self.samples.count > 1:
+            res['samples'] = self.samples
+        return res
 
     @classmethod
     def from_dict(cls, input_dict):
@@ -109,7 +291,9 @@ class ScoreResult:
         )
         res._history.extend(input_dict['history'])  # pylint: disable=protected-access
         res.current = input_dict['current']
+        res.run = input_dict.get('run', 0)
         res.best = input_dict['best']
+        res.samples = input_dict.get('samples', None)
         return res
 
     @property
@@ -122,13 +306,86 @@ class ScoreResult:
         except IndexError:
             return None
 
+    @property
+    def precision(self):
+        """
+        The relative error of the mean of the samples of the current run, or
+        None if the current value is not sampled.
+        """
+        if self.samples is None:
+            return None
+        return self.samples.relative_error
+
     def add_score(self, value):
         """
-        Add the given value to the score.
+        Add the given value to the score. Real numbers can be added several
+        times, in which case the current value is the statistic of the
+        samples which is selected by the evaluator.
+        """
+        self.add_samples([value])
+
+    def add_samples(self, values):
+        """
+        Add several values to the score. The cutoff is checked once all
+        values are added.
+        """
+        for value in values:
+            self._add_sample(value)
+        self.evaluator.assert_sufficient(
+            self.current, best=self.best, history=list(self._history)
+        )
+
+    def get_relative_cutoff(self):
+        """
+        Get the absolute value of the relative cutoff of the evaluator, or
+        None if there is no relative cutoff.
+        """
+        return self.evaluator.get_relative_cutoff(
+            best=self.best, history=list(self._history)
+        )
+
+    def _add_sample(self, value):
+        """
+        Add a single value to the score, without checking the cutoff. The
+        statistics of the samples are only created when a second real number
+        is added.
+        """
+        if self.current is None:
+            self.current = value
+            return
+        assert isinstance(value, numbers.Real) and isinstance(
+            self.current, numbers.Real
+        ), "Cannot assign a score for the same test and tag twice."
+        if self.samples is None:
+            self.samples = SampleStats()
+            self.samples.add(self.current)
+        self.samples.add(value)
+        self.current = self.samples.get(self.evaluator.statistic)
+
+    def get_values(self, run):
+        """
+        Get the current, last and best values as seen from the given run,
+        without rotating the result.
+        """
+        if self.run == run:
+            return self.current, self.last, self.best
+        if self.current is None:
+            return None, self.last, self.best
+        return None, self.current, self.evaluator.evaluate_best([
+            self.current, self.best, *self._history
+        ])
+
+    def rotate_to(self, run):
+        """
+        Lazily rotate the result to the given run. The current value is only
+        moved to the history if it is set, such that runs in which the test
+        was not scored do not evict the history.
         """
-        assert self.current is None, "Cannot assign a score for the same test and tag twice."
-        self.current = value
-        self.evaluator.assert_sufficient(value)
+        if self.run == run:
+            return
+        if self.current is not None:
+            self.rotate()
+        self.run = run
 
     def rotate(self):
         """
@@ -143,6 +400,7 @@ class ScoreResult:
         """
         self._history.appendleft(self.current)
         self.current = None
+        self.samples = None
 
     def evaluate_best(self):
         """
@@ -156,18 +414,55 @@ class ScoreResult:
         """
         Get the state of the score.
         """
-        return self.evaluator.get_state(current=self.current, best=self.best)
+        return self.evaluator.get_state(
+            current=self.current,
+            best=self.best,
+            history=list(self._history),
+            samples=self.samples
+        )
+
+
+_CUTOFF_REFERENCES = ('best', 'median', 'last')
 
 
 class Evaluator:
     """
     Contains the logic that evaluates score values, for example checking which
     is the best value, and whether a given value meets the cutoff criterion.
+    If a ``significance`` level is given, changes of the score which are
+    within the noise of its history are not reported as better or worse.
+
+    Besides the absolute ``cutoff``, a ``relative_cutoff`` can be given as
+    the fraction by which a value may be worse than a reference value. The
+    ``cutoff_reference`` is either the 'best' value, the 'median' of the
+    history, or the 'last' value.
     """
 
-    def __init__(self, *, less_is_better=False, cutoff=None):
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        *,
+        less_is_better=False,
+        cutoff=None,
+        statistic='mean',
+        significance=None,
+        relative_cutoff=None,
+        cutoff_reference='best'
+    ):
+        check_statistic(statistic)
+        if significance is not None and not 0 < significance < 1:
+            raise ValueError(
+                'Invalid significance level {}.'.format(significance)
+            )
+        if cutoff_reference not in _CUTOFF_REFERENCES:
+            raise ValueError(
+                "Invalid cutoff reference '{}'.".format(cutoff_reference)
+            )
         self.less_is_better = less_is_better
         self.cutoff = cutoff
+        self.relative_cutoff = relative_cutoff
+        self.cutoff_reference = cutoff_reference
+        self.statistic = statistic
+        self.significance = significance
         self.better_than_op = operator.lt if self.less_is_better else operator.gt
         self.better_than_or_eqal_op = operator.le if self.less_is_better else operator.ge
 
@@ -178,6 +473,14 @@ class Evaluator:
         res = {'less_is_better': self.less_is_better}
         if self.cutoff is not None:
             res['cutoff'] = self.cutoff
+        if self.statistic != 'mean':
+            res['statistic'] = self.statistic
+        if self.significance is not None:
+            res['significance'] = self.significance
+        if self.relative_cutoff is not None:
+            res['relative_cutoff'] = self.relative_cutoff
+        if self.cutoff_reference != 'best':
+            res['cutoff_reference'] = self.cutoff_reference
         return res
 
     @classmethod
@@ -188,6 +491,10 @@ class Evaluator:
         return cls(
             less_is_better=input_dict['less_is_better'],
             cutoff=input_dict.get('cutoff', None),
+            statistic=input_dict.get('statistic', 'mean'),
+            significance=input_dict.get('significance', None),
+            relative_cutoff=input_dict.get('relative_cutoff', None),
+            cutoff_reference=input_dict.get('cutoff_reference', 'best')
         )
 
     def evaluate_best(self, values):
@@ -201,21 +508,80 @@ class Evaluator:
             return min(values_not_none)
         return max(values_not_none)
 
-    def assert_sufficient(self, value):
+    def assert_sufficient(self, value, *, best=None, history=()):
         """
         Check if the value is sufficient, and raise an AssertionError if it doesn't.
+        The best and history values are used for the relative cutoff.
         """
         if self.cutoff is not None:
             assert self.better_than_or_eqal_op(value, self.cutoff)
+        relative_cutoff = self.get_relative_cutoff(best=best, history=history)
+        if relative_cutoff is not None:
+            assert self.better_than_or_eqal_op(value, relative_cutoff), (
+                'Score {} does not meet the cutoff {}, which is {:.1%} worse '
+                'than the {} value.'.format(
+                    value, relative_cutoff, self.relative_cutoff,
+                    self.cutoff_reference
+                )
+            )
+
+    def get_relative_cutoff(self, *, best=None, history=()):
+        """
+        Get the absolute value of the relative cutoff, given the best value
+        and the history starting with the most recent value. Returns None if
+        there is no relative cutoff, or no reference value.
+        """
+        if self.relative_cutoff is None:
+            return None
+        if self.cutoff_reference == 'best':
+            values = [best]
+        elif self.cutoff_reference == 'last':
+            values = list(history)[:1]
+        else:
+            values = list(history)
+        values = [val for val in values if isinstance(val, numbers.Real)]
+        if not values:
+            return None
+        reference = statistics.median(values)
+        margin = self.relative_cutoff * abs(reference)
+        if self.less_is_better:
+            return reference + margin
+        return reference - margin
 
     def __eq__(self, other):
-        return (self.less_is_better == other.less_is_better
-                ) and (self.cutoff == other.cutoff)
+        return self._key() == other._key()  # pylint: disable=protected-access
+
+    def __hash__(self):
+        return hash(self._key())
 
-    def get_state(self, current, best):
+    def _key(self):
         """
-        Evaluate the state of the score, given the current and best values.
+        The parameters which determine whether two evaluators are equal.
+        """
+        return (
+            self.less_is_better, self.cutoff, self.statistic,
+            self.significance, self.relative_cutoff, self.cutoff_reference
+        )
+
+    def get_state(self, current, best, *, history=(), samples=None):
         """
+        Evaluate the state of the score, given the current and best values.
+        If the evaluator has a significance level, the history values and
+        the samples of the current value are used to estimate the noise.
+        """
+        if self.significance is not None and isinstance(
+            current, numbers.Real
+        ) and isinstance(best, numbers.Real):
+            from ._batch import evaluate_states, to_float_array
+            state, = evaluate_states(
+                current=[current],
+                best=[best],
+                less_is_better=[self.less_is_better],
+                significance=[self.significance],
+                history=[to_float_array(history)],
+                sample_error=[0. if samples is None else samples.std_error]
+            )
+            return state
         try:
             if self.better_than_op(current, best):
                 return ScoreStates.BETTER
@@ -234,3 +600,4 @@ class ScoreStates(Enum):
     UNCHANGED = 'unchanged'
     BETTER = 'better'
     WORSE = 'worse'
+    NOISE = 'noise'
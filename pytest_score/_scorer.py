@@ -0,0 +1,357 @@
+# -*- coding: utf-8 -*-
+
+# © 2015-2018, ETH Zurich, Institut für Theoretische Physik
+# Author: Dominik Gresch <greschd@gmx.ch>
+"""
+Defines the object which is returned by the ``score`` fixture.
+"""
+
+from time import perf_counter
+from contextlib import contextmanager
+
+from fsc.export import export
+
+from ._score import Evaluator, ScoreResult, MEASURED_SIGNIFICANCE
+from ._stats import sample_adaptively
+from ._timing import measure_time
+
+
+@export
+class Scorer:
+    """
+    Records the scores of a single test. Calling the scorer records a value;
+    the methods record values which are measured by the plugin.
+    """
+
+    def __init__(self, request, score_sheet):
+        self._request = request
+        self._score_sheet = score_sheet
+
+    def __call__(  # pylint: disable=too-many-arguments
+        self,
+        value,
+        less_is_better=False,
+        cutoff=None,
+        tag='',
+        statistic='mean',
+        significance=None,
+        relative_cutoff=None,
+        cutoff_reference='best'
+    ):
+        """
+        Record a value of the score. A numeric score can be recorded several
+        times with the same tag, in which case the given ``statistic`` of
+        the samples is used as its value. If a ``significance`` level is
+        given, changes within the noise of the score are not reported as
+        better or worse; by default, every change is reported. The ``relative_cutoff`` is the fraction by which
+        the value may be worse than the ``cutoff_reference``, which is the
+        'best' value, the 'median' of the history or the 'last' value.
+        """
+        _check_tag(tag)
+        evaluator = Evaluator(
+            less_is_better=less_is_better,
+            cutoff=cutoff,
+            statistic=statistic,
+            significance=significance,
+            relative_cutoff=relative_cutoff,
+            cutoff_reference=cutoff_reference
+        )
+        return self._add_samples(values=[value], tag=tag, evaluator=evaluator)
+
+    def time(  # pylint: disable=too-many-arguments
+        self,
+        func,
+        *,
+        tag='',
+        cutoff=None,
+        relative_cutoff=None,
+        cutoff_reference='best',
+        statistic='median',
+        rounds=5,
+        warmup=1,
+        round_duration=0.05,
+        disable_gc=False,
+        precision=None,
+        max_time=10.,
+        significance=MEASURED_SIGNIFICANCE
+    ):
+        """
+        Measure the time of a call of ``func`` in seconds, and record it as
+        a score where less is better. The time of each of the ``rounds``
+        rounds is recorded as a sample. The number of calls per round is
+        calibrated such that a round takes at least ``round_duration``
+        seconds, after ``warmup`` calls which are not timed. If
+        ``disable_gc`` is set, the garbage collector is disabled while
+        timing. If a ``precision`` is given, rounds are added until the
+        relative error of the mean time is at most ``precision``, or the
+        rounds took ``max_time`` seconds. Changes of the time are reported
+        as better or worse only if they are significant at the given
+        ``significance`` level, which is ``MEASURED_SIGNIFICANCE`` (0.05)
+        by default. The ``relative_cutoff`` and
+        ``cutoff_reference`` are used as in ``__call__``. Returns the
+        recorded value.
+        """
+        _check_tag(tag)
+        times = measure_time(
+            func,
+            rounds=rounds,
+            warmup=warmup,
+            round_duration=round_duration,
+            disable_gc=disable_gc,
+            precision=precision,
+            max_time=max_time
+        )
+        evaluator = Evaluator(
+            less_is_better=True,
+            cutoff=cutoff,
+            statistic=statistic,
+            significance=significance,
+            relative_cutoff=relative_cutoff,
+            cutoff_reference=cutoff_reference
+        )
+        return self._add_samples(values=times, tag=tag, evaluator=evaluator)
+
+    def sample(  # pylint: disable=too-many-arguments
+        self,
+        func,
+        *,
+        tag='',
+        less_is_better=False,
+        cutoff=None,
+        relative_cutoff=None,
+        cutoff_reference='best',
+        statistic='mean',
+        precision=0.05,
+        min_samples=5,
+        max_time=10.,
+        significance=MEASURED_SIGNIFICANCE
+    ):
+        """
+        Record the values returned by ``func`` as samples of the score,
+        until the relative error of their mean is at most ``precision``, or
+        sampling took ``max_time`` seconds. Changes of the score are
+        reported as better or worse only if they are significant at the
+        given ``significance`` level, which is ``MEASURED_SIGNIFICANCE``
+        (0.05) by default. The ``relative_cutoff`` and
+        ``cutoff_reference`` are used as in ``__call__``. Returns the
+        recorded value.
+        """
+        _check_tag(tag)
+        values = sample_adaptively(
+            func,
+            precision=precision,
+            max_time=max_time,
+            min_samples=min_samples
+        )
+        evaluator = Evaluator(
+            less_is_better=less_is_better,
+            cutoff=cutoff,
+            statistic=statistic,
+            significance=significance,
+            relative_cutoff=relative_cutoff,
+            cutoff_reference=cutoff_reference
+        )
+        return self._add_samples(values=values, tag=tag, evaluator=evaluator)
+
+    @contextmanager
+    def profile(  # pylint: disable=too-many-arguments
+        self,
+        *,
+        tag='',
+        cutoff=None,
+        relative_cutoff=None,
+        cutoff_reference='best',
+        significance=MEASURED_SIGNIFICANCE
+    ):
+        """
+        Context manager which measures the time of its block in seconds,
+        and records it as a score where less is better. The block is
+        profiled with cProfile when the test is run again in a separate
+        pass, and the profile is stored such that the report can compare it
+        to the profile of the best previous run. The other arguments are
+        used as in ``time``.
+        """
+        _check_tag(tag)
+        name = get_test_name(self._request) + ':' + tag
+        runner = getattr(self._request.config, '_score_profile_runner', None)
+        if runner is not None and runner.profiling:
+            with runner.profile(name):
+                yield
+            return
+        start = perf_counter()
+        yield
+        duration = perf_counter() - start
+        evaluator = Evaluator(
+            less_is_better=True,
+            cutoff=cutoff,
+            statistic='mean',
+            significance=significance,
+            relative_cutoff=relative_cutoff,
+            cutoff_reference=cutoff_reference
+        )
+        value = self._add_samples(
+            values=[duration], tag=tag, evaluator=evaluator
+        )
+        if runner is not None:
+            runner.add_value(
+                self._request.node,
+                name,
+                run=self._score_sheet.run,
+                value=value
+            )
+
+    def many(  # pylint: disable=too-many-arguments
+        self,
+        values,
+        *,
+        tags=None,
+        less_is_better=False,
+        cutoff=None,
+        statistic='mean',
+        significance=None,
+        relative_cutoff=None,
+        cutoff_reference='best'
+    ):
+        """
+        Record a batch of scores of the test, which all use the same
+        evaluator. The ``values`` are either a mapping from the tags to the
+        values, or a sequence or array of values with the corresponding
+        ``tags``. The other arguments are used as in ``__call__``. The
+        cutoffs are checked once all values are recorded, and a single
+        AssertionError lists all tags which do not meet them. Returns the
+        list of recorded values.
+        """
+        if tags is None:
+            tags = values.keys()
+            values = values.values()
+        elif hasattr(values, 'tolist'):
+            values = values.tolist()
+        tags = list(tags)
+        values = list(values)
+        if len(tags) != len(values):
+            raise ValueError(
+                'Got {} values for {} tags.'.format(len(values), len(tags))
+            )
+        for tag in tags:
+            _check_tag(tag)
+        if self._is_profiling():
+            return values
+        evaluator = Evaluator(
+            less_is_better=less_is_better,
+            cutoff=cutoff,
+            statistic=statistic,
+            significance=significance,
+            relative_cutoff=relative_cutoff,
+            cutoff_reference=cutoff_reference
+        )
+        test_name = get_test_name(self._request)
+        score_results = self._score_sheet.add_many(
+            values, test_name=test_name, tags=tags, evaluator=evaluator
+        )
+        for tag, score_result in zip(tags, score_results):
+            self._record(
+                score_result,
+                test_name=test_name,
+                tag=tag,
+                evaluator=evaluator
+            )
+        res = [score_result.current for score_result in score_results]
+        if cutoff is not None or relative_cutoff is not None:
+            _assert_sufficient_many(
+                res, score_results, tags=tags, evaluator=evaluator
+            )
+        return res
+
+    def _add_samples(self, values, *, tag, evaluator):
+        """
+        Add the values to the score sheet and the checkpoint, and return the
+        current value of the score.
+        """
+        if self._is_profiling():
+            # the scores are only recorded when the test is timed
+            score_result = ScoreResult(evaluator=evaluator)
+            score_result.add_samples(values)
+            return score_result.current
+        test_name = get_test_name(self._request)
+        score_result = self._score_sheet.add_samples(
+            values, test_name=test_name, tag=tag, evaluator=evaluator
+        )
+        self._record(
+            score_result, test_name=test_name, tag=tag, evaluator=evaluator
+        )
+        return score_result.current
+
+    def _is_profiling(self):
+        """
+        Whether the test is run in the pass which profiles its blocks.
+        """
+        runner = getattr(self._request.config, '_score_profile_runner', None)
+        return runner is not None and runner.profiling
+
+    def _record(self, score_result, *, test_name, tag, evaluator):
+        """
+        Add a score result which was updated to the checkpoint, and to the
+        confirmation of regressions.
+        """
+        checkpoint = getattr(self._request.session, '_score_checkpoint', None)
+        if checkpoint is not None:
+            checkpoint.add_score(
+                score_result.current,
+                test_name=test_name,
+                tag=tag,
+                evaluator=evaluator
+            )
+        confirmer = getattr(self._request.config, '_score_confirmer', None)
+        if confirmer is not None:
+            confirmer.add_result(self._request.node, tag, score_result)
+
+
+def _assert_sufficient_many(values, score_results, *, tags, evaluator):
+    """
+    Check the cutoffs of several values with the same evaluator at once,
+    and raise a single AssertionError listing the tags whose values do not
+    meet them.
+    """
+    from ._batch import find_insufficient
+    relative_cutoffs = None
+    if evaluator.relative_cutoff is not None:
+        relative_cutoffs = [
+            score_result.get_relative_cutoff()
+            for score_result in score_results
+        ]
+    insufficient = find_insufficient(
+        values,
+        less_is_better=evaluator.less_is_better,
+        cutoff=evaluator.cutoff,
+        relative_cutoffs=relative_cutoffs
+    )
+    failures = ', '.join(
+        '{}={}'.format(tags[idx], values[idx]) for idx in insufficient
+    )
+    assert not insufficient, '{} scores do not meet the cutoff: {}'.format(
+        len(insufficient), failures
+    )
+
+
+def get_test_name(request):
+    """
+    Returns a unique identifier for a given test.
+    """
+    return get_item_name(request.node)
+
+
+def get_item_name(item):
+    """
+    Returns the unique identifier of the test of a given test item.
+    """
+    return item.module.__name__ + '/' + item.name
+
+
+def _check_tag(tag):
+    """
+    Raise a ValueError if the tag is reserved for the scores which are
+    recorded automatically by the plugin.
+    """
+    from ._resources import RESERVED_TAGS
+    if tag in RESERVED_TAGS:
+        raise ValueError("The tag '{}' is reserved.".format(tag))
@@ -6,16 +6,17 @@
 Defines the function to serialize and deserialize pytest-score objects to JSON.
 """
 
+import sys
 import numbers
 from functools import singledispatch
 
-import numpy as np
-
 from ._score import ScoreSheet, ScoreResult, Evaluator
+from ._stats import SampleStats
 
 SCORE_SHEET_KEY = '_score_sheet'
 SCORE_RESULT_KEY = '_score_result'
 EVALUATOR_KEY = '_evaluator'
+SAMPLE_STATS_KEY = '_sample_stats'
 
 
 @singledispatch
@@ -23,14 +24,14 @@ def encode(obj):
     """
     Serializes pytest-score objects to JSON-compatible format.
     """
+    # NumPy is not imported here to keep the plugin import fast. If it is not
+    # imported already, the object cannot be a NumPy bool.
+    numpy = sys.modules.get('numpy', None)
+    if numpy is not None and isinstance(obj, numpy.bool_):
+        return bool(obj)
     raise TypeError('cannot JSONify {} object {}'.format(type(obj), obj))
 
 
-@encode.register(np.bool_)
-def _(obj):
-    return bool(obj)
-
-
 @encode.register(numbers.Integral)
 def _(obj):
     return int(obj)
@@ -56,6 +57,11 @@ def _(obj):
     return {EVALUATOR_KEY: obj.to_dict()}
 
 
+@encode.register(SampleStats)
+def _(obj):
+    return {SAMPLE_STATS_KEY: obj.to_dict()}
+
+
 def _decode_score_sheet(obj):
     return ScoreSheet.from_dict(obj)
 
@@ -68,10 +74,15 @@ def _decode_evaluator(obj):
     return Evaluator.from_dict(obj)
 
 
+def _decode_sample_stats(obj):
+    return SampleStats.from_dict(obj)
+
+
 _DECODE_LOOKUP = {
     SCORE_SHEET_KEY: _decode_score_sheet,
     SCORE_RESULT_KEY: _decode_score_result,
     EVALUATOR_KEY: _decode_evaluator,
+    SAMPLE_STATS_KEY: _decode_sample_stats,
 }
 
 
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+
+# © 2015-2018, ETH Zurich, Institut für Theoretische Physik
+# Author: Dominik Gresch <greschd@gmx.ch>
+"""
+Defines a score sheet which is backed by an SQLite database. The database
+contains the full history of all scores, and the score results are only
+loaded when they are needed.
+"""
+
+import os
+import json
+import sqlite3
+from contextlib import suppress
+
+from ._score import ScoreSheet, ScoreResult
+from ._serialize import encode, decode
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT
+);
+CREATE TABLE IF NOT EXISTS evaluators (
+    test_name TEXT NOT NULL,
+    tag TEXT NOT NULL,
+    evaluator TEXT NOT NULL,
+    PRIMARY KEY (test_name, tag)
+);
+CREATE TABLE IF NOT EXISTS scores (
+    test_name TEXT NOT NULL,
+    tag TEXT NOT NULL,
+    run_id INTEGER NOT NULL,
+    value,
+    PRIMARY KEY (test_name, tag, run_id)
+);
+CREATE INDEX IF NOT EXISTS scores_run_id ON scores (run_id);
+"""
+
+
+class SQLiteScoreSheet(ScoreSheet):
+    """
+    Score sheet which loads the score results from an SQLite database when
+    they are first accessed. The run of the session is numbered when it is
+    committed, such that concurrent sessions are stored as separate runs.
+    """
+
+    def __init__(self, connection, *, history_length=5):
+        self._connection = connection
+        self._connection.executescript(_SCHEMA)
+        run, = self._connection.execute(
+            'SELECT COALESCE(MAX(run_id), 0) FROM runs'
+        ).fetchone()
+        super().__init__(history_length=history_length, run=run)
+        self._loaded_all = False
+
+    def to_dict(self):
+        raise TypeError('Cannot convert an SQLiteScoreSheet to a dictionary.')
+
+    def create_table(self):
+        self._load_all()
+        return super().create_table()
+
+    def scores(self):
+        self._load_all()
+        return super().scores()
+
+    def commit(self):
+        """
+        Write the scores of the current run to the database, as a new run.
+        """
+        new_scores = list(self.new_scores())
+        with self._connection:
+            run_id = self._connection.execute(
+                'INSERT INTO runs DEFAULT VALUES'
+            ).lastrowid
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO evaluators (test_name, tag, evaluator) '
+                'VALUES (?, ?, ?)', [(
+                    test_name, tag,
+                    json.dumps(score_result.evaluator, default=encode)
+                ) for test_name, tag, score_result in new_scores]
+            )
+            self._connection.executemany(
+                'INSERT INTO scores (test_name, tag, run_id, value) '
+                'VALUES (?, ?, ?, ?)',
+                [(test_name, tag, run_id, _to_sql(score_result.current))
+                 for test_name, tag, score_result in new_scores]
+            )
+
+    def _setdefault_score_result(self, *, test_name, tag, evaluator):
+        self._load_cached(test_name, tag)
+        return super()._setdefault_score_result(
+            test_name=test_name, tag=tag, evaluator=evaluator
+        )
+
+    def close(self):
+        """
+        Load the remaining score results, and close the connection to the
+        database. The score sheet can still be read afterwards.
+        """
+        self._load_all()
+        self._connection.close()
+
+    def _load_all(self):
+        """
+        Load all score results which are stored in the database.
+        """
+        if self._loaded_all:
+            return
+        score_results = self._load_score_results()
+        for test_name, tag in sorted(score_results):
+            test_scores = self._scores.setdefault(test_name, {})
+            test_scores.setdefault(tag, score_results[test_name, tag])
+        self._loaded_all = True
+
+    def _load_cached(self, test_name, tag):
+        """
+        Load the score result for the given test and tag, if it is not
+        already loaded.
+        """
+        if self._loaded_all or tag in self._scores.get(test_name, {}):
+            return
+        score_results = self._load_score_results(
+            'WHERE test_name = ? AND tag = ?', (test_name, tag)
+        )
+        for score_result in score_results.values():
+            self._scores.setdefault(test_name, {})[tag] = score_result
+
+    def _load_score_results(self, condition='', parameters=()):
+        """
+        Create the score results of the tests and tags which match the given
+        condition from the database, using one query each for the
+        evaluators, the recent values and the best values.
+        """
+        score_results = {}
+        for test_name, tag, evaluator in self._connection.execute(
+            'SELECT test_name, tag, evaluator FROM evaluators ' + condition,
+            parameters
+        ):
+            score_results[test_name, tag] = ScoreResult(
+                evaluator=json.loads(evaluator, object_hook=decode),
+                history_length=self._history_lenght
+            )
+        for test_name, tag, run_id, value, position in self._connection.execute(
+            'SELECT test_name, tag, run_id, value, position FROM ('
+            'SELECT *, ROW_NUMBER() OVER ('
+            'PARTITION BY test_name, tag ORDER BY run_id DESC'
+            ') AS position FROM scores ' + condition +
+            ') WHERE position <= ? ORDER BY position',
+            parameters + (self._history_lenght + 1, )
+        ):
+            score_result = score_results.get((test_name, tag))
+            if score_result is None:
+                continue
+            if position == 1:
+                score_result.run = run_id
+                score_result.current = value
+            else:
+                score_result._history.append(value)  # pylint: disable=protected-access
+        for test_name, tag, min_value, max_value in self._connection.execute(
+            'SELECT test_name, tag, MIN(value), MAX(value) FROM scores '
+            'JOIN (SELECT test_name, tag, MAX(run_id) AS last_run FROM scores '
+            + condition + ' GROUP BY test_name, tag) USING (test_name, tag) '
+            'WHERE run_id < last_run GROUP BY test_name, tag', parameters
+        ):
+            score_result = score_results.get((test_name, tag))
+            if score_result is None:
+                continue
+            if score_result.evaluator.less_is_better:
+                score_result.best = min_value
+            else:
+                score_result.best = max_value
+        return score_results
+
+
+class SQLiteStore:
+    """
+    Stores the scores in an SQLite database.
+    """
+
+    def __init__(self, save_file):
+        self.save_file = save_file + '.sqlite'
+
+    def wipe(self):
+        """
+        Delete the stored scores.
+        """
+        with suppress(IOError):
+            os.remove(self.save_file)
+
+    def load(self, module_names=None):  # pylint: disable=unused-argument
+        """
+        Open the score sheet connected to the database.
+        """
+        return SQLiteScoreSheet(sqlite3.connect(self.save_file))
+
+    def save(self, score_sheet):  # pylint: disable=no-self-use
+        """
+        Write the scores of the current run to the database, and close the
+        connection.
+        """
+        score_sheet.commit()
+        score_sheet.close()
+
+
+def _to_sql(value):
+    """
+    Convert a score value to a type which can be stored in SQLite.
+    """
+    if isinstance(value, (int, float, str)):
+        return value
+    return encode(value)
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+
+# © 2015-2018, ETH Zurich, Institut für Theoretische Physik
+# Author: Dominik Gresch <greschd@gmx.ch>
+"""
+Defines the streaming statistics of scores which are sampled several times
+in a single run.
+"""
+
+import re
+import math
+import random
+from time import perf_counter
+
+_QUANTILE_REGEX = re.compile(r'^p(\d{1,2}(\.\d+)?)$')
+
+# two-sided 95% quantiles of the Student t distribution, by degrees of freedom
+_T_QUANTILES = [
+    12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+    2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+    2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042
+]
+_NORMAL_QUANTILE = 1.960
+
+
+class SampleStats:
+    """
+    Streaming statistics of the samples of a score. The mean and variance
+    are updated with Welford's algorithm, and the quantiles are estimated
+    from a reservoir of at most ``reservoir_size`` samples, such that the
+    memory use does not depend on the number of samples.
+    """
+
+    def __init__(self, *, reservoir_size=100):
+        self.reservoir_size = reservoir_size
+        self.count = 0
+        self.mean = 0.
+        self.min = None
+        self.max = None
+        self.reservoir = []
+        self._m2 = 0.
+
+    def to_dict(self):
+        """
+        Deconstruct the object into a dictionary.
+        """
+        return dict(
+            reservoir_size=self.reservoir_size,
+            count=self.count,
+            mean=self.mean,
+            m2=self._m2,
+            min=self.min,
+            max=self.max,
+            reservoir=list(self.reservoir)
+        )
+
+    @classmethod
+    def from_dict(cls, input_dict):
+        """
+        Reconstruct the object from a dictionary.
+        """
+        res = cls(reservoir_size=input_dict['reservoir_size'])
+        res.count = input_dict['count']
+        res.mean = input_dict['mean']
+        res._m2 = input_dict['m2']  # pylint: disable=protected-access
+        res.min = input_dict['min']
+        res.max = input_dict['max']
+        res.reservoir = list(input_dict['reservoir'])
+        return res
+
+    def add(self, value):
+        """
+        Add a sample.
+        """
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        if len(self.reservoir) < self.reservoir_size:
+            self.reservoir.append(value)
+        else:
+            idx = random.randrange(self.count)
+            if idx < self.reservoir_size:
+                self.reservoir[idx] = value
+
+    @property
+    def variance(self):
+        """
+        The sample variance, which is zero for less than two samples.
+        """
+        if self.count < 2:
+            return 0.
+        return self._m2 / (self.count - 1)
+
+    @property
+    def std(self):
+        """
+        The sample standard deviation.
+        """
+        return math.sqrt(self.variance)
+
+    @property
+    def std_error(self):
+        """
+        The standard error of the mean, which is zero for less than two
+        samples.
+        """
+        if self.count < 2:
+            return 0.
+        return self.std / math.sqrt(self.count)
+
+    @property
+    def relative_error(self):
+        """
+        The half-width of the 95% confidence interval of the mean, relative
+        to the mean. It is infinite for less than two samples or a zero mean.
+        """
+        if self.count < 2 or self.mean == 0:
+            return float('inf')
+        return t_quantile(self.count - 1) * self.std_error / abs(self.mean)
+
+    def quantile(self, fraction):
+        """
+        Estimate the given quantile, with linear interpolation between the
+        samples in the reservoir. The estimate is exact if the number of
+        samples does not exceed the reservoir size.
+        """
+        values = sorted(self.reservoir)
+        if not values:
+            return None
+        pos = fraction * (len(values) - 1)
+        lower = math.floor(pos)
+        upper = min(lower + 1, len(values) - 1)
+        return values[lower] + (pos - lower) * (values[upper] - values[lower])
+
+    def get(self, statistic):
+        """
+        Get the value of the given statistic, which can be 'mean', 'median',
+        'min', 'max', or a percentile such as 'p90'. A single sample is
+        returned unchanged for every statistic.
+        """
+        if self.count == 1:
+            return self.reservoir[0]
+        if statistic == 'mean':
+            return self.mean
+        if statistic == 'min':
+            return self.min
+        if statistic == 'max':
+            return self.max
+        if statistic == 'median':
+            return self.quantile(0.5)
+        return self.quantile(parse_percentile(statistic) / 100)
+
+
+def t_quantile(dof):
+    """
+    Get the two-sided 95% quantile of the Student t distribution with the
+    given degrees of freedom.
+    """
+    if dof <= len(_T_QUANTILES):
+        return _T_QUANTILES[dof - 1]
+    return _NORMAL_QUANTILE
+
+
+def normal_quantile(fraction):
+    """
+    Get the given quantile of the standard normal distribution, by
+    bisection of its cumulative distribution function.
+    """
+    lower, upper = -40., 40.
+    for _ in range(100):
+        middle = (lower + upper) / 2
+        if 1 + math.erf(middle / math.sqrt(2)) < 2 * fraction:
+            lower = middle
+        else:
+            upper = middle
+    return (lower + upper) / 2
+
+
+def sample_adaptively(
+    draw, *, precision, max_time, min_samples=5, max_samples=10000
+):
+    """
+    Draw samples by calling ``draw`` until the relative error of their mean
+    is at most ``precision``, or drawing took more than ``max_time``
+    seconds. Returns the samples.
+    """
+    stats = SampleStats(reservoir_size=0)
+    samples = []
+    start = perf_counter()
+    while len(samples) < max_samples:
+        value = draw()
+        samples.append(value)
+        stats.add(value)
+        if len(samples) < min_samples:
+            continue
+        if stats.relative_error <= precision:
+            break
+        if perf_counter() - start > max_time:
+            break
+    return samples
+
+
+def parse_percentile(statistic):
+    """
+    Get the percentile of a statistic of the form 'p90', or raise a
+    ValueError if the statistic is invalid.
+    """
+    match = _QUANTILE_REGEX.match(statistic)
+    if match is None:
+        raise ValueError("Invalid statistic '{}'.".format(statistic))
+    return float(match.group(1))
+
+
+def check_statistic(statistic):
+    """
+    Raise a ValueError if the given statistic is invalid.
+    """
+    if statistic not in ('mean', 'median', 'min', 'max'):
+        parse_percentile(statistic)
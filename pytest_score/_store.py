@@ -0,0 +1,460 @@
+# -*- coding: utf-8 -*-
+
+# © 2015-2018, ETH Zurich, Institut für Theoretische Physik
+# Author: Dominik Gresch <greschd@gmx.ch>
+"""
+Defines the stores which load and save the score sheet between sessions.
+"""
+
+import os
+import re
+import json
+import shutil
+import warnings
+from contextlib import contextmanager, suppress
+
+from ._score import ScoreSheet
+from ._serialize import encode, decode
+from ._formats import FORMATS, loads_score_sheet
+from ._locking import file_lock, atomic_write, get_fingerprint
+
+
+@contextmanager
+def store_score(store, wipe_scores, compact=False, module_names=None):
+    """
+    Initializes the ScoreSheet instance on entering and saves it on exiting.
+    If ``compact`` is set, the scores are kept in a CompactScoreSheet. If
+    ``module_names`` are given, stores may load only the scores of these
+    test modules.
+    """
+    if wipe_scores:
+        store.wipe()
+    score_sheet_instance = store.load(module_names=module_names)
+    if compact:
+        from ._compact import CompactScoreSheet
+        if not isinstance(score_sheet_instance, CompactScoreSheet):
+            score_sheet_instance = CompactScoreSheet.from_sheet(
+                score_sheet_instance
+            )
+
+    yield score_sheet_instance
+
+    store.save(score_sheet_instance)
+
+
+class JsonStore:
+    """
+    Stores the whole score sheet in a single file, which is re-written at
+    the end of each session. Files in any of the FORMATS can be read, and
+    are written in the given ``file_format``.
+    """
+
+    def __init__(self, save_file, *, file_format='columnar'):
+        self.save_file = save_file
+        self.file_format = FORMATS[file_format]
+        self._fingerprint = None
+
+    def wipe(self):
+        """
+        Delete the stored scores.
+        """
+        with suppress(IOError):
+            os.remove(self.save_file)
+
+    def load(self, module_names=None):  # pylint: disable=unused-argument
+        """
+        Load the stored score sheet.
+        """
+        self._fingerprint = get_fingerprint(self.save_file)
+        return self._read()
+
+    def save(self, score_sheet):
+        """
+        Save the score sheet. If the file was changed by another session
+        since it was loaded, the new scores are merged into it.
+        """
+        with file_lock(self.save_file):
+            if get_fingerprint(self.save_file) != self._fingerprint:
+                score_sheet = merge_session(self._read(), score_sheet)
+            self._write(score_sheet)
+
+    def _read(self):
+        """
+        Read the score sheet from the file. A corrupt file is moved aside,
+        and an empty score sheet is returned.
+        """
+        try:
+            with open(self.save_file, 'rb') as in_file:
+                score_sheet_instance = loads_score_sheet(in_file.read())
+        except IOError:
+            score_sheet_instance = ScoreSheet()
+        except (ValueError, KeyError):
+            backup_file = self.save_file + '.corrupt'
+            warnings.warn(
+                "Could not read the score file '{}', it is moved to '{}'.".
+                format(self.save_file, backup_file)
+            )
+            with suppress(OSError):
+                os.replace(self.save_file, backup_file)
+            score_sheet_instance = ScoreSheet()
+        if not isinstance(score_sheet_instance, ScoreSheet):
+            score_sheet_instance = ScoreSheet()
+        return score_sheet_instance
+
+    def _write(self, score_sheet):
+        """
+        Write the score sheet to the file atomically.
+        """
+        with atomic_write(self.save_file, mode='wb') as out_file:
+            out_file.write(self.file_format.dumps(score_sheet))
+
+
+class JournalStore(JsonStore):
+    """
+    Stores the score sheet as a JSON snapshot and a journal of the changes
+    made since the snapshot was written. Each session only appends its
+    rotation and new scores to the journal, and the journal is compacted
+    into the snapshot once it becomes longer than ``max_journal_length``.
+    """
+
+    def __init__(
+        self, save_file, *, max_journal_length=10000, file_format='columnar'
+    ):
+        super().__init__(save_file, file_format=file_format)
+        self.journal_file = save_file + '.journal'
+        self.max_journal_length = max_journal_length
+        self._journal_length = 0
+        self._journal_fingerprint = None
+
+    def wipe(self):
+        super().wipe()
+        with suppress(IOError):
+            os.remove(self.journal_file)
+
+    def load(self, module_names=None):
+        """
+        Load the snapshot, and replay the journal onto it.
+        """
+        self._journal_fingerprint = get_fingerprint(self.journal_file)
+        score_sheet_instance = super().load(module_names=module_names)
+        self._journal_length = self._replay_journal(score_sheet_instance)
+        return score_sheet_instance
+
+    def save(self, score_sheet):
+        """
+        Append the changes of the current session to the journal, and compact
+        it if needed.
+        """
+        records = list(create_records(score_sheet))
+        with file_lock(self.save_file):
+            if self._journal_length + len(records) > self.max_journal_length:
+                fingerprints = (
+                    get_fingerprint(self.save_file),
+                    get_fingerprint(self.journal_file)
+                )
+                if fingerprints != (
+                    self._fingerprint, self._journal_fingerprint
+                ):
+                    # the journal was changed by another session, so the
+                    # records are replayed onto the current state
+                    score_sheet = self._read()
+                    self._replay_journal(score_sheet)
+                    for record in records:
+                        replay_record(score_sheet, record)
+                self._write(score_sheet)
+                with suppress(IOError):
+                    os.remove(self.journal_file)
+                self._journal_length = 0
+                return
+            _truncate_partial_line(self.journal_file)
+            with open(self.journal_file, 'a') as out_file:
+                out_file.write(
+                    ''.join(
+                        json.dumps(record, default=encode) + '\n'
+                        for record in records
+                    )
+                )
+        self._journal_length += len(records)
+
+    def _replay_journal(self, score_sheet):
+        """
+        Replay the journal onto the given score sheet, and return the number
+        of records in the journal.
+        """
+        num_records = 0
+        try:
+            with open(self.journal_file, 'r') as in_file:
+                for line in in_file:
+                    try:
+                        record = json.loads(line, object_hook=decode)
+                    except json.decoder.JSONDecodeError:
+                        # skip a partially written record
+                        continue
+                    replay_record(score_sheet, record)
+                    num_records += 1
+        except IOError:
+            pass
+        return num_records
+
+
+def _truncate_partial_line(path, chunk_size=4096):
+    """
+    Remove a partially written last line from the given file, such that the
+    lines which are appended next are not joined to it.
+    """
+    try:
+        handle = open(path, 'rb+')
+    except IOError:
+        return
+    with handle:
+        end = handle.seek(0, os.SEEK_END)
+        if end == 0:
+            return
+        handle.seek(end - 1)
+        if handle.read(1) == b'\n':
+            return
+        pos = end
+        while pos > 0:
+            start = max(pos - chunk_size, 0)
+            handle.seek(start)
+            newline = handle.read(pos - start).rfind(b'\n')
+            if newline >= 0:
+                handle.truncate(start + newline + 1)
+                return
+            pos = start
+        handle.truncate(0)
+
+
+class ShardedStore:
+    """
+    Stores the scores in one JSON file per test module, in a directory next
+    to the save file. Only the shards of the given test modules are loaded,
+    and only the shards with new scores are re-written. A manifest contains
+    the current run and the number of scores in each shard.
+    """
+
+    def __init__(self, save_file, *, file_format='columnar'):
+        self.save_dir = save_file + '.d'
+        self.manifest_file = os.path.join(self.save_dir, 'manifest.json')
+        self.file_format = FORMATS[file_format]
+        self._history_length = 5
+        self._loaded_modules = set()
+        self._fingerprint = None
+
+    def wipe(self):
+        """
+        Delete the stored scores.
+        """
+        shutil.rmtree(self.save_dir, ignore_errors=True)
+
+    def read_manifest(self):
+        """
+        Read the manifest, which contains the current run and a mapping from
+        the module names to the shard filenames and number of scores.
+        """
+        try:
+            with open(self.manifest_file, 'r') as in_file:
+                return json.load(in_file)
+        except (IOError, json.decoder.JSONDecodeError):
+            return {'run': 0, 'history_length': 5, 'modules': {}}
+
+    def load(self, module_names=None):
+        """
+        Load the shards of the given modules, or all shards if no module
+        names are given.
+        """
+        self._fingerprint = get_fingerprint(self.manifest_file)
+        manifest = self.read_manifest()
+        self._history_length = manifest['history_length']
+        if module_names is None:
+            module_names = manifest['modules'].keys()
+        scores = {}
+        self._loaded_modules = set()
+        for module_name in module_names:
+            if module_name in manifest['modules']:
+                scores.update(self._load_shard(manifest, module_name))
+                self._loaded_modules.add(module_name)
+        return ScoreSheet(
+            scores=scores,
+            history_length=self._history_length,
+            run=manifest['run']
+        )
+
+    def save(self, score_sheet):
+        """
+        Re-write the shards of the modules with new scores, and update the
+        manifest. If the manifest was changed by another session since it
+        was loaded, the new scores are merged into the stored shards as a
+        new run.
+        """
+        os.makedirs(self.save_dir, exist_ok=True)
+        with file_lock(self.manifest_file):
+            self._save(score_sheet)
+
+    def _save(self, score_sheet):
+        """
+        Save the score sheet, while holding the lock.
+        """
+        manifest = self.read_manifest()
+        if get_fingerprint(self.manifest_file) == self._fingerprint:
+            run = score_sheet.run
+            loaded_modules = self._loaded_modules
+        else:
+            run = manifest['run'] + 1
+            loaded_modules = set()
+        new_scores = {}
+        for test_name, tag, score_result in score_sheet.new_scores():
+            new_scores.setdefault(_get_module_name(test_name),
+                                  []).append((test_name, tag, score_result))
+
+        all_scores = score_sheet.to_dict()['scores']
+        obsolete_files = []
+        for module_name, module_new_scores in new_scores.items():
+            if module_name in loaded_modules:
+                shard_scores = {
+                    test_name: test_name_result
+                    for test_name, test_name_result in all_scores.items()
+                    if _get_module_name(test_name) == module_name
+                }
+            else:
+                # the shard was not loaded, so the new scores are merged into
+                # the stored ones to keep their history
+                shard_scores = self._load_shard(manifest, module_name)
+            shard_sheet = ScoreSheet(
+                scores=shard_scores,
+                history_length=self._history_length,
+                run=run
+            )
+            if module_name not in loaded_modules:
+                for test_name, tag, score_result in module_new_scores:
+                    shard_sheet.merge_score(
+                        score_result.current,
+                        test_name=test_name,
+                        tag=tag,
+                        evaluator=score_result.evaluator
+                    )
+            filename = _get_shard_filename(
+                module_name, self.file_format.extension
+            )
+            shard_file = os.path.join(self.save_dir, filename)
+            with atomic_write(shard_file, mode='wb') as out_file:
+                out_file.write(self.file_format.dumps(shard_sheet))
+            old_entry = manifest['modules'].get(module_name, {})
+            old_filename = old_entry.get('file', filename)
+            if old_filename != filename:
+                # the shard was migrated to a different format
+                obsolete_files.append(old_filename)
+            manifest['modules'][module_name] = {
+                'file':
+                filename,
+                'num_scores':
+                sum(
+                    len(val)
+                    for val in shard_sheet.to_dict()['scores'].values()
+                )
+            }
+
+        manifest['run'] = run
+        manifest['history_length'] = self._history_length
+        with atomic_write(self.manifest_file) as out_file:
+            json.dump(manifest, out_file)
+        for filename in obsolete_files:
+            with suppress(OSError):
+                os.remove(os.path.join(self.save_dir, filename))
+
+    def _load_shard(self, manifest, module_name):
+        """
+        Load the scores of a single shard.
+        """
+        try:
+            filename = manifest['modules'][module_name]['file']
+            with open(os.path.join(self.save_dir, filename), 'rb') as in_file:
+                shard_sheet = loads_score_sheet(in_file.read())
+        except (IOError, ValueError, KeyError):
+            return {}
+        return shard_sheet.to_dict()['scores']
+
+
+def merge_session(stored_sheet, score_sheet):
+    """
+    Merge the scores of a session into a score sheet which was stored by
+    another session in the meantime. The scores are added as a new run.
+    """
+    stored_sheet.rotate()
+    stored_sheet.merge_new_scores(score_sheet)
+    return stored_sheet
+
+
+def _get_module_name(test_name):
+    """
+    Get the name of the module from the test name.
+    """
+    return test_name.split('/', 1)[0]
+
+
+def _get_shard_filename(module_name, extension):
+    """
+    Get the filename of the shard for a given test module.
+    """
+    return re.sub(r'[^\w.-]', '_', module_name) + extension
+
+
+def create_records(score_sheet):
+    """
+    Create the journal records for a session of the given score sheet: a
+    rotation, followed by the scores added in the session.
+    """
+    yield {'type': 'rotate'}
+    for test_name, tag, score_result in score_sheet.new_scores():
+        yield {
+            'type': 'score',
+            'test_name': test_name,
+            'tag': tag,
+            'value': score_result.current,
+            'evaluator': score_result.evaluator
+        }
+
+
+def replay_record(score_sheet, record):
+    """
+    Apply a journal record to the given score sheet.
+    """
+    if record['type'] == 'rotate':
+        score_sheet.rotate()
+    elif record['type'] == 'score':
+        score_sheet.merge_score(
+            record['value'],
+            test_name=record['test_name'],
+            tag=record['tag'],
+            evaluator=record['evaluator']
+        )
+    else:
+        raise ValueError(
+            "Invalid journal record type '{}'.".format(record['type'])
+        )
+
+
+def _sqlite_store(save_file, *, file_format=None):  # pylint: disable=unused-argument
+    """
+    Create the SQLite store, importing it only when it is used. The SQLite
+    store does not use the file formats.
+    """
+    from ._sqlite import SQLiteStore
+    return SQLiteStore(save_file)
+
+
+def _mmap_store(save_file, *, file_format=None):
+    """
+    Create the memory-mapped store, importing it only when it is used.
+    """
+    from ._mmap import MmapStore
+    return MmapStore(save_file, file_format=file_format)
+
+
+STORES = {
+    'json': JsonStore,
+    'journal': JournalStore,
+    'sqlite': _sqlite_store,
+    'sharded': ShardedStore,
+    'mmap': _mmap_store,
+}
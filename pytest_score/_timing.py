@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+# © 2015-2018, ETH Zurich, Institut für Theoretische Physik
+# Author: Dominik Gresch <greschd@gmx.ch>
+"""
+Defines the helpers which measure the run time of a function.
+"""
+
+import gc
+import math
+from time import perf_counter
+from contextlib import contextmanager
+
+from ._stats import sample_adaptively
+
+
+def measure_time(  # pylint: disable=too-many-arguments
+    func,
+    *,
+    rounds=5,
+    warmup=1,
+    round_duration=0.05,
+    disable_gc=False,
+    precision=None,
+    max_time=10.
+):
+    """
+    Measure the run time of a single call of ``func``. After ``warmup``
+    calls, the number of calls per round is calibrated such that a round
+    takes at least ``round_duration`` seconds. Returns the time per call of
+    each of the ``rounds`` rounds. If a ``precision`` is given, rounds are
+    added until the relative error of the mean time is at most
+    ``precision``, or the rounds took ``max_time`` seconds.
+    """
+    for _ in range(warmup):
+        func()
+    with _gc_disabled(disable_gc):
+        number = calibrate(func, round_duration)
+
+        def draw():
+            return time_calls(func, number) / number
+
+        if precision is None:
+            return [draw() for _ in range(rounds)]
+        return sample_adaptively(
+            draw, precision=precision, max_time=max_time, min_samples=rounds
+        )
+
+
+def calibrate(func, round_duration):
+    """
+    Get the number of calls of ``func`` which take at least
+    ``round_duration`` seconds.
+    """
+    number = 1
+    while True:
+        elapsed = time_calls(func, number)
+        if elapsed >= round_duration:
+            return number
+        if elapsed <= 0:
+            number *= 10
+        else:
+            estimate = math.ceil(number * round_duration / elapsed)
+            number = max(number + 1, min(estimate, 10 * number))
+
+
+def time_calls(func, number):
+    """
+    Get the time needed to call ``func`` the given number of times.
+    """
+    start = perf_counter()
+    for _ in range(number):
+        func()
+    return perf_counter() - start
+
+
+@contextmanager
+def _gc_disabled(disable_gc):
+    """
+    Disable the garbage collector if ``disable_gc`` is set, and restore its
+    state on exiting.
+    """
+    gc_enabled = gc.isenabled()
+    if disable_gc:
+        gc.disable()
+    try:
+        yield
+    finally:
+        if gc_enabled:
+            gc.enable()
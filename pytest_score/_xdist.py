@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+# © 2015-2018, ETH Zurich, Institut für Theoretische Physik
+# Author: Dominik Gresch <greschd@gmx.ch>
+"""
+Defines the support for running scored tests with pytest-xdist. The workers
+check the scores of their tests against the stored score sheet, and send the
+new scores to the controller which merges them into the stored score sheet.
+"""
+
+import json
+
+import pytest
+
+from ._score import ScoreSheet
+from ._serialize import encode, decode
+
+WORKER_OUTPUT_KEY = 'pytest_score_sheet'
+WORKER_CHECKPOINT_KEY = 'pytest_score_checkpoint'
+WORKER_SESSION_KEY = 'pytest_score_session'
+
+
+def is_xdist_worker(config):
+    """
+    Check if the pytest process is a pytest-xdist worker.
+    """
+    return hasattr(config, 'workerinput')
+
+
+def send_worker_scores(config, score_sheet):
+    """
+    Store the scores recorded on a worker in its output, which is sent to
+    the controller at the end of the session. Only the scores of the current
+    run are sent.
+    """
+    new_score_sheet = ScoreSheet(run=score_sheet.run)
+    new_score_sheet.merge_new_scores(score_sheet)
+    config.workeroutput[WORKER_OUTPUT_KEY] = json.dumps(
+        new_score_sheet, default=encode
+    )
+
+
+def send_worker_checkpoint(config, checkpoint_file):
+    """
+    Send the path of the checkpoint file written by a worker to the
+    controller, which removes it once the scores are stored.
+    """
+    if checkpoint_file is not None:
+        config.workeroutput[WORKER_CHECKPOINT_KEY] = checkpoint_file
+
+
+def get_worker_session_id(config):
+    """
+    Get the ID of the checkpoint session of the controller, or None if it
+    did not send one.
+    """
+    return config.workerinput.get(WORKER_SESSION_KEY, None)
+
+
+class XdistScoreController:
+    """
+    Collects the scores sent by the pytest-xdist workers, and merges them into
+    the stored score sheet at the end of the session. The checkpoints of the
+    workers are written for the checkpoint session of the controller.
+    """
+
+    def __init__(self, store_score, get_checkpoint_session):
+        self._store_score = store_score
+        self._get_checkpoint_session = get_checkpoint_session
+        self._worker_sheets = []
+
+    @pytest.hookimpl(optionalhook=True)
+    def pytest_configure_node(self, node):
+        """
+        Method which is called by pytest-xdist to configure a worker.
+        """
+        config = node.config
+        if config.option.score_checkpoint_interval > 0:
+            session_id = self._get_checkpoint_session(config).session_id
+            node.workerinput[WORKER_SESSION_KEY] = session_id
+
+    @pytest.hookimpl(optionalhook=True)
+    def pytest_testnodedown(self, node, error):  # pylint: disable=unused-argument
+        """
+        Method which is called by pytest-xdist when a worker has finished.
+        """
+        workeroutput = getattr(node, 'workeroutput', {})
+        if WORKER_CHECKPOINT_KEY in workeroutput:
+            self._get_checkpoint_session(node.config).add_checkpoint(
+                workeroutput[WORKER_CHECKPOINT_KEY]
+            )
+        if WORKER_OUTPUT_KEY in workeroutput:
+            self._worker_sheets.append(
+                json.loads(
+                    workeroutput[WORKER_OUTPUT_KEY], object_hook=decode
+                )
+            )
+
+    @pytest.hookimpl(tryfirst=True)
+    def pytest_sessionfinish(self, session):
+        """
+        Merges the worker scores into the stored score sheet before the
+        reporters run.
+        """
+        if not self._worker_sheets:
+            return
+        module_names = {
+            test_name.split('/', 1)[0]
+            for worker_sheet in self._worker_sheets
+            for test_name, _, _ in worker_sheet.new_scores()
+        }
+        with self._store_score(
+            session.config, module_names=module_names
+        ) as score_sheet_instance:
+            score_sheet_instance.rotate()
+            for worker_sheet in self._worker_sheets:
+                score_sheet_instance.merge_new_scores(worker_sheet)
+            session._score_sheet_instance = score_sheet_instance  # pylint: disable=protected-access
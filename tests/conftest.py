@@ -6,4 +6,8 @@
 Configuration file for pytest tests.
 """
 
+# NumPy cannot be imported again after the in-process pytester runs remove it
+# from the imported modules, so it is imported once for the whole session.
+import numpy  # pylint: disable=unused-import
+
 pytest_plugins = 'pytester'  # pylint: disable=invalid-name
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+# © 2015-2018, ETH Zurich, Institut für Theoretische Physik
+# Author: Dominik Gresch <greschd@gmx.ch>
+"""
+Tests for recovering the scores of sessions which did not finish.
+"""
+
+import pytest
+
+from pytest_score._score import ScoreSheet, Evaluator
+from pytest_score._store import JsonStore
+from pytest_score._checkpoint import (
+    CheckpointSession, CheckpointWriter, recover_checkpoints
+)
+
+
+def test_recover_checkpoint(testdir):
+    """
+    Check that the scores of a crashed session are recovered by the next
+    session.
+    """
+    testdir.makepyfile(
+        """
+        import os
+        import glob
+        import time
+
+        def test_a(score):
+            score(1, tag='a')
+
+        def test_b(score):
+            score(2, tag='b')
+
+        def test_crash():
+            # wait for the background thread to write the checkpoint
+            for _ in range(100):
+                checkpoints = glob.glob('.pytest-score.checkpoint.*')
+                if checkpoints and len(open(checkpoints[0]).readlines()) == 2:
+                    break
+                time.sleep(0.05)
+            os._exit(1)
+        """
+    )
+    testdir.runpytest_subprocess('--score-checkpoint-size', '1')
+    save_file = testdir.tmpdir.join('.pytest-score')
+    assert not save_file.check()
+    assert testdir.tmpdir.listdir('.pytest-score.checkpoint.*')
+
+    testdir.makepyfile('def test_nothing():\n    pass\n')
+    result = testdir.runpytest_subprocess()
+    result.assert_outcomes(passed=1)
+    result.stderr.fnmatch_lines(['*Recovered 2 scores*'])
+    assert not testdir.tmpdir.listdir('.pytest-score.checkpoint.*')
+    assert not testdir.tmpdir.listdir('.pytest-score.session.*')
+    _, table, _ = JsonStore(str(save_file)).load().create_table()
+    assert table == [('test_recover_checkpoint/test_a:a', 1, None, None),
+                     ('test_recover_checkpoint/test_b:b', 2, None, None)]
+
+
+def test_running_session(tmpdir):
+    """
+    Check that a checkpoint is not recovered while its session runs, even if
+    its writer is closed.
+    """
+    save_file = str(tmpdir.join('.pytest-score'))
+    session = CheckpointSession(save_file)
+    with CheckpointWriter(session.checkpoint_prefix) as checkpoint:
+        checkpoint.add_score(
+            1, test_name='test_a', tag='a', evaluator=Evaluator()
+        )
+    assert tmpdir.listdir('.pytest-score.checkpoint.*')
+
+    recover_checkpoints(save_file, lambda: JsonStore(save_file))
+    assert not tmpdir.join('.pytest-score').check()
+    assert tmpdir.listdir('.pytest-score.session.*')
+
+    session.close()
+    with pytest.warns(UserWarning, match='Recovered 1 scores'):
+        recover_checkpoints(save_file, lambda: JsonStore(save_file))
+    _, table, _ = JsonStore(save_file).load().create_table()
+    assert table == [('test_a:a', 1, None, None)]
+    assert not tmpdir.listdir('.pytest-score.checkpoint.*')
+
+
+class _FailingStore:
+    """
+    Store which cannot save the score sheet.
+    """
+
+    def load(self):  # pylint: disable=no-self-use
+        return ScoreSheet()
+
+    def save(self, score_sheet):  # pylint: disable=no-self-use,unused-argument
+        raise ValueError('cannot save')
+
+
+def test_recover_failure(tmpdir):
+    """
+    Check that the checkpoints are kept if their scores cannot be stored,
+    and that they are recovered later.
+    """
+    save_file = str(tmpdir.join('.pytest-score'))
+    session = CheckpointSession(save_file)
+    with CheckpointWriter(session.checkpoint_prefix) as checkpoint:
+        checkpoint.add_score(
+            1, test_name='test_a', tag='a', evaluator=Evaluator()
+        )
+    session.close()
+
+    with pytest.warns(UserWarning, match='Could not recover'):
+        recover_checkpoints(save_file, _FailingStore)
+    assert tmpdir.listdir('.pytest-score.checkpoint.*')
+
+    with pytest.warns(UserWarning, match='Recovered 1 scores'):
+        recover_checkpoints(save_file, lambda: JsonStore(save_file))
+    assert not tmpdir.listdir('.pytest-score.checkpoint.*')
+
+
+def test_unscored_session(testdir):
+    """
+    Check that a session which does not record scores leaves no files, and
+    that the file of a session which did not write a checkpoint is removed.
+    """
+    testdir.makepyfile(
+        """
+        def test_nothing():
+            pass
+        """
+    )
+    testdir.runpytest().assert_outcomes(passed=1)
+    assert not testdir.tmpdir.listdir('.pytest-score*')
+
+    testdir.tmpdir.join('.pytest-score.session.abc').write('')
+    testdir.runpytest().assert_outcomes(passed=1)
+    assert not testdir.tmpdir.listdir('.pytest-score.session.*')
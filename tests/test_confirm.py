@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+
+# © 2015-2018, ETH Zurich, Institut für Theoretische Physik
+# Author: Dominik Gresch <greschd@gmx.ch>
+"""
+Tests for the confirmation of regressions by re-running the tests.
+"""
+
+import pytest
+
+from pytest_score._score import ScoreStates
+from pytest_score._store import JsonStore
+
+
+def test_confirm_regressions(testdir):
+    """
+    Check that only the tests whose scores became worse are re-run, and that
+    the state is evaluated from the samples of all runs.
+    """
+    testdir.makepyfile(
+        """
+        import pytest
+
+        @pytest.mark.parametrize('name', ['flaky', 'regressed', 'unchanged'])
+        def test_score(score, name):
+            score(1., tag=name, less_is_better=True)
+        """
+    )
+    result = testdir.runpytest()
+    result.assert_outcomes(passed=3)
+
+    testdir.makepyfile(
+        """
+        import itertools
+
+        import pytest
+
+        calls = {'flaky': itertools.count(), 'regressed': itertools.count()}
+        values = {
+            'flaky': lambda call: 2. if call == 0 else 0.5,
+            'regressed': lambda call: 2.,
+        }
+
+        @pytest.mark.parametrize('name', ['flaky', 'regressed', 'unchanged'])
+        def test_score(score, name):
+            if name == 'unchanged':
+                score(1., tag=name, less_is_better=True)
+            else:
+                value = values[name](next(calls[name]))
+                score(value, tag=name, less_is_better=True)
+        """
+    )
+    result = testdir.runpytest('--score-confirm-regressions', '3')
+    result.assert_outcomes(passed=3)
+
+    score_sheet = JsonStore(str(testdir.tmpdir.join('.pytest-score'))).load()
+    _, table, states = score_sheet.create_table()
+    assert [line[0].split(':')[1]
+            for line in table] == ['flaky', 'regressed', 'unchanged']
+    assert states == [
+        ScoreStates.BETTER, ScoreStates.WORSE, ScoreStates.UNCHANGED
+    ]
+    samples = {
+        tag: score_result.samples
+        for _, tag, score_result in score_sheet.new_scores()
+    }
+    assert samples['flaky'].count == 4
+    assert samples['regressed'].count == 4
+    assert samples['unchanged'] is None
+
+
+def test_confirm_failure(testdir):
+    """
+    Check that a test fails if one of its re-runs fails.
+    """
+    testdir.makepyfile(
+        """
+        def test_score(score):
+            score(1., less_is_better=True)
+        """
+    )
+    testdir.runpytest().assert_outcomes(passed=1)
+
+    testdir.makepyfile(
+        """
+        import itertools
+
+        calls = itertools.count()
+
+        def test_score(score):
+            assert next(calls) < 2
+            score(2., less_is_better=True)
+        """
+    )
+    result = testdir.runpytest('--score-confirm-regressions', '3')
+    result.assert_outcomes(failed=1)
+
+
+@pytest.mark.parametrize('args', [[], ['--score-compact']])
+def test_confirm_non_numeric(testdir, args):
+    """
+    Check that a test which records a score that is not a number can be
+    re-run, and keeps the value of the last re-run.
+    """
+    testdir.makepyfile(
+        """
+        def test_score(score):
+            score(1., less_is_better=True)
+            score('first', tag='name')
+        """
+    )
+    testdir.runpytest(*args).assert_outcomes(passed=1)
+
+    testdir.makepyfile(
+        """
+        import itertools
+
+        calls = itertools.count()
+
+        def test_score(score):
+            score(2., less_is_better=True)
+            score('call {}'.format(next(calls)), tag='name')
+        """
+    )
+    result = testdir.runpytest('--score-confirm-regressions', '2', *args)
+    result.assert_outcomes(passed=1)
+
+    score_sheet = JsonStore(str(testdir.tmpdir.join('.pytest-score'))).load()
+    results = {
+        tag: score_result
+        for _, tag, score_result in score_sheet.new_scores()
+    }
+    assert results[''].samples.count == 3
+    assert results['name'].current == 'call 2'
+
+
+def test_confirm_xdist(testdir):
+    """
+    Check that the regressions are confirmed on pytest-xdist workers.
+    """
+    pytest.importorskip('xdist')
+    testdir.makepyfile(
+        """
+        def test_score(score):
+            score(1., less_is_better=True)
+        """
+    )
+    testdir.runpytest('-n', '1').assert_outcomes(passed=1)
+
+    testdir.makepyfile(
+        """
+        def test_score(score):
+            score(2., less_is_better=True)
+        """
+    )
+    result = testdir.runpytest('-n', '1', '--score-confirm-regressions', '3')
+    result.assert_outcomes(passed=1)
+
+    score_sheet = JsonStore(str(testdir.tmpdir.join('.pytest-score'))).load()
+    samples = [
+        score_result.samples.count
+        for _, _, score_result in score_sheet.new_scores()
+    ]
+    assert samples == [4]
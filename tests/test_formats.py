@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+# © 2015-2018, ETH Zurich, Institut für Theoretische Physik
+# Author: Dominik Gresch <greschd@gmx.ch>
+"""
+Tests for the file formats of the score sheet.
+"""
+
+import json
+
+import pytest
+
+from pytest_score._score import ScoreSheet, Evaluator
+from pytest_score._formats import FORMATS, loads_score_sheet
+from pytest_score._serialize import encode
+from pytest_score._store import JsonStore
+
+
+def _create_score_sheet():
+    """
+    Create a score sheet with a few runs.
+    """
+    score_sheet = ScoreSheet(history_length=3)
+    for i in range(4):
+        score_sheet.rotate()
+        score_sheet.add_score(
+            i, test_name='mod/test_a', tag='', evaluator=Evaluator()
+        )
+        score_sheet.add_score(
+            0.5 * i,
+            test_name='mod/test_a',
+            tag='time',
+            evaluator=Evaluator(less_is_better=True, cutoff=10.)
+        )
+        if i % 2:
+            score_sheet.add_score(
+                -i, test_name='mod/test_b', tag='', evaluator=Evaluator()
+            )
+    return score_sheet
+
+
+@pytest.mark.parametrize('file_format', sorted(FORMATS))
+def test_round_trip(file_format):
+    """
+    Check that a score sheet is unchanged by writing and reading it.
+    """
+    score_sheet = _create_score_sheet()
+    data = FORMATS[file_format].dumps(score_sheet)
+    res = loads_score_sheet(data)
+    assert res.create_table() == score_sheet.create_table()
+    if file_format != 'npz':
+        # the npz format converts the values to floats
+        expected = json.dumps(score_sheet, default=encode)
+        assert json.dumps(res, default=encode) == expected
+
+
+def test_migration(tmpdir):
+    """
+    Check that a file in the format of earlier versions is read, and
+    converted when it is saved again.
+    """
+    save_file = tmpdir.join('scores')
+    score_sheet = _create_score_sheet()
+    save_file.write(json.dumps(score_sheet, default=encode))
+    store = JsonStore(str(save_file))
+    loaded_sheet = store.load()
+    assert loaded_sheet.create_table() == score_sheet.create_table()
+    store.save(loaded_sheet)
+    assert json.loads(save_file.read())['format'] == 'columnar'
+    assert JsonStore(str(save_file)
+                     ).load().create_table() == score_sheet.create_table()
+
+
+@pytest.mark.parametrize('file_format', sorted(FORMATS))
+def test_non_numeric(file_format):
+    """
+    Check that scores which are not numbers are kept by all formats.
+    """
+    score_sheet = ScoreSheet()
+    for value in ['abc', 'def']:
+        score_sheet.rotate()
+        score_sheet.add_score(
+            value, test_name='mod/test_a', tag='', evaluator=Evaluator()
+        )
+        score_sheet.add_score(
+            1.5, test_name='mod/test_a', tag='num', evaluator=Evaluator()
+        )
+    res = loads_score_sheet(FORMATS[file_format].dumps(score_sheet))
+    assert res.create_table() == score_sheet.create_table()
+
+
+def test_npz_non_numeric_session(testdir):
+    """
+    Check that a string score can be recorded in several sessions with the
+    npz format.
+    """
+    testdir.makepyfile(
+        """
+        def test_string(score):
+            score('abc')
+        """
+    )
+    for _ in range(2):
+        result = testdir.runpytest('--score-format', 'npz')
+        result.assert_outcomes(passed=1)
+    assert not testdir.tmpdir.listdir('.pytest-score.checkpoint.*')
+    score_sheet = loads_score_sheet(
+        testdir.tmpdir.join('.pytest-score').read_binary()
+    )
+    _, table, _ = score_sheet.create_table()
+    assert table == [
+        ('test_npz_non_numeric_session/test_string:', 'abc', 'abc', 'abc')
+    ]
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+# © 2015-2018, ETH Zurich, Institut für Theoretische Physik
+# Author: Dominik Gresch <greschd@gmx.ch>
+"""
+Tests that the plugin does not import heavy modules in pytest runs which do
+not record any scores.
+"""
+
+import sys
+import subprocess
+
+HEAVY_MODULES = ['numpy', 'jinja2', 'sqlite3']
+
+
+def _get_imported_modules(args):
+    """
+    Run Python with the given arguments, and return the names of the modules
+    imported according to ``-X importtime``.
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime'] + args,
+                            stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE,
+                            universal_newlines=True,
+                            check=True)
+    return {
+        line.split('|')[-1].strip()
+        for line in result.stderr.splitlines()
+        if line.startswith('import time:')
+    }
+
+
+def test_import_time():
+    """
+    Check that importing the plugin does not import heavy modules.
+    """
+    imported = _get_imported_modules(['-c', 'import pytest_score'])
+    assert 'pytest_score' in imported
+    assert imported.isdisjoint(HEAVY_MODULES)
+
+
+def test_unscored_run(testdir):
+    """
+    Check that a pytest run without scores does not import heavy modules.
+    """
+    testdir.makepyfile(
+        """
+        def test_nothing():
+            pass
+        """
+    )
+    imported = _get_imported_modules([
+        '-m', 'pytest', '-p', 'no:cacheprovider',
+        str(testdir.tmpdir)
+    ])
+    assert 'pytest_score._plugin' in imported
+    assert imported.isdisjoint(HEAVY_MODULES)
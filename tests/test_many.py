@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+# © 2015-2018, ETH Zurich, Institut für Theoretische Physik
+# Author: Dominik Gresch <greschd@gmx.ch>
+"""
+Tests for recording a batch of scores with ``score.many``.
+"""
+
+import sqlite3
+
+import pytest
+
+from pytest_score._score import ScoreSheet, Evaluator
+from pytest_score._compact import CompactScoreSheet
+from pytest_score._store import JsonStore, store_score
+from pytest_score._sqlite import SQLiteStore
+
+
+@pytest.mark.parametrize('sheet_class', [ScoreSheet, CompactScoreSheet])
+def test_add_many(sheet_class):
+    """
+    Check that adding a batch of scores is equivalent to adding them one by
+    one.
+    """
+    evaluator = Evaluator(less_is_better=True)
+    values = {'tag_{}'.format(idx): float(idx) for idx in range(10)}
+    batch_sheet = sheet_class()
+    single_sheet = sheet_class()
+    for _ in range(2):
+        batch_sheet.rotate()
+        batch_sheet.add_many(
+            values.values(),
+            test_name='test',
+            tags=values.keys(),
+            evaluator=evaluator
+        )
+        single_sheet.rotate()
+        for tag, value in values.items():
+            single_sheet.add_score(
+                value, test_name='test', tag=tag, evaluator=evaluator
+            )
+    assert batch_sheet.create_table() == single_sheet.create_table()
+
+
+def test_score_many(testdir):
+    """
+    Check that ``score.many`` records mappings and arrays, and reports all
+    tags which do not meet the cutoff in a single assertion.
+    """
+    testdir.makepyfile(
+        """
+        import numpy as np
+
+        def test_mapping(score):
+            assert score.many({'a': 1., 'b': 2.}) == [1., 2.]
+
+        def test_array(score):
+            score.many(np.arange(3.), tags=['x', 'y', 'z'], cutoff=0.)
+
+        def test_cutoff(score):
+            score.many(np.arange(4.), tags=list('abcd'), cutoff=1.5)
+        """
+    )
+    result = testdir.runpytest()
+    result.assert_outcomes(passed=2, failed=1)
+    result.stdout.fnmatch_lines([
+        '*2 scores do not meet the cutoff: a=0.0, b=1.0*'
+    ])
+    score_sheet = JsonStore(str(testdir.tmpdir.join('.pytest-score'))).load()
+    _, table, _ = score_sheet.create_table()
+    assert len(table) == 9
+
+
+def test_many_sqlite_concurrent(tmpdir):
+    """
+    Check that batches which two concurrent sessions record for the same
+    tags in an SQLite database are both kept.
+    """
+    save_file = str(tmpdir.join('scores'))
+    evaluator = Evaluator(less_is_better=True)
+    tags = ['tag_{}'.format(idx) for idx in range(100)]
+    with store_score(SQLiteStore(save_file), wipe_scores=False) as first_sheet:
+        with store_score(
+            SQLiteStore(save_file), wipe_scores=False
+        ) as second_sheet:
+            for score_sheet, value in [(first_sheet, 1.), (second_sheet, 2.)]:
+                values = [value] * len(tags)
+                score_sheet.rotate()
+                score_sheet.add_many(
+                    values, test_name='test', tags=tags, evaluator=evaluator
+                )
+    _, table, _ = SQLiteStore(save_file).load().create_table()
+    assert len(table) == len(tags)
+    assert all(row[1:3] == (1., 2.) for row in table)
+    connection = sqlite3.connect(save_file + '.sqlite')
+    query = 'SELECT COUNT(*) FROM scores'
+    assert connection.execute(query).fetchone() == (2 * len(tags), )
+
+
+def test_many_confirm_non_numeric(testdir):
+    """
+    Check that a test which records a batch of scores that are not numbers
+    can be re-run to confirm a regression.
+    """
+    testdir.makepyfile(
+        """
+        def test_many(score):
+            score(1., less_is_better=True)
+            score.many({'a': 'first', 'b': 'first'})
+        """
+    )
+    testdir.runpytest().assert_outcomes(passed=1)
+
+    testdir.makepyfile(
+        """
+        def test_many(score):
+            score(2., less_is_better=True)
+            score.many({'a': 'second', 'b': 'second'})
+        """
+    )
+    result = testdir.runpytest('--score-confirm-regressions', '2')
+    result.assert_outcomes(passed=1)
+    score_sheet = JsonStore(str(testdir.tmpdir.join('.pytest-score'))).load()
+    results = {
+        tag: score_result.current
+        for _, tag, score_result in score_sheet.new_scores()
+    }
+    assert results == {'': 2., 'a': 'second', 'b': 'second'}
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+# © 2015-2018, ETH Zurich, Institut für Theoretische Physik
+# Author: Dominik Gresch <greschd@gmx.ch>
+"""
+Tests for the score report and reporters.
+"""
+
+from pytest_score._score import ScoreSheet, Evaluator, ScoreStates
+from pytest_score._report import ScoreReport
+
+
+def test_report_hook(testdir):
+    """
+    Check that the score report is passed to plugins implementing the
+    ``pytest_score_report`` hook, and that the terminal report is filtered.
+    """
+    testdir.makeconftest(
+        """
+        def pytest_score_report(session, report):
+            print('ROWS:', ','.join(row.name for row in report.rows))
+        """
+    )
+    for offset in [0, 1]:
+        testdir.makepyfile(
+            """
+            def test_values(score):
+                score({}, tag='a')
+                score({}, tag='b')
+            """.format(2 - offset, 2 + offset)
+        )
+        result = testdir.runpytest('-s', '--score-report=worse')
+        result.assert_outcomes(passed=1)
+    result.stdout.fnmatch_lines([
+        '*test_values:a*1*2*2*',
+        '1 of 2 scores shown.',
+        '*ROWS: test_report_hook/test_values:a,test_report_hook/test_values:b',
+    ])
+
+
+def test_filter_rows():
+    """
+    Check the filtering of the report rows.
+    """
+    score_sheet = ScoreSheet()
+    values = {'same': (1, 1), 'better': (1, 3), 'worse': (2, 1), 'new': (0, )}
+    for run in range(2):
+        score_sheet.rotate()
+        for tag, tag_values in values.items():
+            if run < len(tag_values):
+                score_sheet.add_score(
+                    tag_values[run],
+                    test_name='test',
+                    tag=tag,
+                    evaluator=Evaluator()
+                )
+    report = ScoreReport.from_score_sheet(score_sheet)
+    assert [row.state for row in report.filter_rows(mode='changed')] == [
+        ScoreStates.BETTER, ScoreStates.WORSE
+    ]
+    assert [row.name for row in report.filter_rows(top=3)] == [
+        'test:worse', 'test:better', 'test:same'
+    ]
+    assert report.widths == [11, 7, 4, 4]
+
+
+def test_html_pages(testdir):
+    """
+    Check that the HTML report has one page per module, and that unchanged
+    pages are not re-written.
+    """
+    testdir.makepyfile(
+        test_a="""
+        def test_a(score):
+            score(1)
+        """,
+        test_b="""
+        def test_b(score):
+            score(2)
+        """
+    )
+    html_dir = testdir.tmpdir.join('htmlscore')
+    for _ in range(2):
+        testdir.runpytest().assert_outcomes(passed=2)
+    assert 'module_test_a.html' in html_dir.join('index.html').read()
+    html_dir.join('module_test_a.html').write('unchanged', mode='a')
+    testdir.runpytest().assert_outcomes(passed=2)
+    assert html_dir.join('module_test_a.html').read().endswith('unchanged')
+    assert 'test_b/test_b' in html_dir.join('module_test_b.html').read()
+
+
+def test_html_stale_pages(testdir):
+    """
+    Check that the pages of modules which are no longer in the report are
+    removed, while other files are kept.
+    """
+    testdir.makepyfile(
+        test_a="""
+        def test_a(score):
+            score(1)
+        """,
+        test_b="""
+        def test_b(score):
+            score(2)
+        """
+    )
+    html_dir = testdir.tmpdir.join('htmlscore')
+    testdir.runpytest().assert_outcomes(passed=2)
+    assert html_dir.join('module_test_b.html').check()
+    html_dir.join('notes.html').write('notes')
+    testdir.tmpdir.join('test_b.py').remove()
+    testdir.runpytest('--wipe-scores').assert_outcomes(passed=1)
+    assert html_dir.join('module_test_a.html').check()
+    assert not html_dir.join('module_test_b.html').check()
+    assert html_dir.join('notes.html').check()
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+# © 2015-2018, ETH Zurich, Institut für Theoretische Physik
+# Author: Dominik Gresch <greschd@gmx.ch>
+"""
+Tests for the automatic scoring of the durations and memory of the tests.
+"""
+
+import pytest
+
+from pytest_score._store import JsonStore
+
+
+@pytest.mark.parametrize(
+    'option, tags', [('--score-durations', ['@cpu_time', '@duration']),
+                     ('--score-memory', ['@memory'])]
+)
+def test_resource_scores(testdir, option, tags):
+    """
+    Check that the durations or the peak memory of the passing tests are
+    recorded without using the ``score`` fixture.
+    """
+    testdir.makepyfile(
+        """
+        import pytest
+
+        def test_allocate():
+            data = list(range(100000))
+            assert len(data) == 100000
+
+        def test_score(score):
+            score(1.)
+
+        def test_fail():
+            assert False
+
+        def test_reserved(score):
+            with pytest.raises(ValueError):
+                score(1., tag='@duration')
+        """
+    )
+    result = testdir.runpytest(option)
+    result.assert_outcomes(passed=3, failed=1)
+    score_sheet = JsonStore(str(testdir.tmpdir.join('.pytest-score'))).load()
+    results = {
+        test_name.split('/')[1] + ':' + tag: score_result
+        for test_name, tag, score_result in score_sheet.new_scores()
+    }
+    assert sorted(results) == sorted(['test_score:'] + [
+        test + ':' + tag
+        for test in ['test_allocate', 'test_reserved', 'test_score']
+        for tag in tags
+    ])
+    for tag in tags:
+        assert results['test_allocate:' + tag].evaluator.less_is_better
+    if '@memory' in tags:
+        assert results['test_allocate:@memory'].current > 100000
+
+
+def test_durations_and_memory(testdir):
+    """
+    Check that the durations and the memory cannot be recorded in the same
+    session.
+    """
+    testdir.makepyfile(
+        """
+        def test_nothing():
+            pass
+        """
+    )
+    result = testdir.runpytest('--score-durations', '--score-memory')
+    result.stderr.fnmatch_lines(['*cannot be used together*'])
+    assert result.ret == pytest.ExitCode.USAGE_ERROR
+
+
+@pytest.mark.parametrize('option', ['--score-durations', '--score-memory'])
+def test_doctest_resources(testdir, option):
+    """
+    Check that doctests are not scored, and do not fail.
+    """
+    testdir.makepyfile(
+        '''
+        def add(a, b):
+            """
+            >>> add(1, 2)
+            3
+            """
+            return a + b
+        '''
+    )
+    result = testdir.runpytest('--doctest-modules', option)
+    result.assert_outcomes(passed=1)
+
+
+@pytest.mark.parametrize('store', ['json', 'sqlite'])
+def test_score_order(testdir, store):
+    """
+    Check that the tests are ordered by their recorded durations, or with
+    the tests which regressed first.
+    """
+    code = """
+        import time
+
+        def test_fast():
+            pass
+
+        def test_regress(score):
+            score({})
+
+        def test_slow():
+            time.sleep(0.1)
+        """
+    testdir.makepyfile(code.format(1.))
+    result = testdir.runpytest('--score-store', store, '--score-durations')
+    result.assert_outcomes(passed=3)
+
+    testdir.makepyfile(code.format(0.))
+    result = testdir.runpytest(
+        '--score-store', store, '--score-order', 'duration', '-v'
+    )
+    result.assert_outcomes(passed=3)
+    result.stdout.fnmatch_lines([
+        '*::test_slow PASSED*', '*::test_fast PASSED*'
+    ])
+    result.stdout.fnmatch_lines([
+        '*::test_slow PASSED*', '*::test_regress PASSED*'
+    ])
+
+    result = testdir.runpytest(
+        '--score-store', store, '--score-order', 'regressed', '-v'
+    )
+    result.assert_outcomes(passed=3)
+    result.stdout.fnmatch_lines([
+        '*::test_regress PASSED*', '*::test_fast PASSED*',
+        '*::test_slow PASSED*'
+    ])
@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+
+# © 2015-2018, ETH Zurich, Institut für Theoretische Physik
+# Author: Dominik Gresch <greschd@gmx.ch>
+"""
+Tests for the ScoreSheet container.
+"""
+
+import random
+import itertools
+import statistics
+
+import pytest
+
+from pytest_score._score import ScoreSheet, Evaluator, ScoreStates
+from pytest_score._compact import CompactScoreSheet
+from pytest_score._batch import evaluate_states, to_float_array
+from pytest_score._stats import SampleStats
+from pytest_score._formats import to_columns
+
+
+def test_lazy_rotation():
+    """
+    Check that runs in which a test is not scored do not evict its history.
+    """
+    score_sheet = ScoreSheet(history_length=2)
+    for value in [1, 2]:
+        score_sheet.rotate()
+        score_sheet.add_score(
+            value, test_name='test', tag='', evaluator=Evaluator()
+        )
+    for _ in range(3):
+        score_sheet.rotate()
+        _, table, _ = score_sheet.create_table()
+        assert table == [('test:', None, 2, 2)]
+    score_sheet.add_score(3, test_name='test', tag='', evaluator=Evaluator())
+    _, table, _ = score_sheet.create_table()
+    assert table == [('test:', 3, 2, 2)]
+    score_sheet.rotate()
+    score_sheet.add_score(0, test_name='test', tag='', evaluator=Evaluator())
+    assert list(score_sheet.new_scores())[0][2].to_dict()['history'] == [3, 2]
+
+
+def test_compact_score_sheet():
+    """
+    Check that the CompactScoreSheet gives the same results as the
+    ScoreSheet.
+    """
+    score_sheet = ScoreSheet(history_length=3)
+    compact_sheet = CompactScoreSheet(history_length=3, capacity=1)
+    for run in range(6):
+        for sheet in [score_sheet, compact_sheet]:
+            sheet.rotate()
+            for i in range(run % 4):
+                sheet.add_score(
+                    float(run * i),
+                    test_name='test{}'.format(i),
+                    tag='tag',
+                    evaluator=Evaluator(less_is_better=bool(i % 2))
+                )
+        assert compact_sheet.create_table() == score_sheet.create_table()
+        assert _get_new_scores(compact_sheet) == _get_new_scores(score_sheet)
+    converted_sheet = CompactScoreSheet.from_sheet(score_sheet)
+    assert converted_sheet.create_table() == score_sheet.create_table()
+
+
+def test_compact_non_numeric():
+    """
+    Check that the CompactScoreSheet keeps scores which are not numbers, also
+    when the history wraps around and when it is converted to arrays.
+    """
+    score_sheet = ScoreSheet(history_length=2)
+    compact_sheet = CompactScoreSheet(history_length=2, capacity=1)
+    for run, value in enumerate([1., None, 3., 2., 0.]):
+        for sheet in [score_sheet, compact_sheet]:
+            sheet.rotate()
+            if value is not None:
+                sheet.add_score(
+                    value,
+                    test_name='test',
+                    tag='number',
+                    evaluator=Evaluator()
+                )
+            sheet.add_score(
+                'run{}'.format(run),
+                test_name='test',
+                tag='string',
+                evaluator=Evaluator()
+            )
+        assert compact_sheet.create_table() == score_sheet.create_table()
+        assert _get_new_scores(compact_sheet) == _get_new_scores(score_sheet)
+    converted_sheet = CompactScoreSheet.from_arrays(
+        **compact_sheet.to_arrays()
+    )
+    assert converted_sheet.create_table() == score_sheet.create_table()
+
+
+def _get_new_scores(score_sheet):
+    return [(test_name, tag, score_result.current)
+            for test_name, tag, score_result in score_sheet.new_scores()]
+
+
+def test_evaluate_states():
+    """
+    Check that the batch evaluation of the states matches the Evaluator.
+    """
+    values = [None, 1, 2, 2.5]
+    current, best, less_is_better = zip(
+        *itertools.product(values, values, [True, False])
+    )
+    expected = [
+        Evaluator(less_is_better=lib).get_state(current=cur, best=bst)
+        for cur, bst, lib in zip(current, best, less_is_better)
+    ]
+    assert evaluate_states(
+        current=to_float_array(current),
+        best=to_float_array(best),
+        less_is_better=less_is_better
+    ) == expected
+
+
+def test_sample_stats():
+    """
+    Check the streaming statistics against the statistics module.
+    """
+    rand = random.Random(0)
+    values = [rand.gauss(1., 2.) for _ in range(50)]
+    stats = SampleStats(reservoir_size=100)
+    for value in values:
+        stats.add(value)
+    assert stats.count == 50
+    assert stats.mean == pytest.approx(statistics.mean(values))
+    assert stats.variance == pytest.approx(statistics.variance(values))
+    assert stats.get('median') == pytest.approx(statistics.median(values))
+    assert stats.get('min') == min(values)
+
+    small_stats = SampleStats(reservoir_size=10)
+    for value in values:
+        small_stats.add(value)
+    assert len(small_stats.reservoir) == 10
+    assert small_stats.mean == pytest.approx(stats.mean)
+
+
+@pytest.mark.parametrize('sheet_class', [ScoreSheet, CompactScoreSheet])
+def test_multiple_samples(sheet_class):
+    """
+    Check that a score can be sampled several times in a run, and that the
+    statistic of the evaluator is used as its value.
+    """
+    score_sheet = sheet_class()
+    for run_values in [[3, 1, 2], [5, 4]]:
+        score_sheet.rotate()
+        for value in run_values:
+            score_sheet.add_score(
+                value,
+                test_name='test',
+                tag='',
+                evaluator=Evaluator(less_is_better=True, statistic='min')
+            )
+    _, table, _ = score_sheet.create_table()
+    assert table == [('test:', 4, 1, 1)]
+    score_result, = [res for _, _, res in score_sheet.new_scores()]
+    assert score_result.samples.count == 2
+
+    with pytest.raises(ValueError):
+        Evaluator(statistic='average')
+
+
+@pytest.mark.parametrize('sheet_class', [ScoreSheet, CompactScoreSheet])
+def test_single_sample(sheet_class):
+    """
+    Check that no sample statistics are created or stored for a score which
+    is recorded once.
+    """
+    score_sheet = sheet_class()
+    score_sheet.rotate()
+    score_sheet.add_score(3.1, test_name='test', tag='', evaluator=Evaluator())
+    score_result, = [res for _, _, res in score_sheet.new_scores()]
+    assert score_result.current == 3.1
+    assert score_result.samples is None
+    assert 'samples' not in to_columns(score_sheet)
+
+    score_result.samples = SampleStats()
+    score_result.samples.add(3.1)
+    assert 'samples' not in score_result.to_dict()
+
+
+@pytest.mark.parametrize('sheet_class', [ScoreSheet, CompactScoreSheet])
+def test_noise_states(sheet_class):
+    """
+    Check that changes within the noise of the history are not reported as
+    better or worse by a noise-aware evaluator.
+    """
+    evaluator = Evaluator(less_is_better=True, significance=0.05)
+    score_sheet = sheet_class()
+    for value in [1.0, 1.2, 0.9, 1.1]:
+        score_sheet.rotate()
+        for test_name in ['test_a', 'test_b', 'test_c']:
+            score_sheet.add_score(
+                value, test_name=test_name, tag='', evaluator=evaluator
+            )
+    score_sheet.rotate()
+    for test_name, value in [('test_a', 1.05), ('test_b', 2.), ('test_c', 0.)]:
+        score_result = score_sheet.add_score(
+            value, test_name=test_name, tag='', evaluator=evaluator
+        )
+    _, _, states = score_sheet.create_table()
+    assert states == [ScoreStates.NOISE, ScoreStates.WORSE, ScoreStates.BETTER]
+    assert score_result.get_state() == ScoreStates.BETTER
+
+    with pytest.raises(ValueError):
+        Evaluator(significance=1.5)
+
+
+@pytest.mark.parametrize('sheet_class', [ScoreSheet, CompactScoreSheet])
+def test_relative_cutoff(sheet_class):
+    """
+    Check that the relative cutoffs are evaluated against the history.
+    """
+    evaluators = {
+        'median':
+        Evaluator(
+            less_is_better=True,
+            relative_cutoff=0.05,
+            cutoff_reference='median'
+        ),
+        'best':
+        Evaluator(relative_cutoff=0.1),
+    }
+    values = {'median': [1.0, 1.04, 0.98, 1.04], 'best': [1.0, 1.2, 1.1, 1.09]}
+    score_sheet = sheet_class()
+    for run_values in zip(*values.values()):
+        score_sheet.rotate()
+        for test_name, value in zip(values.keys(), run_values):
+            score_sheet.add_score(
+                value,
+                test_name=test_name,
+                tag='',
+                evaluator=evaluators[test_name]
+            )
+    score_sheet.rotate()
+    with pytest.raises(AssertionError):
+        score_sheet.add_score(
+            1.1, test_name='median', tag='', evaluator=evaluators['median']
+        )
+    with pytest.raises(AssertionError):
+        score_sheet.add_score(
+            1.07, test_name='best', tag='', evaluator=evaluators['best']
+        )
+
+    for evaluator in evaluators.values():
+        assert Evaluator.from_dict(evaluator.to_dict()) == evaluator
+    with pytest.raises(ValueError):
+        Evaluator(relative_cutoff=0.1, cutoff_reference='worst')
@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+
+# © 2015-2018, ETH Zurich, Institut für Theoretische Physik
+# Author: Dominik Gresch <greschd@gmx.ch>
+"""
+Tests for the stores which save the score sheet between sessions.
+"""
+
+import os
+import stat
+import sqlite3
+
+import pytest
+
+from pytest_score._score import Evaluator
+from pytest_score._store import JsonStore, JournalStore, ShardedStore, store_score
+from pytest_score._sqlite import SQLiteStore
+from pytest_score._locking import get_umask
+from pytest_score._mmap import MmapStore, MmapScores, open_mmap_scores
+
+
+def _run_session(store, values):
+    """
+    Simulate a session which records the given values.
+    """
+    with store_score(store, wipe_scores=False) as score_sheet:
+        score_sheet.rotate()
+        for tag, value in values.items():
+            score_sheet.add_score(
+                value, test_name='test', tag=tag, evaluator=Evaluator()
+            )
+
+
+def test_journal_store(tmpdir):
+    """
+    Check that the journal store gives the same result as the JSON store.
+    """
+    json_file = str(tmpdir.join('json'))
+    journal_file = str(tmpdir.join('journal'))
+    for values in [{'a': 1, 'b': 2}, {'a': 3}, {'b': 1, 'c': 0.5}]:
+        _run_session(JsonStore(json_file), values)
+        _run_session(JournalStore(journal_file), values)
+    assert not os.path.exists(journal_file)
+    json_table = JsonStore(json_file).load().create_table()
+    journal_table = JournalStore(journal_file).load().create_table()
+    assert json_table == journal_table
+
+
+def test_journal_compaction(tmpdir):
+    """
+    Check that the journal is compacted into the snapshot.
+    """
+    save_file = str(tmpdir.join('journal'))
+    for i in range(5):
+        _run_session(JournalStore(save_file, max_journal_length=4), {'a': i})
+    assert os.path.exists(save_file)
+    _, table, _ = JournalStore(save_file).load().create_table()
+    assert table == [('test:a', 4, 3, 3)]
+
+
+def test_journal_partial_record(tmpdir):
+    """
+    Check that a partially written record at the end of the journal does not
+    swallow the records of the next session.
+    """
+    save_file = str(tmpdir.join('journal'))
+    for i in range(4):
+        if i == 2:
+            with open(save_file + '.journal', 'a') as out_file:
+                out_file.write('{"type": "sco')
+        _run_session(JournalStore(save_file), {'a': i})
+    journal_sheet = JournalStore(save_file).load()
+    assert journal_sheet.run == 4
+    journal_result = journal_sheet.to_dict()['scores']['test']['a'].to_dict()
+    assert journal_result['current'] == 3
+    assert journal_result['history'] == [2, 1, 0]
+
+
+def test_sqlite_store(tmpdir):
+    """
+    Check that the SQLite store gives the same result as the JSON store,
+    and keeps the full history.
+    """
+    json_file = str(tmpdir.join('json'))
+    sqlite_file = str(tmpdir.join('sqlite'))
+    sessions = [{'a': 1, 'b': 2}, {'a': 3}, {'b': 1, 'c': 0.5}]
+    for values in sessions * 3:
+        _run_session(JsonStore(json_file), values)
+        _run_session(SQLiteStore(sqlite_file), values)
+    json_table = JsonStore(json_file).load().create_table()
+    sqlite_table = SQLiteStore(sqlite_file).load().create_table()
+    assert json_table == sqlite_table
+    connection = sqlite3.connect(sqlite_file + '.sqlite')
+    query = "SELECT COUNT(*) FROM scores WHERE tag = 'a'"
+    assert connection.execute(query).fetchone() == (6, )
+
+
+def test_sharded_store(tmpdir):
+    """
+    Check that the sharded store only loads and writes the shards of the
+    given modules, without losing the history of the other modules.
+    """
+    save_file = str(tmpdir.join('sharded'))
+    json_file = str(tmpdir.join('json'))
+    sessions = [
+        ({'mod_a', 'mod_b'}, {
+            'mod_a/test': 1,
+            'mod_b/test': 2
+        }),
+        ({'mod_a'}, {
+            'mod_a/test': 3
+        }),
+        ({'mod_b'}, {
+            'mod_b/test': 1
+        }),
+        (set(), {
+            'mod_b/test': 4
+        }),
+    ]
+    for module_names, values in sessions:
+        for store in [ShardedStore(save_file), JsonStore(json_file)]:
+            with store_score(
+                store, wipe_scores=False, module_names=module_names
+            ) as score_sheet:
+                loaded_modules = {
+                    test_name.split('/')[0]
+                    for test_name in score_sheet.to_dict()['scores']
+                }
+                if isinstance(store, ShardedStore):
+                    assert loaded_modules <= module_names
+                score_sheet.rotate()
+                for test_name, value in values.items():
+                    score_sheet.add_score(
+                        value,
+                        test_name=test_name,
+                        tag='',
+                        evaluator=Evaluator()
+                    )
+    sharded_table = ShardedStore(save_file).load().create_table()
+    json_table = JsonStore(json_file).load().create_table()
+    assert sorted(sharded_table[1]) == sorted(json_table[1])
+    manifest = ShardedStore(save_file).read_manifest()
+    assert manifest['run'] == 4
+    assert manifest['modules']['mod_a']['num_scores'] == 1
+
+
+@pytest.mark.parametrize(
+    'store_class', [JsonStore, JournalStore, ShardedStore]
+)
+def test_concurrent_sessions(tmpdir, store_class):
+    """
+    Check that the scores of two sessions which use the same file at the
+    same time are both kept.
+    """
+    save_file = str(tmpdir.join('scores'))
+    _run_session(store_class(save_file), {'a': 1})
+    first_store = store_class(save_file)
+    second_store = store_class(save_file)
+    with store_score(first_store, wipe_scores=False) as first_sheet:
+        with store_score(second_store, wipe_scores=False) as second_sheet:
+            first_sheet.rotate()
+            second_sheet.rotate()
+            first_sheet.add_score(
+                2, test_name='test', tag='a', evaluator=Evaluator()
+            )
+            second_sheet.add_score(
+                3, test_name='test', tag='b', evaluator=Evaluator()
+            )
+    _, table, _ = store_class(save_file).load().create_table()
+    # the session which saves last is merged as a new run
+    assert table == [('test:a', 2, 1, 1), ('test:b', None, 3, 3)]
+
+
+def test_sqlite_batched_load(tmpdir):
+    """
+    Check that the SQLite score sheet loads all score results with a fixed
+    number of queries, and closes the connection when it is saved.
+    """
+    save_file = str(tmpdir.join('sqlite'))
+    values = {str(i): i for i in range(20)}
+    for _ in range(3):
+        _run_session(SQLiteStore(save_file), values)
+    store = SQLiteStore(save_file)
+    score_sheet = store.load()
+    statements = []
+    score_sheet._connection.set_trace_callback(statements.append)  # pylint: disable=protected-access
+    _, table, _ = score_sheet.create_table()
+    assert len(table) == 20
+    assert len(statements) == 3
+    store.save(score_sheet)
+    assert score_sheet.create_table()[1] == table
+    with pytest.raises(sqlite3.ProgrammingError):
+        score_sheet._connection.execute('SELECT 1')  # pylint: disable=protected-access
+
+
+def test_sqlite_concurrent_sessions(tmpdir):
+    """
+    Check that two SQLite sessions which use the same database at the same
+    time are stored as separate runs, even if they record the same tag.
+    """
+    save_file = str(tmpdir.join('sqlite'))
+    _run_session(SQLiteStore(save_file), {'a': 1})
+    with store_score(SQLiteStore(save_file), wipe_scores=False) as first_sheet:
+        with store_score(
+            SQLiteStore(save_file), wipe_scores=False
+        ) as second_sheet:
+            for score_sheet, value in [(first_sheet, 2), (second_sheet, 3)]:
+                score_sheet.rotate()
+                score_sheet.add_score(
+                    value, test_name='test', tag='a', evaluator=Evaluator()
+                )
+    _, table, _ = SQLiteStore(save_file).load().create_table()
+    assert table == [('test:a', 2, 3, 3)]
+    connection = sqlite3.connect(save_file + '.sqlite')
+    query = 'SELECT run_id, value FROM scores ORDER BY run_id'
+    assert connection.execute(query).fetchall() == [(1, 1), (2, 3), (3, 2)]
+
+
+def test_file_mode(tmpdir):
+    """
+    Check that the score file gets the default permissions, and keeps the
+    permissions of the file it replaces.
+    """
+    save_file = str(tmpdir.join('json'))
+    umask = os.umask(0o027)
+    get_umask.cache_clear()
+    try:
+        assert get_umask() == 0o027
+        _run_session(JsonStore(save_file), {'a': 1})
+        assert stat.S_IMODE(os.stat(save_file).st_mode) == 0o640
+        os.chmod(save_file, 0o600)
+        _run_session(JsonStore(save_file), {'a': 2})
+        assert stat.S_IMODE(os.stat(save_file).st_mode) == 0o600
+    finally:
+        os.umask(umask)
+        get_umask.cache_clear()
+
+
+def test_corrupt_file(tmpdir):
+    """
+    Check that a corrupt score file is moved aside with a warning.
+    """
+    save_file = tmpdir.join('scores')
+    save_file.write('{"scores": ')
+    with pytest.warns(UserWarning, match='Could not read'):
+        score_sheet = JsonStore(str(save_file)).load()
+    assert score_sheet.create_table()[1] == []
+    assert tmpdir.join('scores.corrupt').read() == '{"scores": '
+
+
+def test_mmap_store(tmpdir):
+    """
+    Check that the memory-mapped store gives the same result as the JSON
+    store, and that it can be read without loading the score sheet.
+    """
+    json_file = str(tmpdir.join('json'))
+    mmap_file = str(tmpdir.join('mmap'))
+    for values in [{'a': 1, 'b': 2}, {'a': 3}, {'b': 1, 'c': 0.5}]:
+        _run_session(JsonStore(json_file), values)
+        _run_session(MmapStore(mmap_file), values)
+    json_table = JsonStore(json_file).load().create_table()
+    mmap_table = MmapStore(mmap_file).load().create_table()
+    assert json_table == mmap_table
+
+    scores = open_mmap_scores(mmap_file)
+    assert len(scores) == 3
+    assert scores.keys() == [('test', 'a'), ('test', 'b'), ('test', 'c')]
+    row = scores.find('test', 'b')
+    assert scores.get_key(row) == ('test', 'b')
+    assert scores.current[row] == 1
+    assert list(scores.history[row, :1]) == [2]
+    assert not scores.current.flags.writeable
+
+
+def test_mmap_store_readers(tmpdir):
+    """
+    Check that the data of the memory-mapped store can be read by other
+    users, and that the previous data stays readable after a write.
+    """
+    mmap_file = str(tmpdir.join('mmap'))
+    save_dir = tmpdir.join('mmap.mmap')
+    umask = os.umask(0o022)
+    try:
+        for value in [1, 2, 3]:
+            old_meta = MmapStore(mmap_file).read_meta()
+            _run_session(MmapStore(mmap_file), {'a': value})
+    finally:
+        os.umask(umask)
+    meta = MmapStore(mmap_file).read_meta()
+    data_dir = str(save_dir.join(meta['data_dir']))
+    assert stat.S_IMODE(os.stat(data_dir).st_mode) == 0o755
+    assert len(save_dir.listdir('data-*')) == 2
+    old_scores = MmapScores(str(save_dir.join(old_meta['data_dir'])), old_meta)
+    assert old_scores.current[0] == 2
+    assert open_mmap_scores(mmap_file).current[0] == 3
+
+
+def test_mmap_non_numeric(tmpdir):
+    """
+    Check that the memory-mapped store keeps scores which are not numbers.
+    """
+    json_file = str(tmpdir.join('json'))
+    mmap_file = str(tmpdir.join('mmap'))
+    for values in [{'a': 'abc', 'b': 2}, {'a': 'def', 'b': 3}, {'b': 1}]:
+        _run_session(JsonStore(json_file), values)
+        _run_session(MmapStore(mmap_file), values)
+    json_table = JsonStore(json_file).load().create_table()
+    mmap_table = MmapStore(mmap_file).load().create_table()
+    assert json_table == mmap_table
+    scores = open_mmap_scores(mmap_file)
+    assert (scores.find('test', 'a'), 'current', 'def') in scores.objects
+
+
+@pytest.mark.parametrize(
+    'args', [['--score-compact'], ['--score-store', 'mmap'],
+             ['--score-store', 'mmap', '-n', '2']]
+)
+def test_non_numeric_options(testdir, args):
+    """
+    Check that tests which record scores that are not numbers pass with the
+    options which store the scores in arrays.
+    """
+    if '-n' in args:
+        pytest.importorskip('xdist')
+    testdir.makepyfile(
+        """
+        def test_string(score):
+            score('abc')
+            score(1.5, tag='number')
+        """
+    )
+    for _ in range(2):
+        testdir.runpytest(*args).assert_outcomes(passed=1)
+    result = testdir.runpytest(*args)
+    result.assert_outcomes(passed=1)
+    result.stdout.fnmatch_lines(['*test_string:*abc*abc*abc*'])
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+
+# © 2015-2018, ETH Zurich, Institut für Theoretische Physik
+# Author: Dominik Gresch <greschd@gmx.ch>
+"""
+Tests for the timing mode of the ``score`` fixture.
+"""
+
+import inspect
+import cProfile
+import itertools
+
+from pytest_score._store import JsonStore
+from pytest_score._score import MEASURED_SIGNIFICANCE
+from pytest_score._scorer import Scorer
+from pytest_score._profile import ProfileStore
+from pytest_score._stats import sample_adaptively
+from pytest_score._timing import measure_time
+
+
+def test_measure_time():
+    """
+    Check that the number of calls per round is calibrated to the round
+    duration.
+    """
+    calls = []
+    times = measure_time(
+        lambda: calls.append(None), rounds=3, warmup=2, round_duration=0.01
+    )
+    assert len(times) == 3
+    assert all(val > 0 for val in times)
+    assert len(calls) > 100
+
+
+def test_sample_adaptively():
+    """
+    Check that sampling stops once the precision is reached, or when the
+    maximum number of samples is drawn.
+    """
+    constant = sample_adaptively(
+        lambda: 1., precision=0.01, max_time=10., min_samples=3
+    )
+    assert constant == [1., 1., 1.]
+
+    counter = itertools.count()
+    alternating = sample_adaptively(
+        lambda: 1. + next(counter) % 2,
+        precision=0.1,
+        max_time=10.,
+        max_samples=200
+    )
+    assert 3 < len(alternating) < 200
+
+    noisy = sample_adaptively(
+        lambda: 1. + next(counter) % 2,
+        precision=0.,
+        max_time=10.,
+        max_samples=50
+    )
+    assert len(noisy) == 50
+
+
+def test_score_time(testdir):
+    """
+    Check that ``score.time`` records the time per call, and checks the
+    cutoff.
+    """
+    testdir.makepyfile(
+        """
+        def test_time(score):
+            value = score.time(
+                lambda: sum(range(100)), tag='sum', round_duration=0.001
+            )
+            assert value > 0
+
+        def test_precision(score):
+            score.time(
+                lambda: None, precision=0.5, max_time=1., round_duration=0.001
+            )
+
+        def test_cutoff(score):
+            score.time(lambda: None, cutoff=0., round_duration=0.001)
+        """
+    )
+    result = testdir.runpytest()
+    result.assert_outcomes(passed=2, failed=1)
+    score_sheet = JsonStore(str(testdir.tmpdir.join('.pytest-score'))).load()
+    results = {
+        test_name + ':' + tag: score_result
+        for test_name, tag, score_result in score_sheet.new_scores()
+    }
+    score_result = results['test_score_time/test_time:sum']
+    assert score_result.evaluator.less_is_better
+    assert score_result.samples.count == 5
+    score_result = results['test_score_time/test_precision:']
+    assert score_result.samples.count >= 5
+    assert score_result.precision is not None
+
+
+def test_score_profile(testdir):
+    """
+    Check that ``score.profile`` records the time of the block, and that the
+    HTML report links a slower run to the comparison of the profiles.
+    """
+    for size in [10, 100000]:
+        testdir.makepyfile(
+            """
+            def work(size):
+                return sorted(range(size), key=lambda val: -val)
+
+            def test_profile(score):
+                with score.profile(tag='work'):
+                    work({})
+            """.format(size)
+        )
+        result = testdir.runpytest()
+        result.assert_outcomes(passed=1)
+
+    htmlscore = testdir.tmpdir.join('htmlscore')
+    profile_page, = htmlscore.listdir('profile_*.html')
+    assert 'work' in profile_page.read()
+    module_page = htmlscore.join('module_test_score_profile.html')
+    assert profile_page.basename in module_page.read()
+
+
+def test_profile_pass(testdir):
+    """
+    Check that the block of ``score.profile`` is profiled in a separate
+    call of the test, which does not record any scores.
+    """
+    testdir.makepyfile(
+        """
+        CALLS = []
+
+        def test_profile(score):
+            score('text', tag='name')
+            with score.profile(tag='work'):
+                CALLS.append(sum(range(1000)))
+
+        def test_calls():
+            assert len(CALLS) == 2
+        """
+    )
+    result = testdir.runpytest()
+    result.assert_outcomes(passed=2)
+    score_sheet = JsonStore(str(testdir.tmpdir.join('.pytest-score'))).load()
+    results = {
+        tag: score_result
+        for _, tag, score_result in score_sheet.new_scores()
+    }
+    assert results['name'].current == 'text'
+    assert results['work'].samples is None
+    profiles = testdir.tmpdir.join('.pytest-score.profiles')
+    assert len(profiles.listdir('*.json.gz')) == 1
+
+
+def test_profile_retention(tmpdir):
+    """
+    Check that the profile store keeps one profile per run, for the last
+    ``max_runs`` runs.
+    """
+    profiles = ProfileStore(str(tmpdir.join('scores')), max_runs=3)
+    for run in [1, 1, 2, 3, 3, 4]:
+        profiles.add(
+            'test:tag', run=run, value=float(run), profiler=cProfile.Profile()
+        )
+    entries = profiles.load('test:tag')
+    assert [entry['run'] for entry in entries] == [4, 3, 2]
+
+
+def test_default_significance():
+    """
+    Check that the measured scores share the default significance level,
+    while the scores which are recorded directly have none.
+    """
+    for method in [Scorer.time, Scorer.sample, Scorer.profile]:
+        parameter = inspect.signature(method).parameters['significance']
+        assert parameter.default == MEASURED_SIGNIFICANCE
+    for method in [Scorer.__call__, Scorer.many]:
+        parameter = inspect.signature(method).parameters['significance']
+        assert parameter.default is None
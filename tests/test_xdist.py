@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+
+# © 2015-2018, ETH Zurich, Institut für Theoretische Physik
+# Author: Dominik Gresch <greschd@gmx.ch>
+"""
+Tests running the ``pytest-score`` plugin with pytest-xdist.
+"""
+
+import pytest
+
+from pytest_score._formats import loads_score_sheet
+
+pytest.importorskip('xdist')
+
+
+def test_xdist_merge(testdir):
+    """
+    Check that the scores of all workers end up in the score file, and that
+    their checkpoints are removed.
+    """
+    testdir.makepyfile(
+        """
+        import pytest
+
+        @pytest.mark.parametrize('value', range(8))
+        def test_parametrized(score, value):
+            score(value, tag='tag')
+        """
+    )
+    for _ in range(2):
+        result = testdir.runpytest('-n', '2', '--score-checkpoint-size', '1')
+        result.assert_outcomes(passed=8)
+        assert not testdir.tmpdir.listdir('.pytest-score.checkpoint.*')
+        assert not testdir.tmpdir.listdir('.pytest-score.session.*')
+
+    score_sheet = loads_score_sheet(
+        testdir.tmpdir.join('.pytest-score').read_binary()
+    )
+    _, table, _ = score_sheet.create_table()
+    assert len(table) == 8
+    for _, current, last, _ in table:
+        assert current == last
+
+
+def test_xdist_relative_cutoff(testdir):
+    """
+    Check that the relative cutoffs are checked against the stored scores on
+    the workers.
+    """
+    test_template = """
+        def test_relative(score):
+            score({}, less_is_better=True, relative_cutoff=0.1)
+        """
+    testdir.makepyfile(test_template.format(1.0))
+    testdir.runpytest('-n', '2').assert_outcomes(passed=1)
+    testdir.makepyfile(test_template.format(2.0))
+    testdir.runpytest('-n', '2').assert_outcomes(failed=1)
+    testdir.makepyfile(test_template.format(1.05))
+    testdir.runpytest('-n', '2').assert_outcomes(passed=1)
+
+    score_sheet = loads_score_sheet(
+        testdir.tmpdir.join('.pytest-score').read_binary()
+    )
+    _, table, _ = score_sheet.create_table()
+    assert table == [
+        ('test_xdist_relative_cutoff/test_relative:', 1.05, 2.0, 1.0)
+    ]